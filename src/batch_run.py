@@ -0,0 +1,328 @@
+# batch_run.py
+#
+# 헤드리스 일괄 실행: 화면/콘솔 없이 디스크 이미지를 부팅하고
+# 종료 조건(HLT, 특정 포트 쓰기, 특정 주소 도달) 또는 예산(명령어 수/시간)까지 실행한 뒤
+# 최종 레지스터, 지정한 메모리 범위, 성능 통계를 JSON 으로 출력한다.
+#
+#   python batch_run.py disk.img --max-instructions 1000000 --stop-addr 0000:7c10 \
+#       --dump b8000:4000 --output result.json
+#
+# 종료 코드: 0 = 종료 조건 도달, 1 = CPU 예외, 3 = 예산 소진, 2 = 잘못된 인자
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from machine import Machine
+from memory import MAX_MEMORY_SIZE
+from debugger import Debugger, parse_address
+from event_log import EventRecorder, EventReplayer
+from cpu import FLAG_IF, NO_SYNC_INSTRET
+from idle_detector import MAX_LOOP_INSTRUCTIONS, RESUME_STEPS
+from interrupt_controller import NEVER
+from metrics import MetricsRegistry, write_metrics_file
+
+EXIT_STOP_CONDITION = 0
+EXIT_CPU_ERROR = 1
+EXIT_BUDGET = 3
+
+class PortStop(Exception):
+    """감시 중인 포트에 쓰기가 일어나면 명령어 실행 직후 루프를 빠져나오기 위해 사용."""
+
+    def __init__(self, port, value):
+        super().__init__(f"write {value:X}h to port {port:04X}h")
+        self.port = port
+        self.value = value
+
+
+class BatchRunner:
+    """
+    Machine 을 종료 조건/예산까지 실행한다.
+    timer_interval 이 주어지면 그 명령어 수마다 IRQ0 를 넣는다(가상 시간, 결정적).
+    replay(EventReplayer)가 있으면 HLT 로 멈춰도 로그에 남은 IRQ 가 깨운다.
+    게스트가 유휴 루프(JMP $, 폴링 루프)에 들어가면 다음 IRQ(타이머 틱/재생할 IRQ)나
+    명령어 예산까지 루프를 바퀴 단위로 건너뛴다.
+    """
+
+    CHUNK = 1000
+
+    def __init__(self, machine, max_instructions=None, max_seconds=None, stop_on_hlt=True,
+                 stop_ports=(), stop_addrs=(), timer_interval=0, replay=None):
+        self.machine = machine
+        self.cpu = machine.cpu
+        self.dbg = Debugger(machine.cpu)
+        self.max_instructions = max_instructions
+        self.max_seconds = max_seconds
+        self.stop_on_hlt = stop_on_hlt
+        self.timer_interval = timer_interval
+        self.replay = replay
+        self.idle = machine.idle
+        self.elapsed = 0.0
+        for addr in stop_addrs:
+            self.dbg.add_breakpoint(addr)
+        for port, value in stop_ports:
+            self._watch_port(port, value)
+
+    def _watch_port(self, port, value):
+        """
+        포트의 쓰기 핸들러(8/16/32비트와 OUTS 용 블록 핸들러)를 감싸 원하는 값이 쓰이면
+        PortStop 을 던진다. 블록 쓰기는 블록을 다 넘긴 뒤 width 단위 값 중 하나라도 맞으면 멈춘다.
+        """
+        bus = self.machine.eisa
+        for table in (bus.write8_table, bus.write16_table, bus.write32_table):
+            original = table[port]
+            if original is None:
+                continue
+
+            def wrapper(p, v, original=original):
+                original(p, v)
+                if value is None or v == value:
+                    raise PortStop(p, v)
+
+            table[port] = wrapper
+
+        original_block = bus.write_block_table[port]
+        if original_block is not None:
+            def block_wrapper(p, width, data, original=original_block):
+                original(p, width, data)
+                for i in range(0, len(data), width):
+                    v = int.from_bytes(data[i:i + width], "little")
+                    if value is None or v == value:
+                        raise PortStop(p, v)
+
+            bus.write_block_table[port] = block_wrapper
+
+    def run(self):
+        """(reason, detail, exit_code) 반환"""
+        cpu = self.cpu
+        ic = self.machine.ic
+        chunk = self.CHUNK
+        next_tick = self.timer_interval or None
+        idle = False             # 지난 청크 끝에서 유휴 루프를 건너뛰었는가
+        resume = 0               # 깨운 유휴 루프로 돌아오는지 짧은 청크로 지켜볼 남은 명령어 수
+        start = time.perf_counter()
+        try:
+            while True:
+                n = chunk
+                if self.max_instructions is not None:
+                    remaining = self.max_instructions - cpu.instret
+                    if remaining <= 0:
+                        return ("instruction_budget", f"{cpu.instret} instructions", EXIT_BUDGET)
+                    n = min(n, remaining)
+                if next_tick is not None:
+                    if cpu.instret >= next_tick:
+                        ic.request_irq(0)
+                        next_tick = cpu.instret + self.timer_interval
+                        # 유휴 루프를 깨웠으면 ISR 을 마치고 루프로 돌아오는지 한 바퀴 분량씩 실행하며
+                        # 시험한다 (타이머 간격이 CHUNK 이하면 틱마다 청크가 하나뿐이라 못 찾는다)
+                        resume = RESUME_STEPS if idle else 0
+                    # 틱에 딱 맞춰 끊으면 청크 끝의 유휴 시험 실행에 쓸 명령어가 남지 않으므로
+                    # 틱 앞에 한 바퀴 분량을 남겨 두고 끊는다
+                    until_tick = next_tick - cpu.instret
+                    if until_tick > MAX_LOOP_INSTRUCTIONS:
+                        until_tick -= MAX_LOOP_INSTRUCTIONS
+                    n = max(1, min(n, until_tick))
+                if resume > 0:
+                    n = min(n, MAX_LOOP_INSTRUCTIONS)
+                    resume -= n
+
+                try:
+                    reason = self.dbg.run(n)
+                except PortStop as e:
+                    return ("port", str(e), EXIT_STOP_CONDITION)
+                except Exception as e:
+                    return ("cpu_exception", str(e), EXIT_CPU_ERROR)
+                if reason is not None:
+                    return ("address", reason, EXIT_STOP_CONDITION)
+
+                idle = False
+                if cpu.halted:
+                    if self.replay is not None and self.replay.irq_pending():
+                        continue
+                    if self.stop_on_hlt:
+                        return ("hlt", f"HLT at {cpu.CS:04X}:{cpu.EIP:04X}", EXIT_STOP_CONDITION)
+                    if ic.run_next():
+                        # 멈춰 있는 동안의 가상 시간을 다음 예약 사건(DMA 완료 등)까지 건너뛴다
+                        continue
+                    if next_tick is None or not (cpu.EFLAGS & 0x200):
+                        # 깨울 인터럽트가 없으므로 영원히 멈춰 있다
+                        return ("hlt", f"HLT with no wake-up source at {cpu.CS:04X}:{cpu.EIP:04X}",
+                                EXIT_STOP_CONDITION)
+                    # 다음 타이머 틱까지 가상 시간을 건너뛴다
+                    next_tick = cpu.instret
+                elif not self.dbg.breakpoints and self.idle.check(self._probe_limit(next_tick)):
+                    wake = []
+                    if ic.next_due != NEVER:
+                        wake.append(ic.next_due)
+                    if cpu.EFLAGS & FLAG_IF:
+                        if next_tick is not None:
+                            wake.append(next_tick)
+                        if cpu.sync_instret != NO_SYNC_INSTRET:
+                            wake.append(cpu.sync_instret)
+                    if not wake and self.max_instructions is None:
+                        return ("idle", f"idle loop with no wake-up source at {cpu.CS:04X}:{cpu.EIP:04X}",
+                                EXIT_STOP_CONDITION)
+                    if self.max_instructions is not None:
+                        wake.append(self.max_instructions)
+                    self.idle.fast_forward(min(wake))
+                    idle = True
+                    resume = 0
+
+                if self.max_seconds is not None and time.perf_counter() - start >= self.max_seconds:
+                    return ("time_budget", f"{self.max_seconds} seconds", EXIT_BUDGET)
+        finally:
+            self.elapsed = time.perf_counter() - start
+
+    def _probe_limit(self, next_tick):
+        """유휴 루프 시험 실행이 예산/다음 타이머 틱을 넘지 않게 하는 명령어 수"""
+        limit = MAX_LOOP_INSTRUCTIONS
+        if self.max_instructions is not None:
+            limit = min(limit, self.max_instructions - self.cpu.instret)
+        if next_tick is not None:
+            limit = min(limit, next_tick - self.cpu.instret)
+        return limit
+
+    def report(self, reason, detail, exit_code, dumps=()):
+        machine = self.machine
+        stats = machine.stats()
+        stats["elapsed_seconds"] = round(self.elapsed, 6)
+        # instructions 는 가상 시간(instret)이라 유휴 루프를 건너뛴 명령어도 들어 있다.
+        # 속도는 실제로 실행한 명령어로만 잰다.
+        skipped = stats["idle"]["skipped_instructions"]
+        executed = stats["instructions"] - skipped
+        stats["executed_instructions"] = executed
+        stats["skipped_instructions"] = skipped
+        stats["ips"] = round(executed / self.elapsed, 1) if self.elapsed > 0 else 0.0
+        memory = []
+        size = machine.mem.size
+        for addr, length in dumps:
+            entry = {"address": f"{addr:08X}", "length": length}
+            if addr + length > size:
+                # 명령줄은 parse_args 가 거르지만 직접 부른 경우: 메모리 안쪽만 덤프하고 표시한다
+                entry["error"] = f"range past end of memory (size {size:X}h)"
+                length = entry["length"] = max(0, min(length, size - addr))
+            entry["data"] = machine.mem.read_block(addr, length).hex() if length else ""
+            memory.append(entry)
+        return {
+            "reason": reason,
+            "detail": detail,
+            "exit_code": exit_code,
+            "registers": machine.registers(),
+            "memory": memory,
+            "stats": stats,
+        }
+
+
+def _parse_port(text):
+    """'80' 또는 '80=1' (16진수)"""
+    if "=" in text:
+        port, value = text.split("=", 1)
+        return int(port, 16) & 0xFFFF, int(value, 16)
+    return int(text, 16) & 0xFFFF, None
+
+def _parse_dump(text):
+    """'b8000:fa0' 또는 'b800:0000:fa0' (주소:길이, 16진수)"""
+    addr, length = text.rsplit(":", 1)
+    return parse_address(addr), int(length, 16)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="DOS x86 Emulator - headless batch run")
+    parser.add_argument("image", help="디스크 이미지 경로")
+    parser.add_argument("--cylinders", type=int, default=16)
+    parser.add_argument("--heads", type=int, default=16)
+    parser.add_argument("--sectors", type=int, default=63)
+    parser.add_argument("--memory", type=lambda x: int(x, 0), default=0x1000000,
+                        help="게스트 메모리 크기 (바이트, 최대 4GB)")
+    parser.add_argument("--max-instructions", type=int, default=None)
+    parser.add_argument("--max-seconds", type=float, default=None)
+    parser.add_argument("--no-stop-on-hlt", dest="stop_on_hlt", action="store_false",
+                        help="HLT 에서 멈추지 않고 인터럽트를 기다린다")
+    parser.add_argument("--stop-port", action="append", default=[], metavar="PORT[=VALUE]",
+                        help="포트(16진수)에 쓰기(값 지정 시 그 값)가 일어나면 종료")
+    parser.add_argument("--stop-addr", action="append", default=[], metavar="ADDR",
+                        help="주소(선형 또는 SEG:OFF)에 도달하면 종료")
+    parser.add_argument("--dump", action="append", default=[], metavar="ADDR:LEN",
+                        help="종료 시 덤프할 메모리 범위 (16진수)")
+    parser.add_argument("--interpreter", action="store_true",
+                        help="블록 컴파일러를 끄고 인터프리터로만 실행")
+    parser.add_argument("--code-cache", default=None, metavar="DIR",
+                        help="디코드/컴파일 결과를 DIR 에 저장해 두고 다음 실행에서 다시 쓴다")
+    parser.add_argument("--timer-interval", type=int, default=0, metavar="N",
+                        help="N 명령어마다 IRQ0 (0=타이머 없음)")
+    events = parser.add_mutually_exclusive_group()
+    events.add_argument("--record-events", default=None, metavar="PATH",
+                        help="IRQ/포트 입력/디스크 완료를 명령어 수와 함께 PATH 에 기록")
+    events.add_argument("--replay-events", default=None, metavar="PATH",
+                        help="기록한 사건을 같은 명령어 위치에 다시 넣는다 "
+                             "(--max-instructions 가 없으면 기록이 끝난 곳까지 실행)")
+    parser.add_argument("--metrics", default=None, metavar="PATH",
+                        help="종료 시 지표를 Prometheus 텍스트 형식으로 PATH 에 쓴다")
+    parser.add_argument("--output", default=None, help="JSON 출력 파일 (기본 stdout)")
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.image):
+        parser.error(f"disk image not found: {args.image}")
+    if args.replay_events and args.timer_interval:
+        parser.error("--timer-interval cannot be used with --replay-events (IRQs come from the log)")
+    if not 0 < args.memory <= MAX_MEMORY_SIZE:
+        parser.error(f"--memory must be between 1 and 0x{MAX_MEMORY_SIZE:X} bytes")
+    try:
+        args.stop_port = [_parse_port(p) for p in args.stop_port]
+        args.stop_addr = [parse_address(a) for a in args.stop_addr]
+        args.dump = [_parse_dump(d) for d in args.dump]
+    except ValueError as e:
+        parser.error(str(e))
+    for addr, length in args.dump:
+        if length < 0 or addr + length > args.memory:
+            parser.error(f"--dump {addr:X}:{length:X} is past the end of memory (--memory 0x{args.memory:X})")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    machine = Machine(args.image, cylinders=args.cylinders, heads=args.heads,
+                      sectors=args.sectors, memory_size=args.memory,
+                      compile_blocks=not args.interpreter, code_cache=args.code_cache)
+    event_log = None
+    max_instructions = args.max_instructions
+    if args.record_events:
+        event_log = EventRecorder(args.record_events)
+    elif args.replay_events:
+        event_log = EventReplayer(args.replay_events)
+        if max_instructions is None:
+            max_instructions = event_log.end_instret
+    if event_log is not None:
+        event_log.attach(machine)
+    registry = None
+    if args.metrics:
+        registry = MetricsRegistry()
+        machine.register_metrics(registry)
+    runner = BatchRunner(machine,
+                         max_instructions=max_instructions,
+                         max_seconds=args.max_seconds,
+                         stop_on_hlt=args.stop_on_hlt,
+                         stop_ports=args.stop_port,
+                         stop_addrs=args.stop_addr,
+                         timer_interval=args.timer_interval,
+                         replay=event_log if args.replay_events else None)
+    reason, detail, exit_code = runner.run()
+    machine.save_code_cache()
+    result = runner.report(reason, detail, exit_code, args.dump)
+    result["image"] = args.image
+    if registry is not None:
+        registry.sample()
+        write_metrics_file(registry, args.metrics)
+    if event_log is not None:
+        event_log.close()
+        result["events"] = event_log.stats()
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
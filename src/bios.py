@@ -1,5 +1,24 @@
+from cpu import SEG_ES
+from vga_dac import default_palette
+
 FLAG_CF = 0x00000001  # Carry flag bit for EFLAGS
 
+BIOS_SEGMENT = 0xF000
+DUMMY_IRET_OFFSET = 0xFF53     # 기본 인터럽트 핸들러 (IRET 하나)
+SERVICE_STUB_BASE = 0xE000     # INT n 서비스 스텁: F000:E000 + n*8
+
+# BIOS 데이터 영역 (0040:0000) 의 비디오 필드
+BDA_VIDEO_MODE = 0x449         # 현재 비디오 모드
+BDA_COLUMNS = 0x44A            # 텍스트 열 수 (word)
+BDA_CURSOR_POS = 0x450         # 페이지 0 커서 (열, 행)
+BDA_CURSOR_SHAPE = 0x460       # 커서 끝/시작 스캔라인
+BDA_ROWS = 0x484               # 텍스트 행 수 - 1
+
+TEXT_BASE = 0xB8000
+TEXT_COLUMNS = 80
+TEXT_ROWS = 25
+GRAPHICS_BASE = 0xA0000
+
 class BIOS:
     """
     간단한 BIOS 에뮬레이션.
@@ -8,10 +27,17 @@ class BIOS:
     여기서는 Python적으로 부트섹터 로딩 및 0xFFFF0에 JMP 명령 삽입만 시연.
     """
 
-    def __init__(self, memory, disk, bios_start=0xF0000):
+    def __init__(self, memory, disk, bios_start=0xF0000, dac=None):
         self.memory = memory
         self.disk = disk
+        self.dac = dac
         self.bios_start = bios_start
+        # 인터럽트 번호 -> 파이썬 서비스 핸들러 (CPU 의 BIOSCALL 트랩이 호출)
+        self.traps = {}
+
+    def attach(self, cpu):
+        """CPU 의 BIOSCALL 트랩이 이 BIOS 의 서비스 핸들러를 부르도록 연결."""
+        cpu.bios_traps = self.traps
 
     def load_bios(self):
         """
@@ -19,18 +45,18 @@ class BIOS:
         2) 디스크 LBA=0 부트섹터 -> 0x7C00 로드
         3) 0xFFFF0 에 JMP 0x0000:0x7C00 심어주기
         """
-        for i in range(0x400):
-            self.memory.write8(i, 0)  # IVT 초기화
+        # IVT 초기화: 모든 벡터를 기본 IRET 핸들러로 (1KB 를 한 번에 쓴다)
+        self.memory.write8(self.bios_start + DUMMY_IRET_OFFSET, 0xCF)  # IRET
+        vector = DUMMY_IRET_OFFSET.to_bytes(2, "little") + BIOS_SEGMENT.to_bytes(2, "little")
+        self.memory.write_block(0, vector * 0x100)
 
-        boot_sector = self.disk.read_sector(0)
-        for i, b in enumerate(boot_sector):
-            self.memory.write8(0x7C00 + i, b)
+        self.memory.write_block(0x7C00, self.disk.read_sector(0))
 
-        self.memory.write8(0xFFFF0, 0xEA)  # JMP ptr16:16
-        self.memory.write8(0xFFFF1, 0x00)  # IP low
-        self.memory.write8(0xFFFF2, 0x7C)  # IP high
-        self.memory.write8(0xFFFF3, 0x00)  # CS low
-        self.memory.write8(0xFFFF4, 0x00)  # CS high
+        # JMP ptr16:16 0000:7C00
+        self.memory.write_block(0xFFFF0, bytes([0xEA, 0x00, 0x7C, 0x00, 0x00]))
+
+        # 부팅 시 화면은 80x25 텍스트 모드
+        self.set_video_mode(0x03)
 
         # BIOS 기반 인터럽트 벡터도 설정
         self.setup_interrupt_vectors()
@@ -49,12 +75,18 @@ class BIOS:
     def set_interrupt_vector(self, int_num, handler):
         """
         IVT의 특정 인터럽트 번호에 대한 핸들러 주소 설정
+        벡터는 BIOS ROM 의 스텁(F000:E000 + n*8)을 가리키고, 스텁은
+          0F FF nn   BIOSCALL nn  (파이썬 handler(cpu) 호출)
+          CA 02 00   RETF 2       (서비스가 바꾼 FLAGS 를 유지한 채 복귀)
+        로 되어 있어, 게스트가 벡터를 가로챈 뒤 원래 주소로 체인해도 서비스가 불린다.
         """
+        offset = SERVICE_STUB_BASE + int_num * 8
+        stub = bytes([0x0F, 0xFF, int_num, 0xCA, 0x02, 0x00])
+        self.memory.write_block(self.bios_start + offset, stub)
+        self.traps[int_num] = handler
         vector_addr = int_num * 4
-        # 포인터를 임시로 함수 id 해시 기반 주소로 매핑
-        handler_addr = self.bios_start + (id(handler) & 0xFFFF)
-        self.memory.write16(vector_addr, handler_addr & 0xFFFF)
-        self.memory.write16(vector_addr + 2, (handler_addr >> 16) & 0xFFFF)
+        self.memory.write16(vector_addr, offset)
+        self.memory.write16(vector_addr + 2, BIOS_SEGMENT)
 
     def handle_int10(self, cpu):
         """
@@ -62,11 +94,31 @@ class BIOS:
         """
         ah = (cpu.EAX >> 8) & 0xFF
         if ah == 0x00:
-            # 모드 설정
-            mode = cpu.EAX & 0xFF
-            if mode == 0x13:
-                # 320x200 256색 모드
-                pass
+            # 모드 설정: 03h = 80x25 텍스트, 13h = 320x200 256색 (비트 7 = 화면 지우지 않음)
+            self.set_video_mode(cpu.EAX & 0xFF)
+        elif ah == 0x01:
+            # 커서 모양: CH = 시작 스캔라인, CL = 끝 스캔라인
+            self.memory.write8(BDA_CURSOR_SHAPE, cpu.ECX & 0xFF)
+            self.memory.write8(BDA_CURSOR_SHAPE + 1, (cpu.ECX >> 8) & 0xFF)
+        elif ah == 0x02:
+            # 커서 위치: DH = 행, DL = 열 (페이지 0 만)
+            self.memory.write16(BDA_CURSOR_POS, cpu.EDX & 0xFFFF)
+        elif ah == 0x03:
+            # 커서 위치/모양 읽기
+            cpu.EDX = (cpu.EDX & 0xFFFF0000) | self.memory.read16(BDA_CURSOR_POS)
+            cpu.ECX = (cpu.ECX & 0xFFFF0000) | ((self.memory.read8(BDA_CURSOR_SHAPE + 1) << 8)
+                                                | self.memory.read8(BDA_CURSOR_SHAPE))
+        elif ah == 0x0E:
+            # 텔레타이프 출력
+            self.teletype(cpu.EAX & 0xFF)
+        elif ah == 0x0F:
+            # 현재 모드: AL = 모드, AH = 열 수, BH = 페이지
+            mode = self.memory.read8(BDA_VIDEO_MODE)
+            cols = self.memory.read16(BDA_COLUMNS)
+            cpu.EAX = (cpu.EAX & 0xFFFF0000) | ((cols & 0xFF) << 8) | mode
+            cpu.EBX &= 0xFFFF00FF
+        elif ah == 0x10 and self.dac is not None:
+            self.handle_int10_dac(cpu)
         elif ah == 0x0C:
             # 픽셀 그리기
             al = cpu.EAX & 0xFF
@@ -76,6 +128,73 @@ class BIOS:
             if addr < 0x1000000:
                 cpu.mem.write8(addr, al)
 
+    def handle_int10_dac(self, cpu):
+        """INT 10h AH=10h: DAC 레지스터 설정/읽기 (AL=10h, 12h, 15h, 17h)"""
+        al = cpu.EAX & 0xFF
+        bx = cpu.EBX & 0xFFFF
+        if al == 0x10:
+            # BX = 번호, DH/CH/CL = R/G/B
+            self.dac.set_entry(bx & 0xFF, (cpu.EDX >> 8) & 0xFF, (cpu.ECX >> 8) & 0xFF, cpu.ECX & 0xFF)
+        elif al == 0x12:
+            # BX = 첫 번호, CX = 개수, ES:DX = r,g,b 표
+            data = self.memory.read_block(cpu.seg_address(SEG_ES, cpu.EDX), (cpu.ECX & 0xFFFF) * 3)
+            self.dac.load_palette(zip(data[0::3], data[1::3], data[2::3]), bx)
+        elif al == 0x15:
+            base = (bx & 0xFF) * 3
+            r, g, b = self.dac.dac[base:base + 3]
+            cpu.EDX = (cpu.EDX & 0xFFFF00FF) | (r << 8)
+            cpu.ECX = (cpu.ECX & 0xFFFF0000) | (g << 8) | b
+        elif al == 0x17:
+            first = bx & 0xFF
+            count = cpu.ECX & 0xFFFF
+            data = bytes(self.dac.dac[(first + i) % 256 * 3 + c] for i in range(count) for c in range(3))
+            self.memory.write_block(cpu.seg_address(SEG_ES, cpu.EDX), data)
+
+    def set_video_mode(self, al):
+        """BDA 의 모드/커서를 갱신하고 (AL 비트 7 이 없으면) 화면을 지운다."""
+        mode = al & 0x7F
+        self.memory.write8(BDA_VIDEO_MODE, mode)
+        if self.dac is not None:
+            self.dac.load_palette(default_palette())
+        self.memory.write16(BDA_CURSOR_POS, 0)
+        if mode == 0x13:
+            self.memory.write16(BDA_COLUMNS, 40)
+            if not al & 0x80:
+                self.memory.write_block(GRAPHICS_BASE, bytes(320 * 200))
+        else:
+            self.memory.write16(BDA_COLUMNS, TEXT_COLUMNS)
+            self.memory.write8(BDA_ROWS, TEXT_ROWS - 1)
+            self.memory.write16(BDA_CURSOR_SHAPE, 0x0607)   # 시작 6, 끝 7 (8줄 기준)
+            if not al & 0x80:
+                self.memory.write_block(TEXT_BASE, b"\x20\x07" * (TEXT_COLUMNS * TEXT_ROWS))
+
+    def teletype(self, ch):
+        """INT 10h AH=0Eh: 커서 위치에 글자를 쓰고 커서를 옮긴다 (CR/LF/BS/BEL 처리, 스크롤)."""
+        if self.memory.read8(BDA_VIDEO_MODE) == 0x13:
+            return
+        col = self.memory.read8(BDA_CURSOR_POS)
+        row = self.memory.read8(BDA_CURSOR_POS + 1)
+        if ch == 0x0D:
+            col = 0
+        elif ch == 0x0A:
+            row += 1
+        elif ch == 0x08:
+            col = max(0, col - 1)
+        elif ch != 0x07:
+            self.memory.write8(TEXT_BASE + (row * TEXT_COLUMNS + col) * 2, ch)
+            col += 1
+            if col >= TEXT_COLUMNS:
+                col = 0
+                row += 1
+        if row >= TEXT_ROWS:
+            # 한 줄 위로 스크롤, 마지막 줄은 공백
+            line = TEXT_COLUMNS * 2
+            screen = self.memory.read_block(TEXT_BASE + line, line * (TEXT_ROWS - 1))
+            self.memory.write_block(TEXT_BASE, screen + b"\x20\x07" * TEXT_COLUMNS)
+            row = TEXT_ROWS - 1
+        self.memory.write8(BDA_CURSOR_POS, col)
+        self.memory.write8(BDA_CURSOR_POS + 1, row)
+
     def handle_int13(self, cpu):
         """
         INT 13h: 디스크 서비스
@@ -91,7 +210,9 @@ class BIOS:
             es = cpu.ES
             bx = cpu.EBX & 0xFFFF
 
-            lba = ch * 16 * 63 + dh * 63 + (cl - 1)
+            cylinder = ch | ((cl & 0xC0) << 2)
+            sector = cl & 0x3F
+            lba = (cylinder * self.disk.heads + dh) * self.disk.sectors_per_track + (sector - 1)
             data = self.disk.read_sector(lba)
             for i in range(len(data)):
                 cpu.mem.write8(self.real_mode_address(es, bx + i), data[i])
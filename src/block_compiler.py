@@ -0,0 +1,524 @@
+# block_compiler.py
+#
+# 2단계 실행 엔진: 자주 실행되는 기본 블록(분기 없이 이어지는 명령어 열)을
+# 파이썬 소스로 만들어 compile()/exec 로 함수로 바꾸고, 선형 주소로 캐시해 둔다.
+# 생성한 함수는
+#   - 블록에서 쓰는 레지스터/세그먼트 베이스를 지역 변수로 읽어 두고 끝날 때 한 번만 되돌려 쓰며
+#   - 즉치값/변위/다음 IP 를 상수로 박아 넣고
+#   - 플래그는 블록 안에서 나중에 덮어쓰이지 않는 것만 계산한다
+# 인터프리터(CPU.step)와 결과가 같아야 하므로 CPU 에 구현된 명령어 중
+# 외부 상태를 보지 않는 것만 컴파일한다. 포트 I/O, INT/IRET, HLT, CLI/STI, 세그먼트 로드,
+# REP 문자열 명령 등을 만나면 블록을 그 앞에서 끝내고 인터프리터가 실행한다.
+#
+# 쓰기가 블록의 코드 범위와 겹치면 그 블록을 버린다 (같은 페이지의 데이터 쓰기는 그대로 둔다).
+# 실행 중인 블록이 자기 코드를 덮어쓰면 그 쓰기 명령 직후에 블록을 빠져나온다.
+
+import time
+
+from memory import PAGE_SHIFT, PageRanges
+from cpu import (FLAG_CF, FLAG_IF, FLAG_DF, SEG_ES, SEG_SS, SEG_DS, _REG32,
+                 ALU_OPS, INCDEC_OPS, CONDITIONS, FLAG_FNS, W8, W16)
+
+MAX_BLOCK_INSTRUCTIONS = 64
+DEFAULT_THRESHOLD = 50
+
+# 블록 함수가 전역으로 보는 이름: ALU 플래그 함수(add_flags 등)와 연산 크기
+_BLOCK_GLOBALS = dict({f"{kind}_flags": fn for kind, fn in FLAG_FNS.items()}, W8=W8, W16=W16)
+
+_MODRM16_TERMS = (("EBX", "ESI"), ("EBX", "EDI"), ("EBP", "ESI"), ("EBP", "EDI"),
+                  ("ESI",), ("EDI",), ("EBP",), ("EBX",))
+
+_TERMINATORS = frozenset((0xEB, 0xE9, 0xE2, 0xE8, 0xC3) + tuple(range(0x70, 0x80)))
+
+
+def _alu_entry(ins):
+    """cpu.ALU_OPS/INCDEC_OPS 의 (식, 플래그 종류, 결과를 쓰는가) 또는 None"""
+    op = ins.op
+    if op < 0x40 and (op & 7) < 6:
+        return ALU_OPS[op >> 3]
+    if 0x80 <= op <= 0x83:
+        return ALU_OPS[ins.reg]
+    if 0x40 <= op <= 0x4F:
+        return INCDEC_OPS[(op >> 3) & 1]
+    return None
+
+def _reads_flags(entry):
+    """ADC/SBB 는 CF 를 읽고 INC/DEC 는 CF 를 그대로 남긴다"""
+    expr, kind, _ = entry
+    return "c" in expr.split() or kind in ("inc", "dec")
+
+def _may_exit(ins):
+    """메모리에 쓰고 stale 검사를 하는 명령어: 자기 코드를 덮어쓰면 여기서 블록을 빠져나온다"""
+    op = ins.op
+    if (op == 0x89 and ins.mod != 3) or 0x50 <= op <= 0x57 or op == 0xAA:
+        return True
+    # 결과를 메모리 대상(Eb/Ev)에 되돌려 쓰는 ALU 연산
+    entry = _alu_entry(ins)
+    return entry is not None and entry[2] and ins.operands[0] in ("Eb", "Ev") and ins.mod != 3
+
+
+class Block:
+    """컴파일된 블록 (fn 이 None 이면 컴파일할 수 없는 주소라는 표시)."""
+
+    __slots__ = ("addr", "end", "base", "fn", "count", "pages", "stale", "source")
+
+    def __init__(self, addr, end, base, fn, count, pages, source=None):
+        self.addr = addr
+        self.end = end           # 코드의 끝 (이 바이트는 포함하지 않는다)
+        self.base = base
+        self.fn = fn
+        self.count = count
+        self.pages = pages
+        self.stale = [False]
+        self.source = source
+
+
+class _Emitter:
+    """명령어 하나씩 블록 함수 본문을 만든다."""
+
+    def __init__(self):
+        self.lines = []
+        self.regs_read = set()
+        self.regs_written = set()
+        self.segs = set()
+        self.uses_mem = False
+        self.flags_read = False
+        self.flags_written = False
+
+    def emit(self, line):
+        self.lines.append("        " + line)
+
+    def reg(self, r):
+        name = _REG32[r]
+        self.regs_read.add(name)
+        return name
+
+    def get16(self, r):
+        return f"({self.reg(r)} & 0xFFFF)"
+
+    def get8(self, r):
+        """0~3: AL CL DL BL, 4~7: AH CH DH BH"""
+        name = self.reg(r & 3)
+        return f"({name} & 0xFF)" if r < 4 else f"(({name} >> 8) & 0xFF)"
+
+    def set8(self, r, expr):
+        name = self.reg(r & 3)
+        self.regs_written.add(name)
+        if r < 4:
+            self.emit(f"{name} = ({name} & 0xFFFFFF00) | ({expr})")
+        else:
+            self.emit(f"{name} = ({name} & 0xFFFF00FF) | (({expr}) << 8)")
+
+    def set16(self, r, expr):
+        name = self.reg(r)
+        self.regs_written.add(name)
+        self.emit(f"{name} = ({name} & 0xFFFF0000) | ({expr})")
+
+    def seg(self, s):
+        self.segs.add(s)
+        return f"S{s}"
+
+    def flags(self):
+        self.flags_read = True
+        return "EFLAGS"
+
+    def mem(self):
+        self.uses_mem = True
+        return "mem"
+
+    def modrm_offset(self, ins):
+        """decoder.MODRM16 의 오프셋 함수와 같은 16비트 오프셋 식"""
+        if ins.mod == 0 and ins.rm == 6:
+            return f"{ins.disp & 0xFFFF}"
+        terms = " + ".join(f"({self.reg(_REG32.index(t))} & 0xFFFF)" for t in _MODRM16_TERMS[ins.rm])
+        disp = f" + {ins.disp}" if ins.disp > 0 else f" - {-ins.disp}" if ins.disp < 0 else ""
+        return f"(({terms}){disp}) & 0xFFFF"
+
+
+class BlockCompiler:
+    """
+    CPU.run 을 대신해 블록 단위로 실행한다 (cpu.enable_block_compiler).
+    threshold 번 실행된 블록 시작 주소를 컴파일한다. 페이징이 켜져 있거나
+    실행 트레이스가 켜져 있으면 인터프리터로만 실행한다.
+    통계: compiled(블록 수), block_runs, compiled_instructions, invalidations,
+    compiled_time(컴파일된 코드 안에서 보낸 시간), compile_time.
+    """
+
+    def __init__(self, cpu, threshold=DEFAULT_THRESHOLD):
+        self.cpu = cpu
+        self.threshold = threshold
+        self.blocks = {}         # 선형 주소 -> Block
+        self.counts = {}         # 선형 주소 -> 인터프리터로 실행한 횟수
+        self._page_blocks = {}   # 물리 page -> PageRanges (Block, 코드 시작, 코드 끝)
+        self.compiled = 0
+        self.block_runs = 0
+        self.compiled_instructions = 0
+        self.invalidations = 0
+        self.compiled_time = 0.0
+        self.compile_time = 0.0
+        self.persistent = None   # 디스크 캐시 (enable_persistent_cache)
+        self.loaded = 0          # 디스크 캐시에서 가져온 블록 수
+
+    # ------------------------------------------------------------
+    # 실행
+    # ------------------------------------------------------------
+    def run(self, count):
+        """
+        CPU.run 과 같다: count 스텝(명령어/인터럽트 진입/HLT 대기) 실행.
+        블록은 남은 스텝 안에 다 들어갈 때만, cpu.sync_instret 과 다음 예약 사건(ic.next_due)을
+        넘지 않을 때만 실행한다.
+        """
+        cpu = self.cpu
+        step = cpu.step
+        if cpu.trace is not None or cpu.mem is not cpu.phys_mem:
+            for _ in range(count):
+                step()
+            return
+        blocks = self.blocks
+        counts = self.counts
+        threshold = self.threshold
+        persistent = self.persistent
+        seg_base = cpu.seg_base
+        ic = cpu.ic
+        perf_counter = time.perf_counter
+        done = 0
+        while done < count:
+            if cpu.instret >= ic.next_due:
+                ic.run_due()
+            if cpu.EFLAGS & FLAG_IF:
+                vector = ic.get_pending_interrupt()
+                if vector is not None:
+                    cpu.halted = False
+                    cpu.handle_interrupt(vector)
+                    done += 1
+                    continue
+            if cpu.halted:
+                done += 1
+                continue
+            base = seg_base[1]
+            addr = base + cpu.EIP
+            blk = blocks.get(addr)
+            if blk is None:
+                hits = counts.get(addr, 0) + 1
+                counts[addr] = hits
+                # 디스크 캐시에 있는 블록은 처음 실행할 때 바로 가져온다
+                if hits >= threshold or (hits == 1 and persistent is not None
+                                         and persistent.has_block(base, cpu.EIP)):
+                    self.compile(base, cpu.EIP)
+                    continue
+            elif (blk.fn is not None and blk.base == base and blk.count <= count - done
+                  and cpu.instret + blk.count <= cpu.sync_instret
+                  and cpu.instret + blk.count <= ic.next_due):
+                start = perf_counter()
+                before = cpu.instret
+                blk.fn(cpu)
+                self.compiled_time += perf_counter() - start
+                # 자기 코드를 덮어써 중간에 빠져나왔으면 blk.count 보다 적다
+                ran = cpu.instret - before
+                self.block_runs += 1
+                self.compiled_instructions += ran
+                done += ran
+                continue
+            step()
+            done += 1
+
+    # ------------------------------------------------------------
+    # 컴파일
+    # ------------------------------------------------------------
+    def compile(self, base, ip):
+        start = time.perf_counter()
+        addr = base + ip
+        instrs = self._collect(base, ip)
+        # 컴파일할 수 없는 주소도 그 명령어가 덮어써지면 다시 시도하도록 첫 명령어 범위를 잡는다
+        last = instrs[-1] if instrs else self.cpu.decoder.decode(base, ip)
+        end = last.addr + last.length
+        pages = tuple(range(addr >> PAGE_SHIFT, ((end - 1) >> PAGE_SHIFT) + 1))
+        if instrs:
+            persistent = self.persistent
+            cached = persistent.lookup_block(base, ip, pages) if persistent is not None else None
+            if cached is not None and cached[0] == len(instrs):
+                _, source, code = cached
+                self.loaded += 1
+            else:
+                source = self._generate(base, ip, instrs)
+                code = compile(source, f"<block {addr:08X}>", "exec")
+                if persistent is not None:
+                    persistent.store_block(base, ip, pages, len(instrs), source, code)
+            namespace = {}
+            blk = Block(addr, end, base, None, len(instrs), pages, source)
+            exec(code, dict(_BLOCK_GLOBALS, stale=blk.stale), namespace)
+            blk.fn = namespace["block"]
+            self.compiled += 1
+        else:
+            blk = Block(addr, end, base, None, 0, pages)
+        self._remember(blk)
+        self.compile_time += time.perf_counter() - start
+        return blk
+
+    def _collect(self, base, ip):
+        """블록에 들어갈 명령어 목록 (컴파일 가능한 것만, 끝 분기 포함)."""
+        decoder = self.cpu.decoder
+        instrs = []
+        while len(instrs) < MAX_BLOCK_INSTRUCTIONS:
+            ins = decoder.decode(base, ip)
+            if ip + ins.length > 0xFFFF or not self._supported(ins):
+                break
+            instrs.append(ins)
+            if ins.op in _TERMINATORS:
+                break
+            ip += ins.length
+        return instrs
+
+    @staticmethod
+    def _supported(ins):
+        op = ins.op
+        if ins.opsize != 16 or ins.addrsize != 16:
+            return False
+        if op in (0x8B, 0x89):
+            return True
+        if op in (0xAA, 0xAC):
+            return not ins.rep
+        return (op == 0x90 or 0xB0 <= op <= 0xBF or 0x50 <= op <= 0x5F
+                or op in _TERMINATORS or _alu_entry(ins) is not None)
+
+    def _generate(self, base, ip, instrs):
+        e = _Emitter()
+        # 플래그를 읽기 전에 다른 ALU 명령이 다시 덮어쓰는 플래그는 계산하지 않는다.
+        # 뒤에서부터 훑는다: 블록이 끝난 뒤에는 모든 플래그가 살아 있고,
+        # Jcc/ADC/SBB/INC/DEC(CF 를 남긴다)는 앞 명령의 플래그를 읽는다.
+        # stale 검사로 중간에 빠져나올 수 있는 곳에서도 인터프리터가 이어 받으므로 모두 살아 있다.
+        live = [False] * len(instrs)
+        needed = True
+        for i in range(len(instrs) - 1, -1, -1):
+            if _may_exit(instrs[i]):
+                needed = True
+            entry = _alu_entry(instrs[i])
+            if entry is not None:
+                live[i] = needed
+                needed = False
+            if 0x70 <= instrs[i].op <= 0x7F or (entry is not None and _reads_flags(entry)):
+                needed = True
+        for i, ins in enumerate(instrs):
+            next_ip = (ip + ins.length) & 0xFFFF
+            e.emit(f"# {ip:04X}: {ins.mnemonic}")
+            e.emit(f"n = {i + 1}; nip = {next_ip}")
+            self._emit_instr(e, ins, next_ip, live[i])
+            ip = next_ip
+
+        prologue = ["def block(cpu, stale=stale):"]
+        if e.segs:
+            prologue.append("    seg_base = cpu.seg_base")
+            prologue += [f"    S{s} = seg_base[{s}]" for s in sorted(e.segs)]
+        if e.uses_mem:
+            prologue.append("    mem = cpu.mem")
+        for name in sorted(e.regs_read | e.regs_written):
+            prologue.append(f"    {name} = cpu.{name}")
+        if e.flags_read or e.flags_written:
+            prologue.append("    EFLAGS = cpu.EFLAGS")
+        prologue += ["    n = 0", "    nip = cpu.EIP", "    try:"]
+        epilogue = ["    finally:"]
+        for name in sorted(e.regs_written):
+            epilogue.append(f"        cpu.{name} = {name}")
+        if e.flags_written:
+            epilogue.append("        cpu.EFLAGS = EFLAGS")
+        epilogue += ["        cpu.EIP = nip", "        cpu.instret += n"]
+        return "\n".join(prologue + e.lines + epilogue) + "\n"
+
+    def _emit_instr(self, e, ins, next_ip, flags_live):
+        op = ins.op
+        if op == 0x90:
+            e.emit("pass")
+        elif 0xB0 <= op <= 0xB7:                     # MOV r8, imm8
+            r = op & 3
+            name = e.reg(r)
+            e.regs_written.add(name)
+            if op & 4:
+                e.emit(f"{name} = ({name} & 0xFFFF00FF) | {(ins.imm & 0xFF) << 8}")
+            else:
+                e.emit(f"{name} = ({name} & 0xFFFFFF00) | {ins.imm & 0xFF}")
+        elif 0xB8 <= op <= 0xBF:                     # MOV r16, imm16
+            e.set16(op & 7, f"{ins.imm & 0xFFFF}")
+        elif op == 0x8B:                             # MOV r16, r/m16
+            if ins.mod == 3:
+                e.set16(ins.reg, e.get16(ins.rm))
+            else:
+                seg = e.seg(ins.ea_seg)
+                e.emit(f"v = {e.mem()}.read16({seg} + ({e.modrm_offset(ins)}))")
+                e.set16(ins.reg, "v")
+        elif op == 0x89:                             # MOV r/m16, r16
+            if ins.mod == 3:
+                e.set16(ins.rm, e.get16(ins.reg))
+            else:
+                seg = e.seg(ins.ea_seg)
+                e.emit(f"{e.mem()}.write16({seg} + ({e.modrm_offset(ins)}), {e.get16(ins.reg)})")
+                self._emit_stale_check(e)
+        elif 0x50 <= op <= 0x57:                     # PUSH r16 (SP 는 감소 전 값)
+            e.emit(f"v = {e.get16(op & 7)}")
+            self._emit_push(e, "v")
+            self._emit_stale_check(e)
+        elif 0x58 <= op <= 0x5F:                     # POP r16
+            self._emit_pop(e, "v")
+            e.set16(op & 7, "v")
+        elif op == 0xAA:                             # STOSB
+            e.emit(f"di = {e.get16(7)}")
+            e.emit(f"{e.mem()}.write8({e.seg(SEG_ES)} + di, {e.reg(0)} & 0xFF)")
+            e.set16(7, f"(di - 1 if {e.flags()} & {FLAG_DF} else di + 1) & 0xFFFF")
+            self._emit_stale_check(e)
+        elif op == 0xAC:                             # LODSB
+            seg = e.seg(SEG_DS if ins.seg is None else ins.seg)
+            e.emit(f"si = {e.get16(6)}")
+            name = e.reg(0)
+            e.regs_written.add(name)
+            e.emit(f"{name} = ({name} & 0xFFFFFF00) | {e.mem()}.read8({seg} + si)")
+            e.set16(6, f"(si - 1 if {e.flags()} & {FLAG_DF} else si + 1) & 0xFFFF")
+        elif op in (0xEB, 0xE9):                     # JMP rel
+            e.emit(f"nip = {(next_ip + ins.imm) & 0xFFFF}")
+        elif 0x70 <= op <= 0x7F:                     # Jcc
+            e.emit(f"f = {e.flags()}")
+            e.emit(f"if {CONDITIONS[op & 0xF]}: nip = {(next_ip + ins.imm) & 0xFFFF}")
+        elif op == 0xE2:                             # LOOP
+            e.emit(f"cx = ({e.get16(1)} - 1) & 0xFFFF")
+            e.set16(1, "cx")
+            e.emit(f"if cx: nip = {(next_ip + ins.imm) & 0xFFFF}")
+        elif op == 0xE8:                             # CALL rel16
+            self._emit_push(e, f"{next_ip}")
+            e.emit(f"nip = {(next_ip + ins.imm) & 0xFFFF}")
+        elif op == 0xC3:                             # RET
+            self._emit_pop(e, "nip")
+        elif _alu_entry(ins) is not None:            # ALU 연산 표의 명령어
+            self._emit_alu(e, ins, _alu_entry(ins), flags_live)
+        else:
+            raise Exception(f"block compiler: unexpected opcode 0x{op:02X}")
+
+    @staticmethod
+    def _emit_alu(e, ins, entry, flags_live):
+        """
+        a = 대상, b = 원본으로 읽고 표의 식으로 full 을 구한 뒤 결과를 쓰고,
+        플래그가 살아 있으면 인터프리터와 같은 플래그 함수를 부른다.
+        """
+        expr, kind, writes = entry
+        if not (writes or flags_live):
+            e.emit("pass")    # 플래그가 버려지는 CMP
+            return
+        dest = ins.operands[0]
+        byte = dest in ("Eb", "Gb", "AL")
+        size = 8 if byte else 16
+        get = e.get8 if byte else e.get16
+        set_ = e.set8 if byte else e.set16
+
+        def operand(k):
+            if k in ("Gb", "Gv"):
+                return get(ins.reg)
+            if k in ("Eb", "Ev"):
+                if ins.mod == 3:
+                    return get(ins.rm)
+                return f"{e.mem()}.read{size}(addr)"
+            if k in ("AL", "AX"):
+                return get(0)
+            if k == "Zv":
+                return get(ins.op & 7)
+            return f"{ins.imm & (0xFF if byte else 0xFFFF)}"     # Ib/Iv/Ibs
+
+        if ins.mod is not None and ins.mod != 3:
+            e.emit(f"addr = {e.seg(ins.ea_seg)} + ({e.modrm_offset(ins)})")
+        e.emit(f"a = {operand(dest)}")
+        e.emit(f"b = {operand(ins.operands[1]) if len(ins.operands) > 1 else 1}")
+        if "c" in expr.split():
+            e.emit(f"c = {e.flags()} & {FLAG_CF}")
+        e.emit(f"full = {expr}")
+        if flags_live:
+            e.flags_written = True
+            e.emit(f"EFLAGS = {kind}_flags({e.flags()}, a, b, full, W{size})")
+        if writes:
+            res = f"full & {0xFF if byte else 0xFFFF}"
+            if dest in ("Eb", "Ev") and ins.mod != 3:
+                e.emit(f"{e.mem()}.write{size}(addr, {res})")
+                BlockCompiler._emit_stale_check(e)
+            else:
+                set_({"Eb": ins.rm, "Ev": ins.rm, "Gb": ins.reg, "Gv": ins.reg,
+                      "AL": 0, "AX": 0, "Zv": ins.op & 7}[dest], res)
+
+    @staticmethod
+    def _emit_push(e, value):
+        e.emit(f"sp = ({e.reg(4)} - 2) & 0xFFFF")
+        e.set16(4, "sp")
+        e.emit(f"{e.mem()}.write16({e.seg(SEG_SS)} + sp, {value})")
+
+    @staticmethod
+    def _emit_pop(e, target):
+        e.emit(f"sp = {e.get16(4)}")
+        e.emit(f"{target} = {e.mem()}.read16({e.seg(SEG_SS)} + sp)")
+        e.set16(4, "(sp + 2) & 0xFFFF")
+
+    @staticmethod
+    def _emit_stale_check(e):
+        # 방금 쓴 곳이 이 블록의 코드였다면 다음 명령어부터는 인터프리터가 새 코드를 실행한다
+        e.emit("if stale[0]: return")
+
+    # ------------------------------------------------------------
+    # 무효화
+    # ------------------------------------------------------------
+    def _remember(self, blk):
+        self.blocks[blk.addr] = blk
+        mem = self.cpu.phys_mem
+        for page in blk.pages:
+            entries = self._page_blocks.get(page)
+            if entries is None:
+                entries = self._page_blocks[page] = PageRanges()
+                mem.add_write_hook(page, self._on_code_write)
+            entries.add(blk, max(blk.addr, page << PAGE_SHIFT), min(blk.end, (page + 1) << PAGE_SHIFT))
+
+    def _on_code_write(self, addr, size, value):
+        # 코드 범위 [addr, end) 와 겹치는 블록만 버린다. 같은 페이지의 데이터에 쓰는 블록이
+        # 실행할 때마다 자기 자신을 무효화하고 실행 횟수를 잃지 않도록.
+        end = addr + size
+        for page in range(addr >> PAGE_SHIFT, ((end - 1) >> PAGE_SHIFT) + 1):
+            entries = self._page_blocks.get(page)
+            if entries is not None:
+                for blk in entries.take(addr, end):
+                    self._invalidate(blk)
+
+    def invalidate_page(self, page):
+        entries = self._page_blocks.get(page)
+        if entries is not None:
+            for blk, _, _ in entries.items:
+                self._invalidate(blk)
+
+    def _invalidate(self, blk):
+        blk.stale[0] = True
+        if self.blocks.get(blk.addr) is blk:
+            del self.blocks[blk.addr]
+            self.counts.pop(blk.addr, None)
+            self.invalidations += 1
+        mem = self.cpu.phys_mem
+        for page in blk.pages:
+            entries = self._page_blocks.get(page)
+            if entries is None:
+                continue
+            entries.remove(blk)
+            if not entries.items:
+                del self._page_blocks[page]
+                mem.remove_write_hook(page, self._on_code_write)
+
+    def enable_persistent_cache(self, cache):
+        """
+        컴파일한 블록의 코드를 디스크 캐시(translation_cache.TranslationCache)에 남기고,
+        캐시에 있는 블록은 임계값을 기다리지 않고 처음 실행할 때 가져온다.
+        """
+        self.persistent = cache
+
+    def flush(self):
+        for page in list(self._page_blocks):
+            self.invalidate_page(page)
+        self.counts.clear()
+
+    def stats(self):
+        return {
+            "compiled_blocks": self.compiled,
+            "loaded_blocks": self.loaded,
+            "block_runs": self.block_runs,
+            "compiled_instructions": self.compiled_instructions,
+            "invalidations": self.invalidations,
+            "compiled_seconds": round(self.compiled_time, 6),
+            "compile_seconds": round(self.compile_time, 6),
+        }
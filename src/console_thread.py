@@ -1,17 +1,66 @@
 # console_thread.py
+import os
 import threading
 import queue
 import sys
 
+class ConsoleInput:
+    """
+    이벤트 루프(selectors)에 stdin 을 등록해 명령을 받는다.
+    별도 스레드가 없으므로 stop() 이 입력을 기다리며 멈추는 일이 없다.
+    POSIX 처럼 stdin 을 select 할 수 있는 환경에서 사용한다.
+    """
+    def __init__(self, handler):
+        self.handler = handler
+        self.loop = None
+        self._partial = b""
+        self._fd = sys.stdin.fileno()
+
+    @staticmethod
+    def supported():
+        if os.name == "nt":
+            return False
+        try:
+            sys.stdin.fileno()
+        except (AttributeError, ValueError, OSError):
+            return False
+        return True
+
+    def start(self, loop):
+        self.loop = loop
+        loop.add_reader(self._fd, self._on_readable)
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.remove_reader(self._fd)
+            self.loop = None
+
+    def _on_readable(self, fd):
+        data = os.read(fd, 4096)
+        if not data:
+            # EOF
+            self.stop()
+            return
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()
+        for line in lines:
+            cmd = line.decode(errors="replace").strip().lower()
+            self.handler(cmd)
+
+
 class ConsoleThread:
     """
     별도 스레드로 돌며, 터미널에서 사용자 입력을 받는다.
     입력받은 명령을 commands 큐에 넣는다.
+    stdin 을 select 할 수 없는 환경(Windows 등)용. loop/handler 를 주면
+    명령을 이벤트 루프로 넘겨 루프를 깨운다.
     """
-    def __init__(self):
+    def __init__(self, loop=None, handler=None):
         self.commands = queue.Queue()
         self.running = False
         self.thread = None
+        self.loop = loop
+        self.handler = handler
 
     def _loop(self):
         while self.running:
@@ -20,7 +69,10 @@ class ConsoleThread:
                 # EOF
                 break
             cmd = line.strip().lower()
-            self.commands.put(cmd)
+            if self.loop is not None and self.handler is not None:
+                self.loop.call_soon_threadsafe(lambda cmd=cmd: self.handler(cmd))
+            else:
+                self.commands.put(cmd)
             if cmd == "q":
                 # 종료 의도
                 self.running = False
@@ -35,7 +87,8 @@ class ConsoleThread:
     def stop(self):
         self.running = False
         if self.thread:
-            self.thread.join()
+            # readline() 에 막혀 있을 수 있으므로 무한정 기다리지 않는다 (데몬 스레드)
+            self.thread.join(timeout=0.1)
 
     def get_command_nowait(self):
         """
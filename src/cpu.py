@@ -2,6 +2,10 @@
 
 from interrupt_controller import InterruptController
 from memory import Memory
+from eisa_bus import EISABus
+from decoder import Decoder
+from paging import PagedMemory
+from exec_trace import TRACE_OP_IRQ
 
 FLAG_CF = 1 << 0
 FLAG_PF = 1 << 2
@@ -13,13 +17,46 @@ FLAG_IF = 1 << 9
 FLAG_DF = 1 << 10
 FLAG_OF = 1 << 11
 
+# 세그먼트 레지스터 번호 (ModR/M reg 필드의 Sreg 인코딩과 같다)
+SEG_ES = 0
+SEG_CS = 1
+SEG_SS = 2
+SEG_DS = 3
+SEG_FS = 4
+SEG_GS = 5
+
+# sync_instret 기본값: 사실상 제한 없음
+NO_SYNC_INSTRET = 1 << 62
+
+CR0_PE = 1 << 0
+CR0_PG = 1 << 31
+
 def sign_extend16_to32(x):
     return x if x < 0x8000 else x - 0x10000
 
+def _segment_register(index):
+    """
+    CS/DS/... 속성: 읽으면 셀렉터, 쓰면 load_segment 로 베이스/리밋/속성 캐시까지 갱신.
+    CPU 내부 주소 계산은 셀렉터가 아니라 seg_base[] 를 직접 쓴다.
+    """
+    def getter(self):
+        return self.sreg[index]
+
+    def setter(self, value):
+        self.load_segment(index, value)
+
+    return property(getter, setter)
+
 class CPU:
-    def __init__(self, memory: Memory, ic: InterruptController):
+    def __init__(self, memory: Memory, ic: InterruptController, bus: EISABus = None):
+        # mem 은 명령어가 쓰는 (선형) 메모리: 페이징이 꺼져 있으면 물리 메모리 그대로,
+        # CR0.PG 가 켜지면 TLB 를 거치는 PagedMemory 로 바뀐다.
+        self.phys_mem = memory
+        self.mmu = PagedMemory(memory, self)
         self.mem = memory
         self.ic = ic
+        # IN/OUT 이 가는 I/O 버스 (없으면 모든 포트가 open bus 인 빈 버스)
+        self.bus = bus if bus is not None else EISABus()
 
         self.EAX = 0
         self.EBX = 0
@@ -30,6 +67,25 @@ class CPU:
         self.EBP = 0
         self.ESP = 0
 
+        # 컨트롤 레지스터 / 디스크립터 테이블 레지스터
+        self.CR0 = 0
+        self.CR2 = 0
+        self.CR3 = 0
+        self.CR4 = 0
+        self.gdtr_base = 0
+        self.gdtr_limit = 0xFFFF
+        self.idtr_base = 0
+        self.idtr_limit = 0x3FF
+        self.ldtr = 0
+        self.ldtr_base = 0
+        self.ldtr_limit = 0
+
+        # 세그먼트 레지스터: 셀렉터 + 숨겨진 디스크립터 캐시 (세그먼트를 로드할 때만 갱신)
+        self.sreg = [0] * 6
+        self.seg_base = [0] * 6
+        self.seg_limit = [0xFFFF] * 6
+        self.seg_attr = [0] * 6
+
         self.CS = 0xF000
         self.DS = 0
         self.ES = 0
@@ -40,6 +96,22 @@ class CPU:
         self.EIP = 0xFFF0
         self.EFLAGS = 0x00000002
         self.running = True
+        self.halted = False      # HLT 후 인터럽트를 기다리는 중
+        self.instret = 0         # 실행 완료(retired)된 명령어 수
+        # 블록 단위 실행(BlockCompiler)이 넘어가면 안 되는 instret (재생할 IRQ 위치 등)
+        self.sync_instret = NO_SYNC_INSTRET
+
+        # BIOS 서비스 트랩: 번호 -> handler(cpu) (BIOS.attach 가 채운다)
+        self.bios_traps = {}
+
+        # 디스어셈블러와 공유하는 디코더 (선형 주소 단위 메모이즈)
+        self.decoder = Decoder(memory)
+        self.decode_cache = self.decoder.cache
+
+        # 실행 트레이스 링 (enable_trace 로 켤 때만 사용)
+        self.trace = None
+        # 2단계 블록 컴파일러 (enable_block_compiler 로 켤 때만 사용)
+        self.block_compiler = None
 
     def get_flags(self):
         return self.EFLAGS
@@ -48,201 +120,565 @@ class CPU:
         if val: self.EFLAGS |= FLAG_IF
         else:   self.EFLAGS &= ~FLAG_IF
 
-    def real_mode_address(self, seg, off):
-        return ((seg & 0xFFFF) << 4) + (off & 0xFFFF)
+    ES = _segment_register(SEG_ES)
+    CS = _segment_register(SEG_CS)
+    SS = _segment_register(SEG_SS)
+    DS = _segment_register(SEG_DS)
+    FS = _segment_register(SEG_FS)
+    GS = _segment_register(SEG_GS)
 
-    def seg_override(self, default_seg):
-        return default_seg
+    def seg_address(self, seg, off):
+        """세그먼트 번호(SEG_*) + 오프셋 -> 선형 주소. 캐시된 베이스에 더하기 한 번."""
+        return self.seg_base[seg] + (off & 0xFFFF)
+
+    def seg_override(self, default_seg, ins):
+        """세그먼트 오버라이드 접두어가 있으면 그 세그먼트, 없으면 default_seg."""
+        return default_seg if ins.seg is None else ins.seg
 
     def read_rm16(self, seg, offset):
-        addr = self.real_mode_address(seg, offset)
-        return self.mem.read16(addr)
+        return self.mem.read16(self.seg_base[seg] + (offset & 0xFFFF))
 
     def write_rm16(self, seg, offset, val):
-        addr = self.real_mode_address(seg, offset)
-        self.mem.write16(addr, val & 0xFFFF)
+        self.mem.write16(self.seg_base[seg] + (offset & 0xFFFF), val & 0xFFFF)
+
+    # ------------------------------------------------------------
+    # 세그먼트 로드 / 디스크립터 캐시
+    # ------------------------------------------------------------
+    def load_segment(self, seg, selector):
+        """
+        세그먼트 레지스터 로드. 리얼 모드는 베이스 = 셀렉터*16,
+        보호 모드는 GDT/LDT 디스크립터를 읽어 베이스/리밋/속성을 캐시한다.
+        이후 메모리 접근은 디스크립터 테이블을 다시 읽지 않는다.
+        """
+        selector &= 0xFFFF
+        self.sreg[seg] = selector
+        if not (self.CR0 & CR0_PE):
+            self.seg_base[seg] = selector << 4
+            self.seg_limit[seg] = 0xFFFF
+            if seg == SEG_CS:
+                self.mmu.set_cpl(0)
+            return
+        if seg == SEG_CS:
+            self.mmu.set_cpl(selector & 3)
+        if (selector & 0xFFFC) == 0:
+            if seg == SEG_CS or seg == SEG_SS:
+                raise Exception(f"#GP: null selector loaded into {('ES', 'CS', 'SS', 'DS', 'FS', 'GS')[seg]}")
+            # 널 셀렉터: 로드는 되지만 사용하면 안 되는 세그먼트
+            self.seg_base[seg] = 0
+            self.seg_limit[seg] = 0
+            self.seg_attr[seg] = 0
+            return
+        base, limit, attr = self.read_descriptor(selector)
+        self.seg_base[seg] = base
+        self.seg_limit[seg] = limit
+        self.seg_attr[seg] = attr
+
+    def read_descriptor(self, selector):
+        """GDT(TI=0)/LDT(TI=1) 에서 8바이트 디스크립터를 읽어 (base, limit, attr) 반환."""
+        if selector & 4:
+            table_base, table_limit = self.ldtr_base, self.ldtr_limit
+        else:
+            table_base, table_limit = self.gdtr_base, self.gdtr_limit
+        index = selector & 0xFFF8
+        if index + 7 > table_limit:
+            raise Exception(f"#GP: selector {selector:04X} outside descriptor table")
+        lo = self.mem.read32(table_base + index)
+        hi = self.mem.read32(table_base + index + 4)
+        if not (hi & 0x8000):
+            raise Exception(f"#NP: segment {selector:04X} not present")
+        base = ((lo >> 16) & 0xFFFF) | ((hi & 0xFF) << 16) | (hi & 0xFF000000)
+        limit = (lo & 0xFFFF) | (hi & 0x000F0000)
+        if hi & 0x00800000:   # G: 4KB 단위
+            limit = (limit << 12) | 0xFFF
+        attr = (hi >> 8) & 0xF0FF  # 접근 바이트 + (G, D/B, L, AVL)
+        return base, limit, attr
+
+    def _update_paging(self):
+        """CR0.PG 에 맞춰 명령어가 쓰는 메모리 뷰(물리/페이징)를 바꿔 끼운다."""
+        self.mmu.flush()
+        if self.CR0 & CR0_PG:
+            self.mem = self.mmu
+            self.decoder.set_view(self.mmu, self.mmu.translate)
+        else:
+            self.mem = self.phys_mem
+            self.decoder.set_view(self.phys_mem)
+
+    def invlpg(self, linear):
+        """INVLPG: TLB 엔트리 하나만 무효화. 디코드 캐시는 그 선형 페이지 대응이 바뀔 수 있어 비운다."""
+        self.mmu.invalidate(linear)
+        if self.mem is self.mmu:
+            self.decoder.flush()
+
+    def set_control_register(self, n, value):
+        value &= 0xFFFFFFFF
+        if n == 0:
+            if (value & CR0_PG) and not (value & CR0_PE):
+                raise Exception("#GP: CR0.PG set without CR0.PE")
+            old = self.CR0
+            self.CR0 = value
+            if (old ^ value) & (CR0_PG | CR0_PE):
+                self._update_paging()
+        elif n == 2:
+            self.CR2 = value
+        elif n == 3:
+            # CR3 쓰기는 TLB 전체 무효화
+            self.CR3 = value
+            self.mmu.flush()
+            if self.mem is self.mmu:
+                self.decoder.flush()
+        elif n == 4:
+            self.CR4 = value
+        else:
+            raise Exception(f"#UD: MOV to CR{n}")
 
     def step(self):
         if (self.EFLAGS & FLAG_IF) != 0:
             pending_int = self.ic.get_pending_interrupt()
             if pending_int is not None:
+                self.halted = False
                 self.handle_interrupt(pending_int)
                 return
+        if self.halted:
+            return
 
-        op = self.fetch8()
-
-        if op == 0xEA:
-            new_ip = self.fetch16()
-            new_cs = self.fetch16()
-            self.CS = new_cs
-            self.EIP = new_ip
-
-        elif op == 0xCD:
-            int_num = self.fetch8()
-            self.handle_interrupt(int_num)
-
-        elif op == 0x90:
-            pass
-
-        elif op == 0xB8:
-            imm16 = self.fetch16()
-            self.EAX = (self.EAX & 0xFFFF0000) | imm16
-
-        elif op == 0x05:  # ADD AX, imm16
-            imm16 = self.fetch16()
-            ax = self.EAX & 0xFFFF
-            full = ax + imm16
-            result = full & 0xFFFF
-            self.EAX = (self.EAX & 0xFFFF0000) | result
-            # Update flags
-            if full > 0xFFFF:
-                self.EFLAGS |= FLAG_CF
-            else:
-                self.EFLAGS &= ~FLAG_CF
-            if result == 0:
-                self.EFLAGS |= FLAG_ZF
-            else:
-                self.EFLAGS &= ~FLAG_ZF
-            if (result & 0x8000) != 0:
-                self.EFLAGS |= FLAG_SF
-            else:
-                self.EFLAGS &= ~FLAG_SF
-            sign_ax = (ax & 0x8000) != 0
-            sign_imm = (imm16 & 0x8000) != 0
-            sign_res = (result & 0x8000) != 0
-            if (sign_ax == sign_imm) and (sign_ax != sign_res):
-                self.EFLAGS |= FLAG_OF
-            else:
-                self.EFLAGS &= ~FLAG_OF
-
-        elif op == 0xE8:
-            disp16 = self.fetch16()
-            next_ip = self.EIP
-            self.push16(next_ip)
-            signed_disp = sign_extend16_to32(disp16)
-            self.EIP = (self.EIP + signed_disp) & 0xFFFF
-
-        elif op == 0xC3:
-            ret_ip = self.pop16()
-            self.EIP = ret_ip
-
-        elif op == 0x8B:
-            self.mov_r16_rm16()
-
-        elif op == 0x89:
-            self.mov_rm16_r16()
-
-        elif op >= 0x50 and op <= 0x57:  # PUSH r16
-            reg_id = op & 0x07
-            val16 = self.get_reg16(reg_id)
-            self.push16(val16)
-
-        elif op >= 0x58 and op <= 0x5F:  # POP r16
-            reg_id = op & 0x07
-            val16 = self.pop16()
-            self.set_reg16(reg_id, val16)
-
-        elif op == 0x3D:  # CMP AX, imm16
-            imm16 = self.fetch16()
-            ax = self.EAX & 0xFFFF
-            full = ax - imm16
-            result = full & 0xFFFF
-            # Update flags
-            if ax < imm16:
-                self.EFLAGS |= FLAG_CF
-            else:
-                self.EFLAGS &= ~FLAG_CF
-            if result == 0:
-                self.EFLAGS |= FLAG_ZF
-            else:
-                self.EFLAGS &= ~FLAG_ZF
-            if (result & 0x8000) != 0:
-                self.EFLAGS |= FLAG_SF
-            else:
-                self.EFLAGS &= ~FLAG_SF
-            sign_ax = (ax & 0x8000) != 0
-            sign_imm = (imm16 & 0x8000) != 0
-            sign_res = (result & 0x8000) != 0
-            if (sign_ax != sign_imm) and (sign_ax != sign_res):
-                self.EFLAGS |= FLAG_OF
-            else:
-                self.EFLAGS &= ~FLAG_OF
-
-        elif (op >= 0x70 and op <= 0x7F):
-            self.jcc_short(op)
-
-        elif op == 0xE2:
-            disp8 = self.fetch8()
-            cx = self.ECX & 0xFFFF
-            cx = (cx - 1) & 0xFFFF
-            self.ECX = (self.ECX & 0xFFFF0000) | cx
-            if cx != 0:
-                signed_disp = disp8 if disp8 < 0x80 else disp8 - 0x100
-                self.EIP = (self.EIP + signed_disp) & 0xFFFF
-
-        elif op == 0xAA:  # STOSB
-            es_val = self.ES
-            di = self.EDI & 0xFFFF
-            al = self.EAX & 0xFF
-            addr = self.real_mode_address(es_val, di)
-            self.mem.write8(addr, al)
-            if (self.EFLAGS & FLAG_DF) != 0:
-                di = (di - 1) & 0xFFFF
-            else:
-                di = (di + 1) & 0xFFFF
-            self.EDI = (self.EDI & 0xFFFF0000) | di
-
-        elif op == 0xAC:  # LODSB
-            ds_val = self.DS
-            si = self.ESI & 0xFFFF
-            addr = self.real_mode_address(ds_val, si)
-            data = self.mem.read8(addr)
-            self.EAX = (self.EAX & 0xFFFFFF00) | data
-            if (self.EFLAGS & FLAG_DF) != 0:
-                si = (si - 1) & 0xFFFF
-            else:
-                si = (si + 1) & 0xFFFF
-            self.ESI = (self.ESI & 0xFFFF0000) | si
-
-        elif op == 0xF3:  # REP prefix
-            next_op = self.fetch8()
-            if next_op == 0xA4:  # REP MOVSB
-                self.rep_movsb()
-            elif next_op == 0xA5:  # REP MOVSW
-                self.rep_movsw()
-            elif next_op == 0xAA:  # REP STOSB
-                self.rep_stosb()
-            else:
-                raise Exception("REP prefix used with unimplemented instruction 0x%02X" % next_op)
+        ip = self.EIP
+        base = self.seg_base[SEG_CS]
+        ins = self.decode_cache.get(base + ip)
+        if ins is None:
+            ins = self.decoder.decode(base, ip)
+        handler = DISPATCH[ins.op]
+        if handler is None:
+            raise Exception(f"Unimplemented opcode 0x{ins.op:02X} at CS:IP={self.CS:04X}:{ip & 0xFFFF:04X}")
+        self.EIP = (ip + ins.length) & 0xFFFF
+        self.instret += 1
+        handler(self, ins)
+
+    def run(self, count):
+        """count 스텝 실행. 블록 컴파일러를 켜면 그쪽 run 으로 바꿔 끼운다."""
+        step = self.step
+        for _ in range(count):
+            step()
+
+    def enable_block_compiler(self, compiler):
+        self.block_compiler = compiler
+        self.run = compiler.run
+
+    def disable_block_compiler(self):
+        """인터프리터로만 실행 (컴파일된 블록은 버린다)."""
+        if self.block_compiler is not None:
+            self.block_compiler.flush()
+        self.block_compiler = None
+        self.__dict__.pop("run", None)
+
+    def enable_trace(self, ring):
+        """트레이스를 켜면 step 을 기록하는 버전으로 바꿔 끼운다. 끄면 원래 step 그대로."""
+        self.trace = ring
+        self.step = self._step_traced
+
+    def disable_trace(self):
+        self.trace = None
+        self.__dict__.pop("step", None)
+
+    def _step_traced(self):
+        trace = self.trace
+        if (self.EFLAGS & FLAG_IF) != 0:
+            pending_int = self.ic.get_pending_interrupt()
+            if pending_int is not None:
+                trace.record(self, TRACE_OP_IRQ | pending_int)
+                self.halted = False
+                self.handle_interrupt(pending_int)
+                return
+        if self.halted:
+            return
+
+        ip = self.EIP
+        base = self.seg_base[SEG_CS]
+        ins = self.decode_cache.get(base + ip)
+        if ins is None:
+            ins = self.decoder.decode(base, ip)
+        trace.record(self, ins.op)
+        handler = DISPATCH[ins.op]
+        if handler is None:
+            raise Exception(f"Unimplemented opcode 0x{ins.op:02X} at CS:IP={self.CS:04X}:{ip & 0xFFFF:04X}")
+        self.EIP = (ip + ins.length) & 0xFFFF
+        self.instret += 1
+        handler(self, ins)
+
+    # ------------------------------------------------------------
+    # opcode 핸들러: handler(cpu, ins) - EIP 는 이미 다음 명령어를 가리킨다
+    # ------------------------------------------------------------
+    def _require_opsize16(self, ins):
+        """0x66 접두어(32비트 오퍼랜드)를 아직 구현하지 않은 명령어: 잘라서 실행하지 않고 멈춘다"""
+        if ins.opsize == 32:
+            raise Exception(f"Unimplemented opcode 0x66 0x{ins.op:02X} (32-bit operand) at "
+                            f"{self.CS:04X}:{ins.addr & 0xFFFF:04X}")
+
+    def op_jmp_far(self, ins):
+        self._require_opsize16(ins)
+        self.CS = ins.imm2
+        self.EIP = ins.imm
+
+    def op_int(self, ins):
+        self.handle_interrupt(ins.imm)
+
+    def op_nop(self, ins):
+        pass
+
+    def op_mov_r16_imm16(self, ins):  # MOV r16/r32, imm16/imm32
+        if ins.opsize == 32:
+            self.set_reg32(ins.op & 0x07, ins.imm)
+        else:
+            self.set_reg16(ins.op & 0x07, ins.imm)
+
+    def op_mov_r8_imm8(self, ins):    # MOV r8, imm8
+        self.set_reg8(ins.op & 0x07, ins.imm)
+
+    def op_jmp_rel(self, ins):        # JMP rel8 / rel16
+        self.EIP = (self.EIP + ins.imm) & 0xFFFF
+
+    def op_hlt(self, ins):
+        self.halted = True
+
+    def op_cli(self, ins):
+        self.set_flag_if(False)
+
+    def op_sti(self, ins):
+        self.set_flag_if(True)
+
+    def op_retf(self, ins):           # RETF / RETF imm16
+        self._require_opsize16(ins)
+        self.EIP = self.pop16()
+        self.CS = self.pop16()
+        if ins.op == 0xCA:
+            self.ESP = (self.ESP & 0xFFFF0000) | ((self.ESP + ins.imm) & 0xFFFF)
+
+    def op_iret(self, ins):
+        self._require_opsize16(ins)
+        self.EIP = self.pop16()
+        self.CS = self.pop16()
+        self.EFLAGS = (self.EFLAGS & 0xFFFF0000) | (self.pop16() & 0x7FD5) | 0x0002
+
+    def op_bios_call(self, ins):
+        """
+        BIOS ROM 스텁의 에뮬레이터 전용 트랩(0F FF nn).
+        파이썬 BIOS 서비스를 호출한다. 스텁은 이어서 RETF 2 로 돌아가므로
+        INT 가 저장한 FLAGS 의 IF 를 먼저 복원한다.
+        """
+        handler = self.bios_traps.get(ins.imm)
+        if handler is None:
+            raise Exception(f"No BIOS service for INT {ins.imm:02X}h")
+        saved_flags = self.mem.read16(self.seg_address(SEG_SS, self.ESP + 4))
+        self.set_flag_if((saved_flags & FLAG_IF) != 0)
+        handler(self)
+
+    def op_call_rel16(self, ins):
+        self._require_opsize16(ins)
+        next_ip = self.EIP
+        self.push16(next_ip)
+        self.EIP = (self.EIP + ins.imm) & 0xFFFF
+
+    def op_ret(self, ins):
+        self._require_opsize16(ins)
+        ret_ip = self.pop16()
+        self.EIP = ret_ip
+
+    def op_push_r16(self, ins):  # PUSH r16/r32
+        if ins.opsize == 32:
+            self.push32(self.get_reg32(ins.op & 0x07))
+        else:
+            self.push16(self.get_reg16(ins.op & 0x07))
+
+    def op_pop_r16(self, ins):  # POP r16/r32
+        if ins.opsize == 32:
+            self.set_reg32(ins.op & 0x07, self.pop32())
+        else:
+            self.set_reg16(ins.op & 0x07, self.pop16())
+
+    def op_loop(self, ins):
+        cx = self.ECX & 0xFFFF
+        cx = (cx - 1) & 0xFFFF
+        self.ECX = (self.ECX & 0xFFFF0000) | cx
+        if cx != 0:
+            self.EIP = (self.EIP + ins.imm) & 0xFFFF
+
+    def op_movsb(self, ins):
+        if not ins.rep:
+            raise Exception(f"Unimplemented opcode 0x{ins.op:02X} without REP")
+        self.rep_movsb(self.seg_override(SEG_DS, ins))
+
+    def op_movsw(self, ins):
+        self._require_opsize16(ins)
+        if not ins.rep:
+            raise Exception(f"Unimplemented opcode 0x{ins.op:02X} without REP")
+        self.rep_movsw(self.seg_override(SEG_DS, ins))
+
+    def op_stosb(self, ins):  # STOSB
+        if ins.rep:
+            self.rep_stosb()
+            return
+        di = self.EDI & 0xFFFF
+        al = self.EAX & 0xFF
+        addr = self.seg_base[SEG_ES] + di
+        self.mem.write8(addr, al)
+        if (self.EFLAGS & FLAG_DF) != 0:
+            di = (di - 1) & 0xFFFF
+        else:
+            di = (di + 1) & 0xFFFF
+        self.EDI = (self.EDI & 0xFFFF0000) | di
+
+    def op_lodsb(self, ins):  # LODSB
+        if ins.rep:
+            raise Exception("REP prefix used with unimplemented instruction 0x%02X" % ins.op)
+        si = self.ESI & 0xFFFF
+        addr = self.seg_base[self.seg_override(SEG_DS, ins)] + si
+        data = self.mem.read8(addr)
+        self.EAX = (self.EAX & 0xFFFFFF00) | data
+        if (self.EFLAGS & FLAG_DF) != 0:
+            si = (si - 1) & 0xFFFF
+        else:
+            si = (si + 1) & 0xFFFF
+        self.ESI = (self.ESI & 0xFFFF0000) | si
+
+    # ------------------------------------------------------------
+    # 포트 I/O: 버스의 평면 핸들러 테이블을 직접 사용
+    # ------------------------------------------------------------
+    def _port_in(self, port, ins):
+        if (ins.op & 1) == 0:
+            self.EAX = (self.EAX & 0xFFFFFF00) | (self.bus.read8_table[port](port) & 0xFF)
+        elif ins.opsize == 32:
+            self.EAX = self.bus.io_in32(port)
+        else:
+            self.EAX = (self.EAX & 0xFFFF0000) | self.bus.io_in16(port)
+
+    def _port_out(self, port, ins):
+        if (ins.op & 1) == 0:
+            self.bus.write8_table[port](port, self.EAX & 0xFF)
+        elif ins.opsize == 32:
+            self.bus.io_out32(port, self.EAX)
+        else:
+            self.bus.io_out16(port, self.EAX & 0xFFFF)
+
+    def op_in_imm(self, ins):   # IN AL/AX, imm8
+        self._port_in(ins.imm, ins)
+
+    def op_in_dx(self, ins):    # IN AL/AX, DX
+        self._port_in(self.EDX & 0xFFFF, ins)
+
+    def op_out_imm(self, ins):  # OUT imm8, AL/AX
+        self._port_out(ins.imm, ins)
+
+    def op_out_dx(self, ins):   # OUT DX, AL/AX
+        self._port_out(self.EDX & 0xFFFF, ins)
+
+    def _string_io_count(self, ins):
+        """REP 이면 CX 전체를 한 번에 처리하고 CX=0, 아니면 1회."""
+        if not ins.rep:
+            return 1
+        count = self.ECX & 0xFFFF
+        self.ECX &= 0xFFFF0000
+        return count
+
+    def op_ins(self, ins):      # INSB / INSW (REP 가능)
+        width = 1 if ins.op == 0x6C else (4 if ins.opsize == 32 else 2)
+        count = self._string_io_count(ins)
+        if count == 0:
+            return
+        total = width * count
+        data = self.bus.io_read_block(self.EDX & 0xFFFF, width, count)
+        di = self.EDI & 0xFFFF
+        if (self.EFLAGS & FLAG_DF) == 0 and di + total <= 0x10000:
+            # 세그먼트 안에서 연속 → 블록 복사 한 번
+            self.mem.write_block(self.seg_base[SEG_ES] + di, data)
+            di = (di + total) & 0xFFFF
+        else:
+            step = -width if (self.EFLAGS & FLAG_DF) != 0 else width
+            for i in range(0, total, width):
+                for j in range(width):
+                    self.mem.write8(self.seg_address(SEG_ES, di + j), data[i + j])
+                di = (di + step) & 0xFFFF
+        self.EDI = (self.EDI & 0xFFFF0000) | di
+
+    def op_outs(self, ins):     # OUTSB / OUTSW (REP 가능)
+        width = 1 if ins.op == 0x6E else (4 if ins.opsize == 32 else 2)
+        count = self._string_io_count(ins)
+        if count == 0:
+            return
+        total = width * count
+        si = self.ESI & 0xFFFF
+        src_seg = self.seg_override(SEG_DS, ins)
+        if (self.EFLAGS & FLAG_DF) == 0 and si + total <= 0x10000:
+            data = self.mem.read_block(self.seg_base[src_seg] + si, total)
+            si = (si + total) & 0xFFFF
+        else:
+            step = -width if (self.EFLAGS & FLAG_DF) != 0 else width
+            buf = bytearray()
+            for _ in range(count):
+                for j in range(width):
+                    buf.append(self.mem.read8(self.seg_address(src_seg, si + j)))
+                si = (si + step) & 0xFFFF
+            data = bytes(buf)
+        self.bus.io_write_block(self.EDX & 0xFFFF, width, data)
+        self.ESI = (self.ESI & 0xFFFF0000) | si
+
+    def mov_r16_rm16(self, ins):      # MOV Gv, Ev
+        w = W32 if ins.opsize == 32 else W16
+        w.set_reg(self, ins.reg, self.read_rm(ins, w))
+
+    def mov_rm16_r16(self, ins):      # MOV Ev, Gv
+        w = W32 if ins.opsize == 32 else W16
+        reg_val = w.get_reg(self, ins.reg)
+        if ins.mod == 3:
+            w.set_reg(self, ins.rm, reg_val)
+        else:
+            w.write(self.mem, self.modrm_linear(ins), reg_val)
+
+    def modrm_linear(self, ins):
+        """
+        메모리 오퍼랜드의 선형 주소. 디코더가 ModR/M 표(decoder.MODRM16)에서 골라 둔
+        오프셋 함수와 세그먼트(오버라이드, 없으면 BP 기준 형식은 SS, 나머지는 DS)를 쓴다.
+        """
+        return self.seg_base[ins.ea_seg] + ins.ea(self, ins.disp)
+
+    def read_ew(self, ins):
+        if ins.mod == 3:
+            return self.get_reg16(ins.rm)
+        return self.mem.read16(self.modrm_linear(ins))
+
+    def write_ew(self, ins, val):
+        if ins.mod == 3:
+            self.set_reg16(ins.rm, val)
+        else:
+            self.mem.write16(self.modrm_linear(ins), val & 0xFFFF)
+
+    # ------------------------------------------------------------
+    # ALU: 연산은 모듈 끝의 ALU_OPS/INCDEC_OPS/SHIFT_OPS 표에서 고르고
+    # 00~3F 의 형식별 핸들러는 _alu_family 가 만든다. w 는 연산 크기(W8/W16/W32).
+    # ------------------------------------------------------------
+    def read_rm(self, ins, w):
+        if ins.mod == 3:
+            return w.get_reg(self, ins.rm)
+        return w.read(self.mem, self.modrm_linear(ins))
+
+    def alu_rm(self, ins, w, fn, src, writes):
+        """r/m 오퍼랜드에 fn(cpu, r/m 값, src, w) 을 적용하고 writes 면 결과를 되돌려 쓴다."""
+        if ins.mod == 3:
+            res = fn(self, w.get_reg(self, ins.rm), src, w)
+            if writes:
+                w.set_reg(self, ins.rm, res)
         else:
-            raise Exception(f"Unimplemented opcode 0x{op:02X} at CS:IP={self.CS:04X}:{(self.EIP-1) & 0xFFFF:04X}")
-
-    def mov_r16_rm16(self):
-        modrm = self.fetch8()
-        reg_id = (modrm >> 3) & 7
-        rm_id  = modrm & 7
-        mod    = (modrm >> 6) & 3
-        if mod == 3:
-            rm_val = self.get_reg16(rm_id)
-            self.set_reg16(reg_id, rm_val)
+            addr = self.modrm_linear(ins)
+            res = fn(self, w.read(self.mem, addr), src, w)
+            if writes:
+                w.write(self.mem, addr, res)
+
+    def op_alu_group(self, ins):     # 80~83: ADD/OR/ADC/SBB/AND/SUB/XOR/CMP Eb/Ev, Ib/Iv/Ibs
+        w = W8 if not ins.op & 1 else W32 if ins.opsize == 32 else W16
+        fn, writes = ALU_FNS[ins.reg]
+        self.alu_rm(ins, w, fn, ins.imm & w.mask, writes)
+
+    def op_incdec_r(self, ins):      # 40~4F: INC/DEC r16/r32
+        w = W32 if ins.opsize == 32 else W16
+        r = ins.op & 7
+        w.set_reg(self, r, INCDEC_FNS[(ins.op >> 3) & 1](self, w.get_reg(self, r), 1, w))
+
+    def op_group_fe(self, ins):      # FE/FF /0 /1: INC/DEC Eb/Ev
+        if ins.reg > 1:
+            raise Exception(f"Unimplemented opcode 0x{ins.op:02X} /{ins.reg} at "
+                            f"{self.CS:04X}:{ins.addr & 0xFFFF:04X}")
+        w = W8 if ins.op == 0xFE else W32 if ins.opsize == 32 else W16
+        self.alu_rm(ins, w, INCDEC_FNS[ins.reg], 1, True)
+
+    def op_shift_group(self, ins):   # C0/C1/D0~D3: ROL/ROR/RCL/RCR/SHL/SHR/SAR Eb/Ev, Ib/1/CL
+        op = ins.op
+        if op >= 0xD2:
+            count = self.ECX & 0x1F
+        elif op >= 0xD0:
+            count = 1
+        else:
+            count = ins.imm & 0x1F
+        # 횟수가 0 이면 결과도 플래그도 그대로다
+        if count:
+            w = W8 if not op & 1 else W32 if ins.opsize == 32 else W16
+            self.alu_rm(ins, w, SHIFT_OPS[ins.reg], count, True)
+
+    # ------------------------------------------------------------
+    # 세그먼트 레지스터 / 시스템 명령
+    # ------------------------------------------------------------
+    def op_mov_sreg_rm(self, ins):   # MOV Sreg, Ew
+        if ins.reg == SEG_CS or ins.reg > SEG_GS:
+            raise Exception(f"#UD: MOV to sreg {ins.reg} at {self.CS:04X}:{ins.addr & 0xFFFF:04X}")
+        self.load_segment(ins.reg, self.read_ew(ins))
+
+    def op_mov_rm_sreg(self, ins):   # MOV Ew, Sreg
+        if ins.reg > SEG_GS:
+            raise Exception(f"#UD: MOV from sreg {ins.reg}")
+        self.write_ew(ins, self.sreg[ins.reg])
+
+    def op_push_sreg(self, ins):     # PUSH ES/CS/SS/DS/FS/GS
+        self._require_opsize16(ins)
+        self.push16(self.sreg[_SREG_OF_OP[ins.op]])
+
+    def op_pop_sreg(self, ins):      # POP ES/SS/DS/FS/GS
+        self._require_opsize16(ins)
+        self.load_segment(_SREG_OF_OP[ins.op], self.pop16())
+
+    def op_group_0f00(self, ins):    # SLDT / LLDT
+        if ins.reg == 0:
+            self.write_ew(ins, self.ldtr)
+        elif ins.reg == 2:
+            selector = self.read_ew(ins)
+            if selector & 0xFFFC:
+                base, limit, _ = self.read_descriptor(selector & ~4)
+            else:
+                base, limit = 0, 0
+            self.ldtr = selector
+            self.ldtr_base = base
+            self.ldtr_limit = limit
         else:
-            offset = self.calc_modrm16_address(mod, rm_id)
-            seg = self.seg_override(self.DS)
-            val16 = self.read_rm16(seg, offset)
-            self.set_reg16(reg_id, val16)
-
-    def mov_rm16_r16(self):
-        modrm = self.fetch8()
-        reg_id = (modrm >> 3) & 7
-        rm_id  = modrm & 7
-        mod    = (modrm >> 6) & 3
-        reg_val = self.get_reg16(reg_id)
-        if mod == 3:
-            self.set_reg16(rm_id, reg_val)
+            raise Exception(f"Unimplemented 0F 00 /{ins.reg} at {self.CS:04X}:{ins.addr & 0xFFFF:04X}")
+
+    def op_group_0f01(self, ins):    # SGDT / SIDT / LGDT / LIDT / SMSW / LMSW / INVLPG
+        reg = ins.reg
+        if reg == 4:                 # SMSW
+            self.write_ew(ins, self.CR0)
+            return
+        if reg == 6:                 # LMSW: PE 는 켤 수만 있다
+            msw = self.read_ew(ins) & 0xF
+            self.set_control_register(0, (self.CR0 & ~0xE) | msw | (self.CR0 & CR0_PE))
+            return
+        if reg == 7 and ins.mod != 3:  # INVLPG m
+            self.invlpg(self.modrm_linear(ins))
+            return
+        if ins.mod == 3 or reg > 3:
+            raise Exception(f"Unimplemented 0F 01 /{reg} at {self.CS:04X}:{ins.addr & 0xFFFF:04X}")
+        addr = self.modrm_linear(ins)
+        base_mask = 0xFFFFFFFF if ins.opsize == 32 else 0x00FFFFFF
+        if reg == 0:
+            self.mem.write16(addr, self.gdtr_limit)
+            self.mem.write32(addr + 2, self.gdtr_base & base_mask)
+        elif reg == 1:
+            self.mem.write16(addr, self.idtr_limit)
+            self.mem.write32(addr + 2, self.idtr_base & base_mask)
+        elif reg == 2:
+            self.gdtr_limit = self.mem.read16(addr)
+            self.gdtr_base = self.mem.read32(addr + 2) & base_mask
         else:
-            offset = self.calc_modrm16_address(mod, rm_id)
-            seg = self.seg_override(self.DS)
-            self.write_rm16(seg, offset, reg_val)
+            self.idtr_limit = self.mem.read16(addr)
+            self.idtr_base = self.mem.read32(addr + 2) & base_mask
+
+    def op_mov_r32_cr(self, ins):    # MOV r32, CRn
+        if ins.reg not in (0, 2, 3, 4):
+            raise Exception(f"#UD: MOV from CR{ins.reg}")
+        self.set_reg32(ins.rm, getattr(self, f"CR{ins.reg}"))
+
+    def op_mov_cr_r32(self, ins):    # MOV CRn, r32
+        self.set_control_register(ins.reg, self.get_reg32(ins.rm))
+
+    def get_reg32(self, reg_id):
+        return getattr(self, _REG32[reg_id])
+
+    def set_reg32(self, reg_id, val):
+        setattr(self, _REG32[reg_id], val & 0xFFFFFFFF)
 
     def get_reg16(self, reg_id):
         if reg_id == 0: return self.EAX & 0xFFFF
@@ -264,78 +700,64 @@ class CPU:
         elif reg_id == 6: self.ESI = (self.ESI & 0xFFFF0000) | (val & 0xFFFF)
         elif reg_id == 7: self.EDI = (self.EDI & 0xFFFF0000) | (val & 0xFFFF)
 
-    def calc_modrm16_address(self, mod, rm):
-        disp = 0
-        if mod == 0:
-            if rm == 6:
-                disp = self.fetch16()
-                return disp
-        elif mod == 1:
-            disp = self.fetch8()
-            if disp >= 0x80:
-                disp -= 0x100
-        elif mod == 2:
-            disp = self.fetch16()
-        base = 0
-        bx = self.EBX & 0xFFFF
-        si = self.ESI & 0xFFFF
-        di = self.EDI & 0xFFFF
-        bp = self.EBP & 0xFFFF
-        if rm == 0: base = (bx + si + disp) & 0xFFFF
-        elif rm == 1: base = (bx + di + disp) & 0xFFFF
-        elif rm == 2: base = (bp + si + disp) & 0xFFFF
-        elif rm == 3: base = (bp + di + disp) & 0xFFFF
-        elif rm == 4: base = (si + disp) & 0xFFFF
-        elif rm == 5: base = (di + disp) & 0xFFFF
-        elif rm == 6: base = (bp + disp) & 0xFFFF
-        elif rm == 7: base = (bx + disp) & 0xFFFF
-        return base & 0xFFFF
+    def get_reg8(self, reg_id):
+        """0~3: AL CL DL BL, 4~7: AH CH DH BH"""
+        if reg_id < 4:
+            return getattr(self, _REG32[reg_id]) & 0xFF
+        return (getattr(self, _REG32[reg_id - 4]) >> 8) & 0xFF
+
+    def set_reg8(self, reg_id, val):
+        """0~3: AL CL DL BL, 4~7: AH CH DH BH"""
+        val &= 0xFF
+        if reg_id == 0: self.EAX = (self.EAX & 0xFFFFFF00) | val
+        elif reg_id == 1: self.ECX = (self.ECX & 0xFFFFFF00) | val
+        elif reg_id == 2: self.EDX = (self.EDX & 0xFFFFFF00) | val
+        elif reg_id == 3: self.EBX = (self.EBX & 0xFFFFFF00) | val
+        elif reg_id == 4: self.EAX = (self.EAX & 0xFFFF00FF) | (val << 8)
+        elif reg_id == 5: self.ECX = (self.ECX & 0xFFFF00FF) | (val << 8)
+        elif reg_id == 6: self.EDX = (self.EDX & 0xFFFF00FF) | (val << 8)
+        elif reg_id == 7: self.EBX = (self.EBX & 0xFFFF00FF) | (val << 8)
 
     def push16(self, val):
         sp = self.ESP & 0xFFFF
         sp = (sp - 2) & 0xFFFF
         self.ESP = (self.ESP & 0xFFFF0000) | sp
-        addr = self.real_mode_address(self.SS, sp)
+        addr = self.seg_base[SEG_SS] + sp
         self.mem.write16(addr, val & 0xFFFF)
 
     def pop16(self):
         sp = self.ESP & 0xFFFF
-        addr = self.real_mode_address(self.SS, sp)
+        addr = self.seg_base[SEG_SS] + sp
         val = self.mem.read16(addr)
         sp = (sp + 2) & 0xFFFF
         self.ESP = (self.ESP & 0xFFFF0000) | sp
         return val
 
-    def jcc_short(self, op):
-        disp8 = self.fetch8()
-        signed_disp = disp8 if disp8 < 0x80 else disp8 - 0x100
-        cond = False
-        if op == 0x70:  # JO
-            cond = (self.EFLAGS & FLAG_OF) != 0
-        elif op == 0x71:  # JNO
-            cond = (self.EFLAGS & FLAG_OF) == 0
-        elif op == 0x72:  # JB/JC
-            cond = (self.EFLAGS & FLAG_CF) != 0
-        elif op == 0x73:  # JNB/JNC
-            cond = (self.EFLAGS & FLAG_CF) == 0
-        elif op == 0x74:  # JZ/JE
-            cond = (self.EFLAGS & FLAG_ZF) != 0
-        elif op == 0x75:  # JNZ/JNE
-            cond = (self.EFLAGS & FLAG_ZF) == 0
-        # You can add more here if needed
-        if cond:
-            self.EIP = (self.EIP + signed_disp) & 0xFFFF
-
-    def rep_movsb(self):
+    def push32(self, val):
+        sp = (self.ESP - 4) & 0xFFFF
+        self.ESP = (self.ESP & 0xFFFF0000) | sp
+        self.mem.write32(self.seg_base[SEG_SS] + sp, val & 0xFFFFFFFF)
+
+    def pop32(self):
+        sp = self.ESP & 0xFFFF
+        val = self.mem.read32(self.seg_base[SEG_SS] + sp)
+        self.ESP = (self.ESP & 0xFFFF0000) | ((sp + 4) & 0xFFFF)
+        return val
+
+    def jcc_short(self, ins):
+        if CONDITION_FNS[ins.op & 0xF](self.EFLAGS):
+            self.EIP = (self.EIP + ins.imm) & 0xFFFF
+
+    def rep_movsb(self, src_seg=SEG_DS):
         cx = self.ECX & 0xFFFF
-        ds = self.DS
-        es = self.ES
+        ds = self.seg_base[src_seg]
+        es = self.seg_base[SEG_ES]
         si = self.ESI & 0xFFFF
         di = self.EDI & 0xFFFF
         inc = -1 if ((self.EFLAGS & FLAG_DF) != 0) else 1
         while cx > 0:
-            src = self.real_mode_address(ds, si)
-            dst = self.real_mode_address(es, di)
+            src = ds + si
+            dst = es + di
             val = self.mem.read8(src)
             self.mem.write8(dst, val)
             si = (si + inc) & 0xFFFF
@@ -345,16 +767,16 @@ class CPU:
         self.ESI = (self.ESI & 0xFFFF0000) | (si & 0xFFFF)
         self.EDI = (self.EDI & 0xFFFF0000) | (di & 0xFFFF)
 
-    def rep_movsw(self):
+    def rep_movsw(self, src_seg=SEG_DS):
         cx = self.ECX & 0xFFFF
-        ds = self.DS
-        es = self.ES
+        ds = self.seg_base[src_seg]
+        es = self.seg_base[SEG_ES]
         si = self.ESI & 0xFFFF
         di = self.EDI & 0xFFFF
         inc = -2 if ((self.EFLAGS & FLAG_DF) != 0) else 2
         while cx > 0:
-            src = self.real_mode_address(ds, si)
-            dst = self.real_mode_address(es, di)
+            src = ds + si
+            dst = es + di
             val = self.mem.read16(src)
             self.mem.write16(dst, val)
             si = (si + inc) & 0xFFFF
@@ -366,29 +788,18 @@ class CPU:
 
     def rep_stosb(self):
         cx = self.ECX & 0xFFFF
-        es = self.ES
+        es = self.seg_base[SEG_ES]
         di = self.EDI & 0xFFFF
         inc = -1 if ((self.EFLAGS & FLAG_DF) != 0) else 1
         al = self.EAX & 0xFF
         while cx > 0:
-            dst = self.real_mode_address(es, di)
+            dst = es + di
             self.mem.write8(dst, al)
             di = (di + inc) & 0xFFFF
             cx -= 1
         self.ECX = (self.ECX & 0xFFFF0000) | (cx & 0xFFFF)
         self.EDI = (self.EDI & 0xFFFF0000) | di
 
-    def fetch8(self):
-        addr = self.real_mode_address(self.CS, self.EIP)
-        val = self.mem.read8(addr)
-        self.EIP = (self.EIP + 1) & 0xFFFF
-        return val
-
-    def fetch16(self):
-        low = self.fetch8()
-        high = self.fetch8()
-        return (high << 8) | low
-
     def handle_interrupt(self, int_num):
         self.push16(self.EFLAGS & 0xFFFF)
         self.set_flag_if(False)
@@ -398,4 +809,292 @@ class CPU:
         new_ip = self.mem.read16(vector_addr)
         new_cs = self.mem.read16(vector_addr + 2)
         self.CS = new_cs
-        self.EIP = new_ip
\ No newline at end of file
+        self.EIP = new_ip
+
+
+_REG32 = ("EAX", "ECX", "EDX", "EBX", "ESP", "EBP", "ESI", "EDI")
+
+# PUSH/POP Sreg opcode -> 세그먼트 번호
+_SREG_OF_OP = {0x06: SEG_ES, 0x07: SEG_ES, 0x0E: SEG_CS, 0x16: SEG_SS, 0x17: SEG_SS,
+               0x1E: SEG_DS, 0x1F: SEG_DS, 0x1A0: SEG_FS, 0x1A1: SEG_FS,
+               0x1A8: SEG_GS, 0x1A9: SEG_GS}
+
+
+# ------------------------------------------------------------
+# ALU 명령어 묶음
+# 연산은 식 하나와 플래그 종류 하나로 적고, 크기(8/16/32)와 오퍼랜드 형식은
+# 공통 코드가 맡는다. 플래그 함수는 (이전 EFLAGS, a, b, full) -> 새 EFLAGS 인
+# 순수 함수라 블록 컴파일러가 만든 코드도 같은 함수를 부른다.
+# ------------------------------------------------------------
+FLAGS_ARITH = FLAG_CF | FLAG_PF | FLAG_AF | FLAG_ZF | FLAG_SF | FLAG_OF
+
+# 결과 하위 바이트 -> PF (1 의 개수가 짝수면 켠다)
+_PARITY = tuple(0 if bin(v).count("1") & 1 else FLAG_PF for v in range(256))
+
+
+class _Width:
+    """연산 크기: 비트 수/마스크/부호 비트와 레지스터·메모리 접근 함수"""
+
+    __slots__ = ("bits", "mask", "sign", "get_reg", "set_reg", "read", "write")
+
+    def __init__(self, bits, get_reg, set_reg, read, write):
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+        self.sign = 1 << (bits - 1)
+        self.get_reg = get_reg
+        self.set_reg = set_reg
+        self.read = read
+        self.write = write
+
+W8 = _Width(8, CPU.get_reg8, CPU.set_reg8,
+            lambda mem, addr: mem.read8(addr), lambda mem, addr, v: mem.write8(addr, v))
+W16 = _Width(16, CPU.get_reg16, CPU.set_reg16,
+             lambda mem, addr: mem.read16(addr), lambda mem, addr, v: mem.write16(addr, v))
+W32 = _Width(32, CPU.get_reg32, CPU.set_reg32,
+             lambda mem, addr: mem.read32(addr), lambda mem, addr, v: mem.write32(addr, v))
+
+
+def _szp(res, w):
+    return _PARITY[res & 0xFF] | (0 if res else FLAG_ZF) | ((res >> (w.bits - 8)) & FLAG_SF)
+
+def add_flags(flags, a, b, full, w):
+    """full = a + b (+CF). CF 는 자리올림, OF 는 같은 부호를 더해 부호가 바뀐 경우."""
+    res = full & w.mask
+    return ((flags & ~FLAGS_ARITH) | ((full >> w.bits) & 1) | _szp(res, w)
+            | ((a ^ b ^ res) & FLAG_AF) | (FLAG_OF if (a ^ res) & (b ^ res) & w.sign else 0))
+
+def sub_flags(flags, a, b, full, w):
+    """full = a - b (-CF). 빌림이 있으면 full 이 음수라 w.bits 위가 모두 1 이다."""
+    res = full & w.mask
+    return ((flags & ~FLAGS_ARITH) | ((full >> w.bits) & 1) | _szp(res, w)
+            | ((a ^ b ^ res) & FLAG_AF) | (FLAG_OF if (a ^ b) & (a ^ res) & w.sign else 0))
+
+def logic_flags(flags, a, b, full, w):
+    """AND/OR/XOR: CF/OF/AF 는 0"""
+    return (flags & ~FLAGS_ARITH) | _szp(full & w.mask, w)
+
+def inc_flags(flags, a, b, full, w):
+    """INC: ADD 와 같지만 CF 는 그대로"""
+    return (add_flags(flags, a, b, full, w) & ~FLAG_CF) | (flags & FLAG_CF)
+
+def dec_flags(flags, a, b, full, w):
+    return (sub_flags(flags, a, b, full, w) & ~FLAG_CF) | (flags & FLAG_CF)
+
+FLAG_FNS = {"add": add_flags, "sub": sub_flags, "logic": logic_flags,
+            "inc": inc_flags, "dec": dec_flags}
+
+# (결과 식, 플래그 종류, 결과를 쓰는가). 식은 a(대상), b(원본), c(들어오는 CF) 로 쓴다.
+# 순서는 00~3F 의 opcode >> 3, 80~83 그룹의 reg 필드 (decoder._ALU 와 같다)
+ALU_OPS = (
+    ("a + b", "add", True),        # ADD
+    ("a | b", "logic", True),      # OR
+    ("a + b + c", "add", True),    # ADC
+    ("a - b - c", "sub", True),    # SBB
+    ("a & b", "logic", True),      # AND
+    ("a - b", "sub", True),        # SUB
+    ("a ^ b", "logic", True),      # XOR
+    ("a - b", "sub", False),       # CMP
+)
+# 40~4F / FE·FF 그룹의 INC(0), DEC(1). b 는 항상 1
+INCDEC_OPS = (
+    ("a + b", "inc", True),
+    ("a - b", "dec", True),
+)
+
+def _alu_function(expr, kind):
+    """표의 항목 하나 -> fn(cpu, a, b, w): 결과(w.mask 안)를 돌려주고 EFLAGS 를 갱신한다"""
+    compute = eval(f"lambda a, b, c: {expr}")
+    flags_fn = FLAG_FNS[kind]
+
+    def alu(cpu, a, b, w):
+        flags = cpu.EFLAGS
+        full = compute(a, b, flags & FLAG_CF)
+        cpu.EFLAGS = flags_fn(flags, a, b, full, w)
+        return full & w.mask
+    return alu
+
+ALU_FNS = tuple((_alu_function(expr, kind), writes) for expr, kind, writes in ALU_OPS)
+INCDEC_FNS = tuple(_alu_function(expr, kind) for expr, kind, _ in INCDEC_OPS)
+
+
+# 시프트/회전: fn(cpu, a, n, w), n 은 1~31 (0 은 핸들러가 거른다).
+# 8/16비트 회전은 횟수를 크기로 나눈 나머지만큼 돌린다. 여러 비트일 때 OF 는 정의되지 않지만
+# 1비트일 때의 식을 그대로 쓴다.
+def _shift_rol(cpu, a, n, w):
+    bits = w.bits
+    n %= bits
+    res = ((a << n) | (a >> (bits - n))) & w.mask
+    cf = res & 1
+    cpu.EFLAGS = ((cpu.EFLAGS & ~(FLAG_CF | FLAG_OF)) | cf
+                  | (FLAG_OF if (res >> (bits - 1)) ^ cf else 0))
+    return res
+
+def _shift_ror(cpu, a, n, w):
+    bits = w.bits
+    n %= bits
+    res = ((a >> n) | (a << (bits - n))) & w.mask
+    cf = res >> (bits - 1)
+    cpu.EFLAGS = ((cpu.EFLAGS & ~(FLAG_CF | FLAG_OF)) | cf
+                  | (FLAG_OF if cf ^ ((res >> (bits - 2)) & 1) else 0))
+    return res
+
+def _shift_rcl(cpu, a, n, w):
+    bits = w.bits
+    n %= bits + 1
+    if not n:
+        return a
+    v = a | ((cpu.EFLAGS & FLAG_CF) << bits)
+    v = (v << n) | (v >> (bits + 1 - n))
+    res = v & w.mask
+    cf = (v >> bits) & 1
+    cpu.EFLAGS = ((cpu.EFLAGS & ~(FLAG_CF | FLAG_OF)) | cf
+                  | (FLAG_OF if cf ^ (res >> (bits - 1)) else 0))
+    return res
+
+def _shift_rcr(cpu, a, n, w):
+    bits = w.bits
+    n %= bits + 1
+    if not n:
+        return a
+    v = a | ((cpu.EFLAGS & FLAG_CF) << bits)
+    v = (v >> n) | (v << (bits + 1 - n))
+    res = v & w.mask
+    cf = (v >> bits) & 1
+    cpu.EFLAGS = ((cpu.EFLAGS & ~(FLAG_CF | FLAG_OF)) | cf
+                  | (FLAG_OF if ((res >> (bits - 1)) ^ (res >> (bits - 2))) & 1 else 0))
+    return res
+
+def _shift_shl(cpu, a, n, w):
+    full = a << n
+    res = full & w.mask
+    cf = (full >> w.bits) & 1
+    cpu.EFLAGS = (logic_flags(cpu.EFLAGS, a, n, res, w) | cf
+                  | (FLAG_OF if cf ^ (res >> (w.bits - 1)) else 0))
+    return res
+
+def _shift_shr(cpu, a, n, w):
+    res = a >> n
+    cpu.EFLAGS = (logic_flags(cpu.EFLAGS, a, n, res, w) | ((a >> (n - 1)) & 1)
+                  | (FLAG_OF if a & w.sign else 0))
+    return res
+
+def _shift_sar(cpu, a, n, w):
+    signed = a - (w.mask + 1) if a & w.sign else a
+    res = (signed >> n) & w.mask
+    cpu.EFLAGS = logic_flags(cpu.EFLAGS, a, n, res, w) | ((signed >> (n - 1)) & 1)
+    return res
+
+# C0/C1/D0~D3 그룹의 reg 필드 순서 (6 = SAL 은 SHL 과 같다)
+SHIFT_OPS = (_shift_rol, _shift_ror, _shift_rcl, _shift_rcr,
+             _shift_shl, _shift_shr, _shift_shl, _shift_sar)
+
+
+def _alu_family(fn, writes):
+    """ALU 연산 하나의 기본 형식 6개 (opcode 8n+0 ~ 8n+5) 핸들러"""
+    def eb_gb(cpu, ins):    # op Eb, Gb
+        cpu.alu_rm(ins, W8, fn, cpu.get_reg8(ins.reg), writes)
+
+    def ev_gv(cpu, ins):    # op Ev, Gv
+        w = W32 if ins.opsize == 32 else W16
+        cpu.alu_rm(ins, w, fn, w.get_reg(cpu, ins.reg), writes)
+
+    def gb_eb(cpu, ins):    # op Gb, Eb
+        res = fn(cpu, cpu.get_reg8(ins.reg), cpu.read_rm(ins, W8), W8)
+        if writes:
+            cpu.set_reg8(ins.reg, res)
+
+    def gv_ev(cpu, ins):    # op Gv, Ev
+        w = W32 if ins.opsize == 32 else W16
+        res = fn(cpu, w.get_reg(cpu, ins.reg), cpu.read_rm(ins, w), w)
+        if writes:
+            w.set_reg(cpu, ins.reg, res)
+
+    def al_ib(cpu, ins):    # op AL, imm8
+        res = fn(cpu, cpu.EAX & 0xFF, ins.imm, W8)
+        if writes:
+            cpu.EAX = (cpu.EAX & 0xFFFFFF00) | res
+
+    def eax_iv(cpu, ins):   # op AX/EAX, imm16/imm32
+        w = W32 if ins.opsize == 32 else W16
+        res = fn(cpu, cpu.EAX & w.mask, ins.imm, w)
+        if writes:
+            cpu.EAX = (cpu.EAX & ~w.mask & 0xFFFFFFFF) | res
+
+    return eb_gb, ev_gv, gb_eb, gv_ev, al_ib, eax_iv
+
+
+# Jcc/SETcc 조건 (opcode 하위 4비트 순서): f = EFLAGS 로 판정하는 식.
+# 인터프리터는 함수로, 블록 컴파일러는 식 그대로 쓴다.
+_SF_NE_OF = f"((f >> 7) ^ (f >> 11)) & 1"
+CONDITIONS = (
+    f"f & {FLAG_OF}", f"not f & {FLAG_OF}",                                  # O, NO
+    f"f & {FLAG_CF}", f"not f & {FLAG_CF}",                                  # B, AE
+    f"f & {FLAG_ZF}", f"not f & {FLAG_ZF}",                                  # E, NE
+    f"f & {FLAG_CF | FLAG_ZF}", f"not f & {FLAG_CF | FLAG_ZF}",              # BE, A
+    f"f & {FLAG_SF}", f"not f & {FLAG_SF}",                                  # S, NS
+    f"f & {FLAG_PF}", f"not f & {FLAG_PF}",                                  # P, NP
+    _SF_NE_OF, f"not {_SF_NE_OF}",                                           # L, GE
+    f"f & {FLAG_ZF} or {_SF_NE_OF}", f"not (f & {FLAG_ZF} or {_SF_NE_OF})",  # LE, G
+)
+CONDITION_FNS = tuple(eval(f"lambda f: {cond}") for cond in CONDITIONS)
+
+def _build_dispatch():
+    """opcode(0F xx 는 0x100|xx) -> 핸들러 테이블"""
+    table = [None] * 0x200
+    table[0xEA] = CPU.op_jmp_far
+    table[0xCD] = CPU.op_int
+    table[0x90] = CPU.op_nop
+    for op in range(0xB0, 0xB8):
+        table[op] = CPU.op_mov_r8_imm8
+    for op in range(0xB8, 0xC0):
+        table[op] = CPU.op_mov_r16_imm16
+    table[0xEB] = table[0xE9] = CPU.op_jmp_rel
+    table[0xF4] = CPU.op_hlt
+    table[0xFA] = CPU.op_cli
+    table[0xFB] = CPU.op_sti
+    table[0xCA] = table[0xCB] = CPU.op_retf
+    table[0xCF] = CPU.op_iret
+    table[0x1FF] = CPU.op_bios_call
+    for n, (fn, writes) in enumerate(ALU_FNS):
+        table[n * 8:n * 8 + 6] = _alu_family(fn, writes)
+    for op in range(0x80, 0x84):
+        table[op] = CPU.op_alu_group
+    for op in range(0x40, 0x50):
+        table[op] = CPU.op_incdec_r
+    table[0xFE] = table[0xFF] = CPU.op_group_fe
+    for op in (0xC0, 0xC1, 0xD0, 0xD1, 0xD2, 0xD3):
+        table[op] = CPU.op_shift_group
+    table[0xE8] = CPU.op_call_rel16
+    table[0xC3] = CPU.op_ret
+    table[0x8B] = CPU.mov_r16_rm16
+    table[0x89] = CPU.mov_rm16_r16
+    for op in range(0x50, 0x58):
+        table[op] = CPU.op_push_r16
+    for op in range(0x58, 0x60):
+        table[op] = CPU.op_pop_r16
+    for op in range(0x70, 0x80):
+        table[op] = CPU.jcc_short
+    table[0xE2] = CPU.op_loop
+    table[0xA4] = CPU.op_movsb
+    table[0xA5] = CPU.op_movsw
+    table[0xAA] = CPU.op_stosb
+    table[0xAC] = CPU.op_lodsb
+    table[0xE4] = table[0xE5] = CPU.op_in_imm
+    table[0xEC] = table[0xED] = CPU.op_in_dx
+    table[0xE6] = table[0xE7] = CPU.op_out_imm
+    table[0xEE] = table[0xEF] = CPU.op_out_dx
+    table[0x6C] = table[0x6D] = CPU.op_ins
+    table[0x6E] = table[0x6F] = CPU.op_outs
+    table[0x8E] = CPU.op_mov_sreg_rm
+    table[0x8C] = CPU.op_mov_rm_sreg
+    for op in (0x06, 0x0E, 0x16, 0x1E, 0x1A0, 0x1A8):
+        table[op] = CPU.op_push_sreg
+    for op in (0x07, 0x17, 0x1F, 0x1A1, 0x1A9):
+        table[op] = CPU.op_pop_sreg
+    table[0x100] = CPU.op_group_0f00
+    table[0x101] = CPU.op_group_0f01
+    table[0x120] = CPU.op_mov_r32_cr
+    table[0x122] = CPU.op_mov_cr_r32
+    return table
+
+DISPATCH = _build_dispatch()
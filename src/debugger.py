@@ -1,5 +1,18 @@
 # debugger.py
 
+from memory import PAGE_SHIFT
+from decoder import format_instr
+from cpu import SEG_CS, CR0_PG
+
+def parse_address(text, default_seg=0):
+    """
+    '7c00' (선형 주소) 또는 '0000:7c00' (세그먼트:오프셋) 형식을 선형 주소로 변환.
+    """
+    if ":" in text:
+        seg_str, off_str = text.split(":", 1)
+        return ((int(seg_str, 16) & 0xFFFF) << 4) + (int(off_str, 16) & 0xFFFF)
+    return int(text, 16)
+
 class Debugger:
     """
     간단한 디버거:
@@ -7,11 +20,17 @@ class Debugger:
     - False면 여러 번(연속) 실행
     - print_cpu_state() 등
     - 'd' 명령으로 현재 EIP부터 10줄 정도 디스어셈블 출력
+    - 실행 브레이크포인트(선형 주소 set)와 메모리 쓰기 워치포인트(물리 페이지 쓰기 훅, 페이징이 꺼져 있을 때만)
+      브레이크/워치포인트가 하나도 없으면 연속 실행 경로는 디버거 없는 실행과 동일하다.
     """
 
     def __init__(self, cpu):
         self.cpu = cpu
         self.single_step_mode = False
+        self.breakpoints = set()   # 선형 주소
+        self.watchpoints = set()   # 선형 주소 (페이징이 꺼져 있을 때만 쓰므로 물리 주소와 같다)
+        self.watch_hit = None      # (addr, size, value) - 워치포인트 적중 시 설정
+        self.last_stop = None      # ("breakpoint"|"watchpoint", 선형 주소) - 마지막으로 멈춘 이유
 
     def go(self):
         """계속 실행"""
@@ -25,14 +44,128 @@ class Debugger:
         """
         single_step_mode=True => 한 번만 step
         single_step_mode=False => 여러 번 step
+        브레이크/워치포인트에 걸리면 멈춘 이유 문자열을, 아니면 None 반환.
         """
         if self.single_step_mode:
             # 명령어 1번만 실행
             self.cpu.step()
-        else:
-            # 연속 실행 → 너무 빨라지지 않도록 1000 스텝 정도만
-            for _ in range(1000):
-                self.cpu.step()
+            return self._take_watch_hit()
+        # 연속 실행 → 너무 빨라지지 않도록 1000 스텝 정도만
+        return self.run(1000)
+
+    def run(self, count):
+        """
+        count 스텝 실행. 브레이크/워치포인트가 없으면 검사 없는 빠른 경로.
+        멈춘 이유 문자열 또는 None 반환.
+        """
+        if not self.breakpoints and not self.watchpoints:
+            self.cpu.run(count)
+            return None
+        return self._run_checked(count)
+
+    def _run_checked(self, count):
+        """브레이크/워치포인트가 있을 때만 쓰는 느린 경로."""
+        cpu = self.cpu
+        step = cpu.step
+        bps = self.breakpoints
+        seg_base = cpu.seg_base
+        for _ in range(count):
+            step()
+            if self.watch_hit is not None:
+                return self._take_watch_hit()
+            if bps and (seg_base[SEG_CS] + cpu.EIP) in bps:
+                self.last_stop = ("breakpoint", seg_base[SEG_CS] + cpu.EIP)
+                return f"Breakpoint at {cpu.CS:04X}:{cpu.EIP:04X}"
+        return None
+
+    def _take_watch_hit(self):
+        hit = self.watch_hit
+        if hit is None:
+            return None
+        self.watch_hit = None
+        addr, size, value = hit
+        if size > 4:
+            return (f"Watchpoint: block write [{addr:08X}] {size} bytes "
+                    f"(next {self.cpu.CS:04X}:{self.cpu.EIP:04X})")
+        return (f"Watchpoint: write{size * 8} [{addr:08X}] = {value:0{size * 2}X}h "
+                f"(next {self.cpu.CS:04X}:{self.cpu.EIP:04X})")
+
+    # ------------------------------------------------------------
+    # 브레이크포인트 / 워치포인트
+    # ------------------------------------------------------------
+    def add_breakpoint(self, linear):
+        self.breakpoints.add(linear)
+
+    def add_watchpoint(self, linear):
+        # 쓰기 훅은 물리 페이지에 걸린다. 페이징 중에는 선형 주소의 프레임이 CR3/페이지 테이블에
+        # 따라 바뀌므로 워치포인트를 쓰지 않는다.
+        if self.cpu.CR0 & CR0_PG:
+            raise Exception("Watchpoints are not supported while paging is enabled")
+        if linear in self.watchpoints:
+            return
+        page = linear >> PAGE_SHIFT
+        if not any((w >> PAGE_SHIFT) == page for w in self.watchpoints):
+            self.cpu.phys_mem.add_write_hook(page, self._on_watched_write)
+        self.watchpoints.add(linear)
+
+    def delete(self, linear=None):
+        """linear=None 이면 전부 삭제. 해당 주소의 브레이크/워치포인트를 지운다."""
+        targets_b = set(self.breakpoints) if linear is None else {linear}
+        targets_w = set(self.watchpoints) if linear is None else {linear}
+        self.breakpoints -= targets_b
+        for w in targets_w & self.watchpoints:
+            self.watchpoints.discard(w)
+            page = w >> PAGE_SHIFT
+            if not any((x >> PAGE_SHIFT) == page for x in self.watchpoints):
+                self.cpu.phys_mem.remove_write_hook(page, self._on_watched_write)
+
+    def point_command(self, parts):
+        """
+        콘솔 명령 처리: b <addr>, w <addr>, bl, bd [addr]
+        주소는 '7c00' 또는 '0000:7c00' 형식.
+        """
+        name = parts[0]
+        if name == "bl":
+            self.list_points()
+            return
+        try:
+            addr = parse_address(parts[1]) if len(parts) > 1 else None
+        except ValueError:
+            print(f"Bad address: {parts[1]}")
+            return
+        if name == "bd":
+            self.delete(addr)
+        elif addr is None:
+            print(f"Usage: {name} <addr>")
+        elif name == "b":
+            self.add_breakpoint(addr)
+            print(f"Breakpoint set at {addr:08X}")
+        elif name == "w":
+            try:
+                self.add_watchpoint(addr)
+            except Exception as e:
+                print(e)
+                return
+            print(f"Watchpoint set at {addr:08X}")
+
+    def list_points(self):
+        if not self.breakpoints and not self.watchpoints:
+            print("No breakpoints or watchpoints.")
+            return
+        for addr in sorted(self.breakpoints):
+            print(f"  b  {addr:08X}")
+        for addr in sorted(self.watchpoints):
+            print(f"  w  {addr:08X}")
+
+    def _on_watched_write(self, addr, size, value):
+        # addr 는 물리 주소: 페이징이 켜진 뒤에는 워치포인트의 선형 주소와 대응하지 않는다
+        if self.cpu.CR0 & CR0_PG:
+            return
+        for w in self.watchpoints:
+            if addr <= w < addr + size:
+                self.watch_hit = (addr, size, value)
+                self.last_stop = ("watchpoint", w)
+                return
 
     def print_cpu_state(self):
         print(f"EAX={self.cpu.EAX:08X}")
@@ -41,100 +174,33 @@ class Debugger:
     def disassemble_next_10(self):
         """
         현재 CPU의 CS:IP부터 최대 10개의 명령어를
-        '간단히' 디스어셈블하여 출력한다.
-        실제 x86 모든 opcode를 처리하진 않고,
-        우리가 구현한 opcode만 간단히 문자열로 매핑한다.
+        공유 디코더(cpu.decoder)로 디스어셈블하여 출력한다.
+        디코딩 결과는 주소별로 메모이즈되므로 반복 호출해도 다시 디코딩하지 않는다.
         """
         old_cs = self.cpu.CS
-        old_ip = self.cpu.EIP
-
-        # 복사본을 써서 fetch8/16을 시뮬레이션
-        temp_ip = old_ip
+        temp_ip = self.cpu.EIP
+        base = self.cpu.seg_base[SEG_CS]
+        decoder = self.cpu.decoder
 
         print(f"Disassembly from {old_cs:04X}:{temp_ip:04X} ...")
         for _ in range(10):
             # 주소
             addr_str = f"{old_cs:04X}:{temp_ip:04X}"
 
-            # opcode 한 바이트 읽기
-            op_addr = self.cpu.real_mode_address(old_cs, temp_ip)
-            if op_addr >= self.cpu.mem.size:
+            if base + temp_ip >= self.cpu.mem.size:
                 print(f"{addr_str}  ??    ; out of mem range")
                 break
 
-            op = self.cpu.mem.read8(op_addr)
-            disasm_line, instr_size = self.decode_instruction(op_addr, op, old_cs, temp_ip)
+            try:
+                ins = decoder.decode(base, temp_ip)
+            except Exception:
+                print(f"{addr_str}  ??    ; out of mem range")
+                break
 
             # 출력
-            print(f"{addr_str}  {disasm_line}")
+            print(f"{addr_str}  {format_instr(ins, temp_ip)}")
 
             # 다음 명령어 위치로 이동
-            temp_ip = (temp_ip + instr_size) & 0xFFFF
+            temp_ip = (temp_ip + ins.length) & 0xFFFF
 
         print("----- end of 10 lines disasm -----")
-
-    def decode_instruction(self, phys_addr, op, cs, ip):
-        """
-        우리가 구현한 opcode(0xEA, 0xCD, 0x90, 0xB8, 0x05, 0xE8, 0xC3)만
-        대충 해석. 그 외는 db.
-        리턴 (디스어셈블 문자열, instr_size)
-        """
-        mem = self.cpu.mem
-
-        if op == 0xEA:
-            # JMP ptr16:16
-            # 다음 4바이트 = IP(2), CS(2)
-            # 주의: fetch16()과 동일하게 little endian
-            ip_low = mem.read8(phys_addr+1)
-            ip_high = mem.read8(phys_addr+2)
-            cs_low = mem.read8(phys_addr+3)
-            cs_high = mem.read8(phys_addr+4)
-
-            new_ip = (ip_high << 8) | ip_low
-            new_cs = (cs_high << 8) | cs_low
-
-            instr_str = f"JMP  {new_cs:04X}:{new_ip:04X}"
-            return (instr_str, 5)  # opcode+4바이트=5
-
-        elif op == 0xCD:
-            # INT imm8
-            imm = mem.read8(phys_addr+1)
-            instr_str = f"INT  {imm:02X}h"
-            return (instr_str, 2)
-
-        elif op == 0x90:
-            # NOP
-            return ("NOP", 1)
-
-        elif op == 0xB8:
-            # MOV AX, imm16
-            imm_low = mem.read8(phys_addr+1)
-            imm_high = mem.read8(phys_addr+2)
-            imm16 = (imm_high << 8) | imm_low
-            instr_str = f"MOV AX, {imm16:04X}h"
-            return (instr_str, 3)
-
-        elif op == 0x05:
-            # ADD AX, imm16
-            imm_low = mem.read8(phys_addr+1)
-            imm_high = mem.read8(phys_addr+2)
-            imm16 = (imm_high << 8) | imm_low
-            instr_str = f"ADD AX, {imm16:04X}h"
-            return (instr_str, 3)
-
-        elif op == 0xE8:
-            # CALL rel16
-            disp_low = mem.read8(phys_addr+1)
-            disp_high = mem.read8(phys_addr+2)
-            disp16 = (disp_high << 8) | disp_low
-            instr_str = f"CALL +{disp16:04X}h"
-            return (instr_str, 3)
-
-        elif op == 0xC3:
-            # RET
-            return ("RET", 1)
-
-        else:
-            # unknown / unimplemented
-            instr_str = f"db {op:02X}h"
-            return (instr_str, 1)
\ No newline at end of file
@@ -0,0 +1,584 @@
+# decoder.py
+
+from collections import namedtuple
+
+from memory import PAGE_SHIFT, PageRanges
+
+# 테이블 기반 x86 명령어 디코더.
+# 디스어셈블러(Debugger)와 CPU 디코드 캐시가 같은 디코더를 공유한다.
+#
+# 오퍼랜드 표기는 인텔 매뉴얼 부록 A 방식을 따른다.
+#   E = ModR/M r/m,  G = ModR/M reg,  S = ModR/M reg(세그먼트 레지스터)
+#   M = 메모리 전용 r/m,  Z = opcode 하위 3비트 레지스터
+#   I = 즉치값,  J = 상대 변위,  A = 직접 far 주소,  O = 직접 메모리 오프셋
+#   b = 8비트, w = 16비트, v = 16/32비트(오퍼랜드 크기), d = 32비트
+#   Ibs = 부호 확장되는 8비트 즉치값
+#   그 밖의 이름(AL, AX, DX, CL, 1, ES ...)은 고정 오퍼랜드
+# 2바이트 opcode(0F xx)는 op = 0x100 | xx 로 표현한다.
+
+# 디코딩 결과
+#   addr     : 명령어 시작 선형 주소
+#   op       : opcode (0x00~0xFF, 0F xx 는 0x100|xx)
+#   length   : 접두어 포함 전체 길이
+#   mnemonic : 니모닉 문자열
+#   operands : 오퍼랜드 표기 튜플 (예: ("Ev", "Gv"))
+#   modrm    : ModR/M 바이트 (없으면 None), mod/reg/rm 은 분해된 필드
+#   disp     : 부호 확장된 변위(메모리 오퍼랜드) 또는 O 형식 오프셋
+#   imm/imm2 : 첫 번째/두 번째 즉치값 (A 형식은 imm=오프셋, imm2=세그먼트)
+#   rep      : 0, 0xF2, 0xF3
+#   seg      : 세그먼트 오버라이드 번호 (0=ES 1=CS 2=SS 3=DS 4=FS 5=GS, 없으면 None)
+#   opsize/addrsize : 16 또는 32
+#   ea       : 메모리 오퍼랜드의 오프셋 함수 ea(cpu, disp) (없으면 None, MODRM16 참고)
+#   ea_seg   : 메모리 오퍼랜드의 세그먼트 번호 (오버라이드 또는 ModR/M 형식의 기본 세그먼트)
+Instr = namedtuple(
+    "Instr",
+    "addr op length mnemonic operands modrm mod reg rm disp imm imm2 rep seg opsize addrsize"
+    " ea ea_seg",
+)
+
+REG8 = ("AL", "CL", "DL", "BL", "AH", "CH", "DH", "BH")
+REG16 = ("AX", "CX", "DX", "BX", "SP", "BP", "SI", "DI")
+REG32 = ("EAX", "ECX", "EDX", "EBX", "ESP", "EBP", "ESI", "EDI")
+SREG = ("ES", "CS", "SS", "DS", "FS", "GS", "?S", "?S")
+MODRM16_BASE = ("BX+SI", "BX+DI", "BP+SI", "BP+DI", "SI", "DI", "BP", "BX")
+
+# 세그먼트 오버라이드 접두어 바이트 -> 세그먼트 번호 (SREG 인덱스)
+PREFIX_SEG = {0x26: 0, 0x2E: 1, 0x36: 2, 0x3E: 3, 0x64: 4, 0x65: 5}
+_SS = SREG.index("SS")
+_DS = SREG.index("DS")
+
+# ------------------------------------------------------------
+# 16비트 ModR/M 표: ModR/M 바이트 256개 -> ModRM
+#   disp_size   : 뒤따르는 변위 바이트 수 (0/1/2)
+#   disp_signed : 변위를 부호 확장하는가 (mod=0, rm=6 의 직접 주소는 부호 없음)
+#   mem         : 메모리 오퍼랜드인가 (mod=3 은 레지스터)
+#   ea          : ea(cpu, disp) -> 16비트 오프셋
+#   seg         : 기본 세그먼트. BP 를 쓰는 형식([BP+SI], [BP+DI], [BP+disp])은 SS, 나머지는 DS
+# ------------------------------------------------------------
+ModRM = namedtuple("ModRM", "disp_size disp_signed mem ea seg")
+
+def _ea_bx_si(cpu, disp):
+    return (cpu.EBX + cpu.ESI + disp) & 0xFFFF
+
+def _ea_bx_di(cpu, disp):
+    return (cpu.EBX + cpu.EDI + disp) & 0xFFFF
+
+def _ea_bp_si(cpu, disp):
+    return (cpu.EBP + cpu.ESI + disp) & 0xFFFF
+
+def _ea_bp_di(cpu, disp):
+    return (cpu.EBP + cpu.EDI + disp) & 0xFFFF
+
+def _ea_si(cpu, disp):
+    return (cpu.ESI + disp) & 0xFFFF
+
+def _ea_di(cpu, disp):
+    return (cpu.EDI + disp) & 0xFFFF
+
+def _ea_bp(cpu, disp):
+    return (cpu.EBP + disp) & 0xFFFF
+
+def _ea_bx(cpu, disp):
+    return (cpu.EBX + disp) & 0xFFFF
+
+def _ea_direct(cpu, disp):
+    return disp & 0xFFFF
+
+_EA16 = (_ea_bx_si, _ea_bx_di, _ea_bp_si, _ea_bp_di, _ea_si, _ea_di, _ea_bp, _ea_bx)
+_EA16_SEG = (_DS, _DS, _SS, _SS, _DS, _DS, _SS, _DS)
+
+def _build_modrm16():
+    table = []
+    for modrm in range(256):
+        mod = modrm >> 6
+        rm = modrm & 7
+        if mod == 3:
+            table.append(ModRM(0, False, False, None, None))
+        elif mod == 0 and rm == 6:
+            table.append(ModRM(2, False, True, _ea_direct, _DS))
+        else:
+            # mod 0 은 변위가 없다 (부호 확장할 바이트가 없으므로 disp_signed 도 끈다)
+            table.append(ModRM(mod if mod < 2 else 2, mod != 0, True, _EA16[rm], _EA16_SEG[rm]))
+    return tuple(table)
+
+MODRM16 = _build_modrm16()
+
+def _ea32_unsupported(cpu, disp):
+    raise Exception(f"32-bit addressing (67h) is not implemented at "
+                    f"{cpu.CS:04X}:{cpu.EIP & 0xFFFF:04X}")
+
+CC = ("O", "NO", "B", "NB", "Z", "NZ", "BE", "A", "S", "NS", "P", "NP", "L", "GE", "LE", "G")
+
+# ------------------------------------------------------------
+# opcode 테이블: op -> (니모닉, 오퍼랜드) 또는 그룹(ModR/M reg 로 선택되는 8개 항목)
+# ------------------------------------------------------------
+OPCODES = {}
+
+def _group(entries, operands):
+    """ModR/M reg 필드로 니모닉이 갈리는 그룹. 항목마다 오퍼랜드를 따로 줄 수 있다."""
+    return tuple(e if isinstance(e, tuple) else (e, operands) for e in entries)
+
+_ALU = ("ADD", "OR", "ADC", "SBB", "AND", "SUB", "XOR", "CMP")
+for _i, _name in enumerate(_ALU):
+    _b = _i * 8
+    OPCODES[_b + 0] = (_name, ("Eb", "Gb"))
+    OPCODES[_b + 1] = (_name, ("Ev", "Gv"))
+    OPCODES[_b + 2] = (_name, ("Gb", "Eb"))
+    OPCODES[_b + 3] = (_name, ("Gv", "Ev"))
+    OPCODES[_b + 4] = (_name, ("AL", "Ib"))
+    OPCODES[_b + 5] = (_name, ("AX", "Iv"))
+
+for _b, _sreg in ((0x06, "ES"), (0x0E, "CS"), (0x16, "SS"), (0x1E, "DS")):
+    OPCODES[_b] = ("PUSH", (_sreg,))
+    if _sreg != "CS":
+        OPCODES[_b + 1] = ("POP", (_sreg,))
+OPCODES[0x27] = ("DAA", ())
+OPCODES[0x2F] = ("DAS", ())
+OPCODES[0x37] = ("AAA", ())
+OPCODES[0x3F] = ("AAS", ())
+
+for _r in range(8):
+    OPCODES[0x40 + _r] = ("INC", ("Zv",))
+    OPCODES[0x48 + _r] = ("DEC", ("Zv",))
+    OPCODES[0x50 + _r] = ("PUSH", ("Zv",))
+    OPCODES[0x58 + _r] = ("POP", ("Zv",))
+    OPCODES[0xB0 + _r] = ("MOV", ("Zb", "Ib"))
+    OPCODES[0xB8 + _r] = ("MOV", ("Zv", "Iv"))
+for _r in range(1, 8):
+    OPCODES[0x90 + _r] = ("XCHG", ("AX", "Zv"))
+for _c in range(16):
+    OPCODES[0x70 + _c] = ("J" + CC[_c], ("Jb",))
+
+OPCODES.update({
+    0x60: ("PUSHA", ()), 0x61: ("POPA", ()),
+    0x62: ("BOUND", ("Gv", "M")), 0x63: ("ARPL", ("Ew", "Gw")),
+    0x68: ("PUSH", ("Iv",)), 0x69: ("IMUL", ("Gv", "Ev", "Iv")),
+    0x6A: ("PUSH", ("Ibs",)), 0x6B: ("IMUL", ("Gv", "Ev", "Ibs")),
+    0x6C: ("INSB", ()), 0x6D: ("INSW", ()), 0x6E: ("OUTSB", ()), 0x6F: ("OUTSW", ()),
+    0x80: _group(_ALU, ("Eb", "Ib")), 0x81: _group(_ALU, ("Ev", "Iv")),
+    0x82: _group(_ALU, ("Eb", "Ib")), 0x83: _group(_ALU, ("Ev", "Ibs")),
+    0x84: ("TEST", ("Eb", "Gb")), 0x85: ("TEST", ("Ev", "Gv")),
+    0x86: ("XCHG", ("Eb", "Gb")), 0x87: ("XCHG", ("Ev", "Gv")),
+    0x88: ("MOV", ("Eb", "Gb")), 0x89: ("MOV", ("Ev", "Gv")),
+    0x8A: ("MOV", ("Gb", "Eb")), 0x8B: ("MOV", ("Gv", "Ev")),
+    0x8C: ("MOV", ("Ew", "Sw")), 0x8D: ("LEA", ("Gv", "M")),
+    0x8E: ("MOV", ("Sw", "Ew")), 0x8F: _group(("POP",) + ("???",) * 7, ("Ev",)),
+    0x90: ("NOP", ()), 0x98: ("CBW", ()), 0x99: ("CWD", ()),
+    0x9A: ("CALL", ("Ap",)), 0x9B: ("WAIT", ()),
+    0x9C: ("PUSHF", ()), 0x9D: ("POPF", ()), 0x9E: ("SAHF", ()), 0x9F: ("LAHF", ()),
+    0xA0: ("MOV", ("AL", "Ob")), 0xA1: ("MOV", ("AX", "Ov")),
+    0xA2: ("MOV", ("Ob", "AL")), 0xA3: ("MOV", ("Ov", "AX")),
+    0xA4: ("MOVSB", ()), 0xA5: ("MOVSW", ()), 0xA6: ("CMPSB", ()), 0xA7: ("CMPSW", ()),
+    0xA8: ("TEST", ("AL", "Ib")), 0xA9: ("TEST", ("AX", "Iv")),
+    0xAA: ("STOSB", ()), 0xAB: ("STOSW", ()), 0xAC: ("LODSB", ()), 0xAD: ("LODSW", ()),
+    0xAE: ("SCASB", ()), 0xAF: ("SCASW", ()),
+    0xC2: ("RET", ("Iw",)), 0xC3: ("RET", ()),
+    0xC4: ("LES", ("Gv", "M")), 0xC5: ("LDS", ("Gv", "M")),
+    0xC6: _group(("MOV",) + ("???",) * 7, ("Eb", "Ib")),
+    0xC7: _group(("MOV",) + ("???",) * 7, ("Ev", "Iv")),
+    0xC8: ("ENTER", ("Iw", "Ib")), 0xC9: ("LEAVE", ()),
+    0xCA: ("RETF", ("Iw",)), 0xCB: ("RETF", ()),
+    0xCC: ("INT3", ()), 0xCD: ("INT", ("Ib",)), 0xCE: ("INTO", ()), 0xCF: ("IRET", ()),
+    0xD4: ("AAM", ("Ib",)), 0xD5: ("AAD", ("Ib",)), 0xD6: ("SALC", ()), 0xD7: ("XLAT", ()),
+    0xE0: ("LOOPNZ", ("Jb",)), 0xE1: ("LOOPZ", ("Jb",)), 0xE2: ("LOOP", ("Jb",)),
+    0xE3: ("JCXZ", ("Jb",)),
+    0xE4: ("IN", ("AL", "Ib")), 0xE5: ("IN", ("AX", "Ib")),
+    0xE6: ("OUT", ("Ib", "AL")), 0xE7: ("OUT", ("Ib", "AX")),
+    0xE8: ("CALL", ("Jv",)), 0xE9: ("JMP", ("Jv",)), 0xEA: ("JMP", ("Ap",)),
+    0xEB: ("JMP", ("Jb",)),
+    0xEC: ("IN", ("AL", "DX")), 0xED: ("IN", ("AX", "DX")),
+    0xEE: ("OUT", ("DX", "AL")), 0xEF: ("OUT", ("DX", "AX")),
+    0xF1: ("INT1", ()), 0xF4: ("HLT", ()), 0xF5: ("CMC", ()),
+    0xF6: _group(("TEST", "TEST", "NOT", "NEG", "MUL", "IMUL", "DIV", "IDIV"), ("Eb",)),
+    0xF7: _group(("TEST", "TEST", "NOT", "NEG", "MUL", "IMUL", "DIV", "IDIV"), ("Ev",)),
+    0xF8: ("CLC", ()), 0xF9: ("STC", ()), 0xFA: ("CLI", ()), 0xFB: ("STI", ()),
+    0xFC: ("CLD", ()), 0xFD: ("STD", ()),
+    0xFE: _group(("INC", "DEC") + ("???",) * 6, ("Eb",)),
+    0xFF: _group((("INC", ("Ev",)), ("DEC", ("Ev",)), ("CALL", ("Ev",)), ("CALLF", ("M",)),
+                  ("JMP", ("Ev",)), ("JMPF", ("M",)), ("PUSH", ("Ev",)), "???"), ("Ev",)),
+})
+# F6/F7 의 TEST 는 즉치값을 가진다
+OPCODES[0xF6] = (("TEST", ("Eb", "Ib")), ("TEST", ("Eb", "Ib"))) + OPCODES[0xF6][2:]
+OPCODES[0xF7] = (("TEST", ("Ev", "Iv")), ("TEST", ("Ev", "Iv"))) + OPCODES[0xF7][2:]
+
+_SHIFT = ("ROL", "ROR", "RCL", "RCR", "SHL", "SHR", "SAL", "SAR")
+OPCODES[0xC0] = _group(_SHIFT, ("Eb", "Ib"))
+OPCODES[0xC1] = _group(_SHIFT, ("Ev", "Ib"))
+OPCODES[0xD0] = _group(_SHIFT, ("Eb", "1"))
+OPCODES[0xD1] = _group(_SHIFT, ("Ev", "1"))
+OPCODES[0xD2] = _group(_SHIFT, ("Eb", "CL"))
+OPCODES[0xD3] = _group(_SHIFT, ("Ev", "CL"))
+for _b in range(0xD8, 0xE0):
+    OPCODES[_b] = ("ESC", ("E",))
+
+# 2바이트 opcode (0F xx)
+for _c in range(16):
+    OPCODES[0x180 + _c] = ("J" + CC[_c], ("Jv",))
+    OPCODES[0x190 + _c] = ("SET" + CC[_c], ("Eb",))
+OPCODES.update({
+    0x100: _group(("SLDT", "STR", "LLDT", "LTR", "VERR", "VERW", "???", "???"), ("Ew",)),
+    0x101: _group(("SGDT", "SIDT", "LGDT", "LIDT", ("SMSW", ("Ew",)), "???",
+                   ("LMSW", ("Ew",)), "INVLPG"), ("M",)),
+    0x106: ("CLTS", ()),
+    0x120: ("MOV", ("Rd", "Cd")), 0x122: ("MOV", ("Cd", "Rd")),
+    0x1A0: ("PUSH", ("FS",)), 0x1A1: ("POP", ("FS",)),
+    0x1A8: ("PUSH", ("GS",)), 0x1A9: ("POP", ("GS",)),
+    0x1AF: ("IMUL", ("Gv", "Ev")),
+    0x1B6: ("MOVZX", ("Gv", "Eb")), 0x1B7: ("MOVZX", ("Gv", "Ew")),
+    0x1BE: ("MOVSX", ("Gv", "Eb")), 0x1BF: ("MOVSX", ("Gv", "Ew")),
+    # 에뮬레이터 전용: BIOS ROM 스텁이 파이썬 BIOS 서비스를 부르는 트랩
+    0x1FF: ("BIOSCALL", ("Ib",)),
+})
+
+# ModR/M 을 가지는 오퍼랜드 표기
+_MODRM_KINDS = frozenset(("Eb", "Ew", "Ev", "Gb", "Gw", "Gv", "Sw", "M", "E", "Rd", "Cd"))
+
+
+def _imm_size(kind, opsize, addrsize):
+    if kind in ("Ib", "Ibs", "Jb"):
+        return 1
+    if kind == "Iw":
+        return 2
+    if kind in ("Iv", "Jv"):
+        return opsize // 8
+    if kind in ("Ob", "Ov"):
+        return addrsize // 8
+    return 0
+
+
+class Decoder:
+    """
+    선형 주소 단위로 디코딩 결과를 메모이즈하는 디코더.
+    캐시된 명령어가 있는 물리 페이지에는 메모리 쓰기 훅을 걸어,
+    쓴 바이트 범위와 겹치는 명령어만 캐시에서 버린다.
+    페이징이 켜지면 set_view() 로 명령어를 읽을 선형 메모리 뷰와 선형->물리 변환 함수를 받는다.
+    """
+
+    def __init__(self, memory):
+        self.mem = memory        # 쓰기 훅을 거는 물리 메모리
+        self.view = memory       # 명령어 바이트를 읽는 (선형) 메모리
+        self.translate = None    # 선형 -> 물리 (None 이면 같은 주소)
+        self.cache = {}          # 선형 주소 -> Instr
+        self._page_entries = {}  # 물리 page -> PageRanges (Instr, 물리 시작, 물리 끝)
+        self.decoded = 0         # 통계: 캐시에 없어 새로 디코딩한 명령어 수
+        self.persistent = None   # 디스크 캐시 (enable_persistent_cache)
+
+    def set_view(self, view, translate=None):
+        """선형->물리 대응이 바뀌므로 캐시를 모두 버린다."""
+        self.flush()
+        self.view = view
+        self.translate = translate
+
+    def decode(self, base, ip, ip_mask=0xFFFF):
+        """
+        base(세그먼트 선형 베이스) + ip 위치의 명령어를 디코딩한다.
+        IP 는 ip_mask 로 랩어라운드된다(리얼 모드 64KB).
+        """
+        addr = base + ip
+        ins = self.cache.get(addr)
+        if ins is None:
+            ins = self._decode(base, ip, ip_mask)
+            self._remember(ins)
+            self.decoded += 1
+        return ins
+
+    def decode_uncached(self, base, ip, ip_mask=0xFFFF):
+        """
+        캐시를 보지도 채우지도 않고 지금 메모리 내용을 디코딩한다 (쓰기 훅도 걸지 않는다).
+        트레이스 덤프/검증 보고서처럼 실행 상태를 바꾸면 안 되는 곳에서 쓴다.
+        """
+        return self._decode(base, ip, ip_mask)
+
+    def enable_persistent_cache(self, cache):
+        """
+        디코드 캐시 미스 때 먼저 디스크 캐시(translation_cache.TranslationCache)를 보고,
+        새로 디코딩한 명령어는 거기에 남긴다. 페이징이 켜져 있는 동안에는 쓰지 않는다.
+        """
+        self.persistent = cache
+        self.decode = self._decode_persistent
+
+    def _decode_persistent(self, base, ip, ip_mask=0xFFFF):
+        addr = base + ip
+        ins = self.cache.get(addr)
+        if ins is None:
+            persistent = self.persistent if self.translate is None else None
+            if persistent is not None:
+                ins = persistent.lookup_instr(addr, ip, ip_mask)
+            if ins is None:
+                ins = self._decode(base, ip, ip_mask)
+                self.decoded += 1
+                if persistent is not None:
+                    persistent.store_instr(ins, ip, ip_mask)
+            self._remember(ins)
+        return ins
+
+    def flush(self):
+        for page in list(self._page_entries):
+            self.invalidate_page(page)
+        if self.persistent is not None:
+            self.persistent.flush()
+
+    def invalidate_page(self, page):
+        entries = self._page_entries.pop(page, None)
+        if entries is None:
+            return
+        for ins, _, _ in entries.items:
+            self._drop(ins)
+        self.mem.remove_write_hook(page, self._on_code_write)
+
+    def _drop(self, ins):
+        # 페이지 경계에 걸친 명령어는 다른 페이지에도 항목이 남는다. 그 항목이 나중에 불려도
+        # 같은 주소를 새로 디코딩한 명령어는 버리지 않도록 같은 객체일 때만 지운다.
+        if self.cache.get(ins.addr) is ins:
+            del self.cache[ins.addr]
+
+    def _on_code_write(self, addr, size, value):
+        # 쓴 범위와 겹치는 명령어만 버린다 (여러 페이지에 걸친 쓰기는 페이지마다)
+        end = addr + size
+        for page in range(addr >> PAGE_SHIFT, ((end - 1) >> PAGE_SHIFT) + 1):
+            entries = self._page_entries.get(page)
+            if entries is None:
+                continue
+            for ins in entries.take(addr, end):
+                self._drop(ins)
+            if not entries.items:
+                del self._page_entries[page]
+                self.mem.remove_write_hook(page, self._on_code_write)
+
+    def _remember(self, ins):
+        self.cache[ins.addr] = ins
+        translate = self.translate
+        start = ins.addr
+        end = ins.addr + ins.length
+        while start < end:
+            # 선형 페이지 하나에 들어가는 조각마다 물리 범위로 바꿔 올린다
+            piece_end = min(end, ((start >> PAGE_SHIFT) + 1) << PAGE_SHIFT)
+            phys = start if translate is None else translate(start)
+            page = phys >> PAGE_SHIFT
+            entries = self._page_entries.get(page)
+            if entries is None:
+                entries = self._page_entries[page] = PageRanges()
+                self.mem.add_write_hook(page, self._on_code_write)
+            entries.add(ins, phys, phys + piece_end - start)
+            start = piece_end
+
+    def _decode(self, base, ip, ip_mask):
+        read8 = self.view.read8
+        pos = [ip]
+
+        def next8():
+            val = read8(base + (pos[0] & ip_mask))
+            pos[0] += 1
+            return val
+
+        def next_n(size):
+            val = 0
+            for shift in range(0, size * 8, 8):
+                val |= next8() << shift
+            return val
+
+        rep = 0
+        seg = None
+        opsize = 16
+        addrsize = 16
+        while True:
+            b = next8()
+            if b in PREFIX_SEG:
+                seg = PREFIX_SEG[b]
+            elif b == 0xF2 or b == 0xF3:
+                rep = b
+            elif b == 0x66:
+                opsize = 32
+            elif b == 0x67:
+                addrsize = 32
+            elif b == 0xF0:
+                pass  # LOCK
+            else:
+                break
+            if pos[0] - ip >= 15:
+                break
+
+        op = b
+        if op == 0x0F:
+            op = 0x100 | next8()
+
+        entry = OPCODES.get(op)
+        modrm = mod = reg = rm = None
+        disp = 0
+        if entry is None:
+            return Instr(base + ip, op, (pos[0] - ip), "db", (), None, None, None, None,
+                         0, op, 0, rep, seg, opsize, addrsize, None, None)
+
+        if isinstance(entry[0], tuple):
+            # 그룹: ModR/M 이 필수
+            modrm = next8()
+            mnemonic, operands = entry[(modrm >> 3) & 7]
+        else:
+            mnemonic, operands = entry
+            if any(k in _MODRM_KINDS for k in operands):
+                modrm = next8()
+
+        ea = ea_seg = None
+        if modrm is not None:
+            mod = modrm >> 6
+            reg = (modrm >> 3) & 7
+            rm = modrm & 7
+            if addrsize == 16:
+                form = MODRM16[modrm]
+                if form.mem:
+                    disp = next_n(form.disp_size)
+                    if form.disp_signed:
+                        top = 1 << (form.disp_size * 8)
+                        disp = disp - top if disp >= (top >> 1) else disp
+                    ea = form.ea
+                    ea_seg = form.seg if seg is None else seg
+            elif mod != 3:
+                disp = self._decode_disp32(mod, rm, next8, next_n)
+                ea = _ea32_unsupported
+                ea_seg = _DS if seg is None else seg
+
+        imm = imm2 = 0
+        if operands == ("Ap",):
+            imm = next_n(opsize // 8)
+            imm2 = next_n(2)
+        else:
+            first = True
+            for kind in operands:
+                size = _imm_size(kind, opsize, addrsize)
+                if not size:
+                    continue
+                val = next_n(size)
+                if kind in ("Ob", "Ov"):
+                    disp = val
+                    continue
+                if kind in ("Ibs", "Jb"):
+                    val = val - 0x100 if val >= 0x80 else val
+                elif kind == "Jv":
+                    top = 1 << (size * 8)
+                    val = val - top if val >= (top >> 1) else val
+                if first:
+                    imm = val
+                    first = False
+                else:
+                    imm2 = val
+
+        return Instr(base + ip, op, (pos[0] - ip), mnemonic, operands, modrm, mod, reg, rm,
+                     disp, imm, imm2, rep, seg, opsize, addrsize, ea, ea_seg)
+
+    @staticmethod
+    def _decode_disp32(mod, rm, next8, next_n):
+        # 32비트 주소: SIB 바이트는 disp 앞에 온다 (base/index 해석은 실행부에서)
+        if rm == 4:
+            sib = next8()
+            if mod == 0 and (sib & 7) == 5:
+                return next_n(4)
+        if mod == 0:
+            return next_n(4) if rm == 5 else 0
+        if mod == 1:
+            d = next8()
+            return d - 0x100 if d >= 0x80 else d
+        d = next_n(4)
+        return d - 0x100000000 if d >= 0x80000000 else d
+
+
+# ------------------------------------------------------------
+# 디스크 캐시용 직렬화: addr 와 ea 함수를 뺀 필드 튜플 (marshal 가능)
+# ------------------------------------------------------------
+def instr_record(ins):
+    return ins[1:16] + (ins.ea_seg,)
+
+def instr_from_record(addr, record):
+    """instr_record 로 만든 튜플을 addr 위치의 Instr 로 되돌린다 (ea 는 ModR/M 표에서 다시 찾는다)."""
+    ea = None
+    ea_seg = record[15]
+    if ea_seg is not None:
+        ea = MODRM16[record[4]].ea if record[14] == 16 else _ea32_unsupported
+    return Instr(addr, *record[:15], ea, ea_seg)
+
+# ------------------------------------------------------------
+# 디스어셈블 문자열
+# ------------------------------------------------------------
+def _hex(val, digits):
+    return f"{val & ((1 << (digits * 4)) - 1):0{digits}X}h"
+
+def _mem_operand(ins):
+    prefix = "" if ins.seg is None else SREG[ins.seg] + ":"
+    if ins.addrsize == 16:
+        if ins.mod == 0 and ins.rm == 6:
+            return f"{prefix}[{_hex(ins.disp, 4)}]"
+        inner = MODRM16_BASE[ins.rm]
+    else:
+        inner = "SIB" if ins.rm == 4 else REG32[ins.rm]
+        if ins.mod == 0 and ins.rm == 5:
+            return f"{prefix}[{_hex(ins.disp, 8)}]"
+    if ins.disp:
+        sign = "+" if ins.disp > 0 else "-"
+        inner += f"{sign}{_hex(abs(ins.disp), 2 if ins.mod == 1 else 4)}"
+    return f"{prefix}[{inner}]"
+
+def format_instr(ins, ip=None):
+    """
+    Instr 를 'MOV AX, 0013h' 같은 문자열로 만든다.
+    ip 는 상대 점프 대상 계산용 (명령어 시작 오프셋).
+    """
+    if ins.mnemonic == "db":
+        if ins.op > 0xFF:
+            return f"db 0Fh, {ins.op & 0xFF:02X}h"
+        return f"db {ins.op:02X}h"
+    wide = REG32 if ins.opsize == 32 else REG16
+    parts = []
+    has_reg = any(k in ("Gb", "Gw", "Gv", "Zb", "Zv", "Sw", "AL", "AX", "DX", "CL")
+                  for k in ins.operands)
+    imm_seen = False
+    for kind in ins.operands:
+        if kind in ("Eb", "Ew", "Ev", "M", "E"):
+            if ins.mod == 3:
+                regs = REG8 if kind == "Eb" else REG16 if kind == "Ew" else wide
+                parts.append(regs[ins.rm])
+            else:
+                text = _mem_operand(ins)
+                if not has_reg and kind in ("Eb", "Ew", "Ev"):
+                    size = "byte" if kind == "Eb" else "word" if (kind == "Ew" or ins.opsize == 16) else "dword"
+                    text = f"{size} {text}"
+                parts.append(text)
+        elif kind == "Gb":
+            parts.append(REG8[ins.reg])
+        elif kind == "Gw":
+            parts.append(REG16[ins.reg])
+        elif kind == "Gv":
+            parts.append(wide[ins.reg])
+        elif kind == "Sw":
+            parts.append(SREG[ins.reg])
+        elif kind == "Rd":
+            parts.append(REG32[ins.rm])
+        elif kind == "Cd":
+            parts.append(f"CR{ins.reg}")
+        elif kind == "Zb":
+            parts.append(REG8[ins.op & 7])
+        elif kind == "Zv":
+            parts.append(wide[ins.op & 7])
+        elif kind in ("Ib", "Ibs", "Iw", "Iv"):
+            val = ins.imm2 if imm_seen else ins.imm
+            imm_seen = True
+            # Ibs 는 오퍼랜드 크기로 부호 확장된 값이므로 그 크기로 찍는다 (66 83 C0 FF = FFFFFFFFh)
+            digits = 2 if kind == "Ib" else 4 if kind == "Iw" or ins.opsize == 16 else 8
+            parts.append(_hex(val, digits))
+        elif kind in ("Jb", "Jv"):
+            if ip is None:
+                parts.append(f"{'+' if ins.imm >= 0 else '-'}{_hex(abs(ins.imm), 4)}")
+            else:
+                parts.append(_hex(ip + ins.length + ins.imm, 4))
+        elif kind == "Ap":
+            parts.append(f"{ins.imm2:04X}:{ins.imm:0{ins.opsize // 4}X}")
+        elif kind in ("Ob", "Ov"):
+            prefix = "" if ins.seg is None else SREG[ins.seg] + ":"
+            parts.append(f"{prefix}[{_hex(ins.disp, 4)}]")
+        elif kind == "AX":
+            parts.append(wide[0])
+        else:
+            parts.append(kind)
+    prefix = {0xF2: "REPNE ", 0xF3: "REP "}.get(ins.rep, "")
+    text = prefix + ins.mnemonic
+    if parts:
+        text = f"{text:<6} " + ", ".join(parts)
+    return text
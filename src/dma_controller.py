@@ -1,32 +1,363 @@
 # dma_controller.py
+#
+# 8237A 호환 DMA 컨트롤러 두 개 (AT/EISA 구성):
+#   DMA1  채널 0~3, 8비트 전송     포트 00h~0Fh
+#   DMA2  채널 4~7, 16비트 전송    포트 C0h~DEh (짝수 포트), 채널 4 는 DMA1 을 잇는 캐스케이드
+#   페이지 레지스터 81h~8Fh (주소 비트 16~23), EISA 상위 페이지 481h~48Fh (비트 24~31)
+#
+# 장치는 start_dma(장치 -> 메모리) / read_dma(메모리 -> 장치) 로 DREQ 를 올린다.
+# 데이터는 그 자리에서 memoryview 덩어리로 한 번에 복사한다. 주소 카운터가 64KB
+# (16비트 채널은 128KB) 페이지 끝에서 감겨 도는 곳에서만 나눈다. 완료(TC 상태, 자동 초기화
+# 또는 마스크, 장치 IRQ)는 전송량에 비례한 가상 시간(명령어 수) 뒤에
+# InterruptController.schedule 로 일어난다. 그 사이에 현재 주소/카운트를 읽으면 진행한 만큼
+# 보간한 값을 돌려준다.
+
+DMA1_BASE = 0x00
+DMA2_BASE = 0xC0
+PAGE_BASE = 0x80
+HIGH_PAGE_BASE = 0x480
+
+# 채널 번호 -> 페이지 레지스터 포트
+PAGE_PORTS = (0x87, 0x83, 0x81, 0x82, 0x8F, 0x8B, 0x89, 0x8A)
+
+# EISABus 에 연결할 포트 (80h 는 POST 코드 포트라 뺀다)
+DMA_PORTS = (range(DMA1_BASE, DMA1_BASE + 0x10), range(PAGE_BASE + 1, PAGE_BASE + 0x10),
+             range(DMA2_BASE, DMA2_BASE + 0x20), range(HIGH_PAGE_BASE + 1, HIGH_PAGE_BASE + 0x10))
+
+# 컨트롤러 레지스터 번호 (DMA1 은 포트 - 00h, DMA2 는 (포트 - C0h) / 2)
+REG_STATUS_COMMAND = 8
+REG_REQUEST = 9
+REG_SINGLE_MASK = 10
+REG_MODE = 11
+REG_CLEAR_FLIPFLOP = 12
+REG_MASTER_CLEAR = 13
+REG_CLEAR_MASK = 14
+REG_ALL_MASK = 15
+
+# 모드 레지스터
+MODE_TRANSFER_MASK = 0x0C
+MODE_VERIFY = 0x00
+MODE_WRITE = 0x04          # 장치 -> 메모리
+MODE_READ = 0x08           # 메모리 -> 장치
+MODE_AUTO_INIT = 0x10
+MODE_DECREMENT = 0x20
+MODE_CASCADE = 0xC0
+
+COMMAND_DISABLE = 0x04
+
+# 가상 시간: 명령어 하나 동안 옮기는 바이트 수
+DMA_BYTES_PER_INSTRUCTION = 4
+
+class DMAChannel:
+    def __init__(self, number):
+        self.number = number
+        self.unit = 2 if number >= 4 else 1
+        self.base_address = 0
+        self.base_count = 0
+        self.address = 0       # 현재 주소 (16비트 채널은 워드 주소)
+        self.count = 0         # 현재 카운트 (남은 단위 수 - 1)
+        self.mode = 0
+        self.masked = True
+        self.request = False   # 소프트웨어 요청 (요청 레지스터)
+        self.busy = None       # 진행 중인 전송 (_Transfer)
+
+
+class _Transfer:
+    """완료를 기다리는 전송: 시작 시각/값과 끝난 뒤 값"""
+
+    __slots__ = ("start", "delay", "units", "address", "count", "end_address", "end_count",
+                 "terminal", "irq")
+
+    def __init__(self, start, delay, units, address, count, end_address, end_count, terminal, irq):
+        self.start = start
+        self.delay = delay
+        self.units = units
+        self.address = address
+        self.count = count
+        self.end_address = end_address
+        self.end_count = end_count
+        self.terminal = terminal
+        self.irq = irq
+
 
 class DMAController:
     """
-    가상 DMA 컨트롤러.
-    DMA 채널별로 메모리에 데이터를 블록 전송 후 IRQ 발생.
+    가상 DMA 컨트롤러 (8237A 두 개 + 페이지 레지스터).
+    채널별로 메모리에 데이터를 블록 전송한 뒤, 가상 시간으로 완료되면 요청한 장치의 IRQ 발생.
     """
 
     def __init__(self, memory, interrupt_controller):
         self.memory = memory
         self.ic = interrupt_controller
-        self.channels = {
-            0: {"address": 0, "count": 0, "mode": 0},
-            1: {"address": 0, "count": 0, "mode": 0},
-        }
+        self.channels = [DMAChannel(n) for n in range(8)]
+        self.pages = bytearray(16)          # 80h~8Fh
+        self.high_pages = bytearray(16)     # 480h~48Fh
+        self.command = [0, 0]
+        self.status = [0, 0]                # 비트 0~3 TC 도달 (읽으면 지워짐)
+        self.flipflop = [False, False]
+        self.transfers = 0
+        self.bytes_transferred = 0
+        # POST 가 해 두는 설정: 채널 4 는 DMA1 캐스케이드
+        self.channels[4].mode = MODE_CASCADE
+        self.channels[4].masked = False
+
+    # ------------------------------------------------------------
+    # 장치 쪽
+    # ------------------------------------------------------------
+    def set_channel_params(self, channel: int, address: int, count: int, mode: int):
+        """
+        드라이버가 포트로 하는 설정을 한 번에: 물리 주소, 전송할 바이트 수, 모드 레지스터 값.
+        채널 마스크도 푼다.
+        """
+        ch = self.channels[channel]
+        self._set_page(channel, (address >> 16) & 0xFF)
+        self.high_pages[PAGE_PORTS[channel] & 0x0F] = (address >> 24) & 0xFF
+        ch.base_address = ch.address = (address >> (ch.unit - 1)) & 0xFFFF
+        ch.base_count = ch.count = (count // ch.unit - 1) & 0xFFFF
+        ch.mode = (mode & ~0x03) | (channel & 0x03)
+        ch.masked = False
+
+    def start_dma(self, channel: int, source_data, irq=None):
+        """
+        장치 -> 메모리 전송 (모드가 write 일 때. verify 면 메모리는 건드리지 않는다).
+        전송한 바이트 수를 반환한다 (마스크/진행 중/방향이 다르면 0).
+        """
+        ch = self.channels[channel]
+        if (ch.mode & MODE_TRANSFER_MASK) not in (MODE_WRITE, MODE_VERIFY):
+            return 0
+        units = self._begin(ch, len(source_data) // ch.unit)
+        if not units:
+            return 0
+        if ch.mode & MODE_TRANSFER_MASK == MODE_WRITE:
+            view = memoryview(source_data).cast("B")
+            for phys, length, offset in self._segments(ch, units):
+                self._write(phys, self._ordered(ch, view[offset:offset + length]))
+        return self._finish(ch, units, irq)
+
+    def read_dma(self, channel: int, length=None, irq=None) -> bytes:
+        """
+        메모리 -> 장치 전송 (모드가 read 일 때). length 바이트(기본: 남은 카운트 전부)까지
+        읽어 반환한다. 마스크/진행 중/방향이 다르면 빈 bytes.
+        """
+        ch = self.channels[channel]
+        if ch.mode & MODE_TRANSFER_MASK != MODE_READ:
+            return b""
+        units = self._begin(ch, ch.count + 1 if length is None else length // ch.unit)
+        if not units:
+            return b""
+        out = bytearray(units * ch.unit)
+        for phys, size, offset in self._segments(ch, units):
+            out[offset:offset + size] = self._ordered(ch, memoryview(self._read(phys, size)))
+        self._finish(ch, units, irq)
+        return bytes(out)
 
-    def start_dma(self, channel: int, source_data: bytes):
-        if channel not in self.channels:
+    # ------------------------------------------------------------
+    # 전송
+    # ------------------------------------------------------------
+    def _begin(self, ch, units):
+        """이번에 옮길 단위 수 (전송할 수 없으면 0)"""
+        chip = ch.number >> 2
+        if (ch.masked or ch.busy is not None or self.command[chip] & COMMAND_DISABLE
+                or ch.mode & MODE_CASCADE == MODE_CASCADE):
+            return 0
+        return min(units, ch.count + 1)
+
+    def _page_base(self, ch):
+        port = PAGE_PORTS[ch.number] & 0x0F
+        page = self.pages[port]
+        if ch.unit == 2:
+            page &= 0xFE
+        return (self.high_pages[port] << 24) | (page << 16)
+
+    def _segments(self, ch, units):
+        """
+        [(물리 주소, 바이트 수, 데이터 안의 오프셋)] - 주소 카운터가 감겨 도는 곳에서만 나눈다.
+        주소 감소 모드에서는 메모리의 낮은 쪽이 데이터의 뒤쪽이다.
+        """
+        base = self._page_base(ch)
+        unit = ch.unit
+        counter = ch.address
+        down = ch.mode & MODE_DECREMENT
+        segments = []
+        done = 0
+        while done < units:
+            if down:
+                k = min(units - done, counter + 1)
+                first = counter - k + 1
+                counter = (counter - k) & 0xFFFF
+                # 데이터 [done, done + k) 가 메모리 [first, first + k) 에 거꾸로 들어간다
+            else:
+                k = min(units - done, 0x10000 - counter)
+                first = counter
+                counter = (counter + k) & 0xFFFF
+            segments.append((base + first * unit, k * unit, done * unit))
+            done += k
+        return segments
+
+    def _ordered(self, ch, view):
+        """주소 감소 모드면 단위(바이트/워드) 순서를 뒤집는다."""
+        if not ch.mode & MODE_DECREMENT:
+            return view
+        if ch.unit == 2:
+            return view.cast("H")[::-1].tobytes()
+        return view[::-1].tobytes()
+
+    def _write(self, phys, data):
+        size = self.memory.size
+        if phys >= size:
             return
-        address = self.channels[channel]["address"]
-        count = self.channels[channel]["count"]
-        length = min(len(source_data), count)
-        for i in range(length):
-            self.memory.write8(address + i, source_data[i])
-        # 끝나면 IRQ
-        self.ic.request_irq(3)
+        if phys + len(data) > size:
+            data = data[:size - phys]
+        self.memory.write_block(phys, data)
 
-    def set_channel_params(self, channel: int, address: int, count: int, mode: int):
-        if channel in self.channels:
-            self.channels[channel]["address"] = address
-            self.channels[channel]["count"] = count
-            self.channels[channel]["mode"] = mode
\ No newline at end of file
+    def _read(self, phys, length):
+        size = self.memory.size
+        if phys + length <= size:
+            return self.memory.read_block(phys, length)
+        # 메모리 밖은 open bus
+        inside = self.memory.read_block(phys, size - phys) if phys < size else b""
+        return inside + b"\xFF" * (length - len(inside))
+
+    def _finish(self, ch, units, irq):
+        """카운터 최종값을 계산하고 완료를 가상 시간으로 예약한다. 전송한 바이트 수 반환."""
+        nbytes = units * ch.unit
+        step = -units if ch.mode & MODE_DECREMENT else units
+        transfer = _Transfer(self._now(), max(1, nbytes // DMA_BYTES_PER_INSTRUCTION), units,
+                             ch.address, ch.count, (ch.address + step) & 0xFFFF,
+                             (ch.count - units) & 0xFFFF, units == ch.count + 1, irq)
+        ch.busy = transfer
+        self.transfers += 1
+        self.bytes_transferred += nbytes
+        self.ic.schedule(transfer.delay, lambda: self._complete(ch, transfer))
+        return nbytes
+
+    def _complete(self, ch, transfer):
+        if ch.busy is not transfer:
+            # 그 사이 master clear 등으로 취소됨
+            return
+        ch.busy = None
+        ch.request = False
+        if transfer.terminal:
+            self.status[ch.number >> 2] |= 1 << (ch.number & 3)
+            if ch.mode & MODE_AUTO_INIT:
+                ch.address = ch.base_address
+                ch.count = ch.base_count
+            else:
+                ch.address = transfer.end_address
+                ch.count = transfer.end_count
+                ch.masked = True
+        else:
+            ch.address = transfer.end_address
+            ch.count = transfer.end_count
+        if transfer.irq is not None:
+            self.ic.request_irq(transfer.irq)
+
+    def _now(self):
+        return self.ic.clock() if self.ic.clock is not None else 0
+
+    def _current(self, ch):
+        """(현재 주소, 현재 카운트) - 진행 중이면 경과한 가상 시간만큼 보간"""
+        transfer = ch.busy
+        if transfer is None:
+            return ch.address, ch.count
+        done = min(transfer.units, (self._now() - transfer.start) * transfer.units // transfer.delay)
+        step = -done if ch.mode & MODE_DECREMENT else done
+        return (transfer.address + step) & 0xFFFF, (transfer.count - done) & 0xFFFF
+
+    # ------------------------------------------------------------
+    # 포트
+    # ------------------------------------------------------------
+    def _decode(self, port):
+        """포트 -> (칩 번호, 레지스터 번호)"""
+        if port < DMA2_BASE:
+            return 0, port - DMA1_BASE
+        return 1, (port - DMA2_BASE) >> 1
+
+    def _set_page(self, channel, value):
+        port = PAGE_PORTS[channel] & 0x0F
+        self.pages[port] = value
+        # EISA: 하위 페이지를 쓰면 상위 페이지는 0 (ISA 드라이버 호환)
+        self.high_pages[port] = 0
+
+    def read_port(self, port):
+        if HIGH_PAGE_BASE < port < HIGH_PAGE_BASE + 0x10:
+            return self.high_pages[port & 0x0F]
+        if PAGE_BASE < port < PAGE_BASE + 0x10:
+            return self.pages[port & 0x0F]
+        if self.ic.scheduled:
+            self.ic.run_due()
+        chip, reg = self._decode(port)
+        if reg < 8:
+            ch = self.channels[chip * 4 + (reg >> 1)]
+            address, count = self._current(ch)
+            value = count if reg & 1 else address
+            high = self.flipflop[chip]
+            self.flipflop[chip] = not high
+            return (value >> 8) & 0xFF if high else value & 0xFF
+        if reg == REG_STATUS_COMMAND:
+            status = self.status[chip]
+            self.status[chip] = 0
+            for i in range(4):
+                ch = self.channels[chip * 4 + i]
+                if ch.request or ch.busy is not None:
+                    status |= 0x10 << i
+            return status
+        if reg == REG_ALL_MASK:
+            return 0xF0 | sum(1 << i for i in range(4) if self.channels[chip * 4 + i].masked)
+        # 임시 레지스터(0Dh) 등
+        return 0
+
+    def write_port(self, port, value):
+        value &= 0xFF
+        if HIGH_PAGE_BASE < port < HIGH_PAGE_BASE + 0x10:
+            self.high_pages[port & 0x0F] = value
+            return
+        if PAGE_BASE < port < PAGE_BASE + 0x10:
+            port &= 0x0F
+            self.pages[port] = value
+            self.high_pages[port] = 0
+            return
+        chip, reg = self._decode(port)
+        channels = self.channels[chip * 4:chip * 4 + 4]
+        if reg < 8:
+            # 주소/카운트: 기준 값과 현재 값을 같이 쓴다 (하위 바이트 -> 상위 바이트)
+            ch = channels[reg >> 1]
+            high = self.flipflop[chip]
+            self.flipflop[chip] = not high
+            shift = 8 if high else 0
+            if reg & 1:
+                ch.base_count = (ch.base_count & ~(0xFF << shift)) | (value << shift)
+                ch.count = ch.base_count
+            else:
+                ch.base_address = (ch.base_address & ~(0xFF << shift)) | (value << shift)
+                ch.address = ch.base_address
+        elif reg == REG_STATUS_COMMAND:
+            self.command[chip] = value
+        elif reg == REG_REQUEST:
+            channels[value & 3].request = bool(value & 0x04)
+        elif reg == REG_SINGLE_MASK:
+            channels[value & 3].masked = bool(value & 0x04)
+        elif reg == REG_MODE:
+            channels[value & 3].mode = value
+        elif reg == REG_CLEAR_FLIPFLOP:
+            self.flipflop[chip] = False
+        elif reg == REG_MASTER_CLEAR:
+            self.command[chip] = 0
+            self.status[chip] = 0
+            self.flipflop[chip] = False
+            for ch in channels:
+                ch.masked = True
+                ch.request = False
+                ch.busy = None
+        elif reg == REG_CLEAR_MASK:
+            for ch in channels:
+                ch.masked = False
+        elif reg == REG_ALL_MASK:
+            for i, ch in enumerate(channels):
+                ch.masked = bool(value & (1 << i))
+
+    def stats(self):
+        return {
+            "transfers": self.transfers,
+            "bytes": self.bytes_transferred,
+        }
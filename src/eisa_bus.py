@@ -1,22 +1,150 @@
 # eisa_bus.py
 
+IO_PORT_COUNT = 0x10000
+
 class EISABus:
     """
     EISA (Extended ISA) 버스 컨트롤러.
     I/O 포트 접근을 각 장치로 중계한다.
+
+    포트 65536개 각각에 대해 read/write 콜러블을 담은 평면 테이블을 두어
+    포트 접근이 dict 조회 없이 리스트 인덱스 + 호출 한 번으로 끝난다.
+    등록되지 않은 포트는 open bus 기본 핸들러(읽기 0xFF, 쓰기 무시)로 간다.
+
+    장치 인터페이스:
+      read_port(port) -> int, write_port(port, value)            (필수, 8비트)
+      read_port16/write_port16, read_port32/write_port32         (선택, 넓은 접근)
+      read_port_block(port, width, count) -> bytes                (선택, INS 용)
+      write_port_block(port, width, data)                         (선택, OUTS 용)
+    넓은 핸들러가 없으면 8비트 접근 여러 번으로 나눠 처리한다.
     """
 
     def __init__(self):
         self.io_port_devices = {}
+        self.read8_table = [self._open_bus_read8] * IO_PORT_COUNT
+        self.write8_table = [self._open_bus_write] * IO_PORT_COUNT
+        self.read16_table = [None] * IO_PORT_COUNT
+        self.write16_table = [None] * IO_PORT_COUNT
+        self.read32_table = [None] * IO_PORT_COUNT
+        self.write32_table = [None] * IO_PORT_COUNT
+        self.read_block_table = [None] * IO_PORT_COUNT
+        self.write_block_table = [None] * IO_PORT_COUNT
 
-    def register_io_device(self, port: int, device):
-        self.io_port_devices[port] = device
+    # ------------------------------------------------------------
+    # 등록
+    # ------------------------------------------------------------
+    def register_io_device(self, port: int, device, count: int = 1):
+        """
+        port 부터 count 개의 포트를 device 에 연결한다.
+        port 에 range 를 넘겨도 된다. (예: range(0x1F0, 0x1F8))
+        """
+        ports = port if isinstance(port, range) else range(port, port + count)
+        for p in ports:
+            self.io_port_devices[p] = device
+        self.register_io_handlers(
+            ports, device.read_port, device.write_port,
+            read16=getattr(device, "read_port16", None),
+            write16=getattr(device, "write_port16", None),
+            read32=getattr(device, "read_port32", None),
+            write32=getattr(device, "write_port32", None),
+            read_block=getattr(device, "read_port_block", None),
+            write_block=getattr(device, "write_port_block", None),
+        )
 
-    def io_in8(self, port: int) -> int:
-        if port in self.io_port_devices:
-            return self.io_port_devices[port].read_port(port)
+    def register_io_handlers(self, ports, read, write, read16=None, write16=None,
+                             read32=None, write32=None, read_block=None, write_block=None):
+        """장치 객체 없이 콜러블을 직접 연결한다. read/write 가 None 이면 open bus."""
+        if isinstance(ports, int):
+            ports = (ports,)
+        for p in ports:
+            p &= 0xFFFF
+            self.read8_table[p] = read or self._open_bus_read8
+            self.write8_table[p] = write or self._open_bus_write
+            self.read16_table[p] = read16
+            self.write16_table[p] = write16
+            self.read32_table[p] = read32
+            self.write32_table[p] = write32
+            self.read_block_table[p] = read_block
+            self.write_block_table[p] = write_block
+
+    def unregister_io(self, ports):
+        if isinstance(ports, int):
+            ports = (ports,)
+        for p in ports:
+            self.io_port_devices.pop(p & 0xFFFF, None)
+        self.register_io_handlers(ports, None, None)
+
+    @staticmethod
+    def _open_bus_read8(port):
         return 0xFF
 
+    @staticmethod
+    def _open_bus_write(port, value):
+        pass
+
+    # ------------------------------------------------------------
+    # 접근
+    # ------------------------------------------------------------
+    def io_in8(self, port: int) -> int:
+        return self.read8_table[port & 0xFFFF](port & 0xFFFF)
+
     def io_out8(self, port: int, value: int):
-        if port in self.io_port_devices:
-            self.io_port_devices[port].write_port(port, value & 0xFF)
\ No newline at end of file
+        self.write8_table[port & 0xFFFF](port & 0xFFFF, value & 0xFF)
+
+    def io_in16(self, port: int) -> int:
+        port &= 0xFFFF
+        handler = self.read16_table[port]
+        if handler is not None:
+            return handler(port) & 0xFFFF
+        t = self.read8_table
+        hi = (port + 1) & 0xFFFF
+        return (t[port](port) & 0xFF) | ((t[hi](hi) & 0xFF) << 8)
+
+    def io_out16(self, port: int, value: int):
+        port &= 0xFFFF
+        handler = self.write16_table[port]
+        if handler is not None:
+            handler(port, value & 0xFFFF)
+            return
+        t = self.write8_table
+        hi = (port + 1) & 0xFFFF
+        t[port](port, value & 0xFF)
+        t[hi](hi, (value >> 8) & 0xFF)
+
+    def io_in32(self, port: int) -> int:
+        port &= 0xFFFF
+        handler = self.read32_table[port]
+        if handler is not None:
+            return handler(port) & 0xFFFFFFFF
+        return self.io_in16(port) | (self.io_in16(port + 2) << 16)
+
+    def io_out32(self, port: int, value: int):
+        port &= 0xFFFF
+        handler = self.write32_table[port]
+        if handler is not None:
+            handler(port, value & 0xFFFFFFFF)
+            return
+        self.io_out16(port, value & 0xFFFF)
+        self.io_out16(port + 2, (value >> 16) & 0xFFFF)
+
+    def io_read_block(self, port: int, width: int, count: int) -> bytes:
+        """
+        같은 포트에서 width(1/2/4)바이트씩 count 번 읽어 little-endian 바이트열로 반환.
+        장치가 블록 핸들러를 제공하면 한 번의 호출로 끝난다.
+        """
+        port &= 0xFFFF
+        handler = self.read_block_table[port]
+        if handler is not None:
+            return handler(port, width, count)
+        read = (self.io_in8, self.io_in16, None, self.io_in32)[width - 1]
+        return b"".join(read(port).to_bytes(width, "little") for _ in range(count))
+
+    def io_write_block(self, port: int, width: int, data):
+        port &= 0xFFFF
+        handler = self.write_block_table[port]
+        if handler is not None:
+            handler(port, width, data)
+            return
+        write = (self.io_out8, self.io_out16, None, self.io_out32)[width - 1]
+        for i in range(0, len(data), width):
+            write(port, int.from_bytes(data[i:i + width], "little"))
@@ -0,0 +1,358 @@
+# event_log.py
+#
+# 결정적 기록/재생. 게스트 바깥에서 들어오는 사건을 그 사건이 전달된 시점의
+# 실행 완료 명령어 수(cpu.instret)와 함께 바이너리 로그에 남기고, 재생할 때 같은 시점에 넣는다.
+#   - IRQ 전달: 벽시계 타이머/장치가 언제 요청했든, CPU 가 실제로 받아들인 시점만 의미가 있다
+#   - 포트 입력 값: 장치가 등록된 포트의 IN/INS 결과 (open bus 는 항상 0xFF 라 기록하지 않는다)
+#   - 디스크 명령 완료: IDE 명령은 포트 쓰기에서 바로 끝나므로 주입하지 않고,
+#     재생 때 같은 시점/같은 명령/같은 LBA 로 끝나는지 확인하는 검사점으로 쓴다
+#
+# 로그 형식: 헤더 "DXEV" + u16 버전, 이어서 사건마다
+#   u8 종류, varint 직전 사건 이후 instret 증가량, 종류별 내용
+#     EV_END        (없음)                         - 기록을 끝낸 시점
+#     EV_IRQ        u8 IRQ 라인, u8 벡터
+#     EV_PORT_IN    varint 포트, u8 폭(1/2/4), 값(폭 바이트, little endian)
+#     EV_PORT_BLOCK varint 포트, u8 폭, varint 횟수, 데이터(폭*횟수 바이트)
+#     EV_DISK       u8 명령, varint LBA
+# varint 는 LEB128 (7비트씩, 최상위 비트가 이어짐 표시).
+
+import struct
+
+from cpu import NO_SYNC_INSTRET
+
+LOG_MAGIC = b"DXEV"
+LOG_VERSION = 1
+LOG_HEADER = struct.Struct("<4sH")
+
+EV_END = 0
+EV_IRQ = 1
+EV_PORT_IN = 2
+EV_PORT_BLOCK = 3
+EV_DISK = 4
+
+EVENT_NAMES = {EV_END: "end", EV_IRQ: "irq", EV_PORT_IN: "port_in",
+               EV_PORT_BLOCK: "port_block", EV_DISK: "disk"}
+
+def encode_varint(value):
+    out = bytearray()
+    while True:
+        b = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return bytes(out)
+
+def decode_varint(data, pos):
+    """(값, 다음 위치)"""
+    value = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        value |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return value, pos
+        shift += 7
+
+
+class ReplayDivergence(Exception):
+    """재생 중 게스트가 기록과 다른 곳에서 사건을 일으켰다 (명령어 흐름이 갈라짐)."""
+
+
+class _EventHooks:
+    """
+    기계에 훅을 건다: 인터럽트 컨트롤러의 get_pending_interrupt, 장치가 등록된 포트의
+    읽기 핸들러, 디스크의 execute_command 를 인스턴스 속성으로 바꿔 끼운다.
+    detach() 하면 원래대로 돌아간다.
+    """
+
+    def __init__(self):
+        self.cpu = None
+        self.ic = None
+        self.bus = None
+        self.disk = None
+        self._saved_tables = []
+
+    def attach(self, machine):
+        self.cpu = machine.cpu
+        self.ic = machine.ic
+        self.bus = machine.eisa
+        self.disk = machine.disk
+        self.ic.get_pending_interrupt = self._make_pending(self.ic.get_pending_interrupt)
+        self.disk.execute_command = self._make_disk_command(self.disk.execute_command)
+        bus = self.bus
+        open_bus = bus._open_bus_read8
+        for port in range(len(bus.read8_table)):
+            if bus.read8_table[port] is open_bus:
+                continue
+            for table, width in ((bus.read8_table, 1), (bus.read16_table, 2), (bus.read32_table, 4)):
+                original = table[port]
+                if original is not None:
+                    self._saved_tables.append((table, port, original))
+                    table[port] = self._make_port_in(original, width)
+            original = bus.read_block_table[port]
+            if original is not None:
+                self._saved_tables.append((bus.read_block_table, port, original))
+                bus.read_block_table[port] = self._make_port_block(original)
+
+    def detach(self):
+        if self.cpu is None:
+            return
+        self.ic.__dict__.pop("get_pending_interrupt", None)
+        self.disk.__dict__.pop("execute_command", None)
+        for table, port, original in reversed(self._saved_tables):
+            table[port] = original
+        self._saved_tables = []
+        self.cpu = None
+
+    def _irq_line(self, vector):
+        ic = self.ic
+        if ic.master_offset <= vector < ic.master_offset + 8:
+            return vector - ic.master_offset
+        return vector - ic.slave_offset + 8
+
+
+class EventRecorder(_EventHooks):
+    """
+    외부 사건을 path 에 기록한다. 사건이 없을 때의 비용은 훅 호출 한 번뿐이다.
+    close() 가 마지막 instret 을 EV_END 로 남긴다.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION))
+        self.last_instret = 0
+        self.counts = dict.fromkeys(EVENT_NAMES.values(), 0)
+
+    def _emit(self, kind, payload=b""):
+        instret = self.cpu.instret
+        self.file.write(bytes((kind,)) + encode_varint(instret - self.last_instret) + payload)
+        self.last_instret = instret
+        self.counts[EVENT_NAMES[kind]] += 1
+
+    def _make_pending(self, original):
+        def get_pending_interrupt():
+            vector = original()
+            if vector is not None:
+                self._emit(EV_IRQ, bytes((self._irq_line(vector), vector)))
+            return vector
+        return get_pending_interrupt
+
+    def _make_port_in(self, original, width):
+        def read(port):
+            value = original(port)
+            self._emit(EV_PORT_IN, encode_varint(port) + bytes((width,))
+                       + (value & ((1 << (8 * width)) - 1)).to_bytes(width, "little"))
+            return value
+        return read
+
+    def _make_port_block(self, original):
+        def read_block(port, width, count):
+            data = original(port, width, count)
+            self._emit(EV_PORT_BLOCK, encode_varint(port) + bytes((width,))
+                       + encode_varint(count) + data)
+            return data
+        return read_block
+
+    def _make_disk_command(self, original):
+        disk = self.disk
+
+        def execute_command():
+            command = disk.command_reg
+            original()
+            self._emit(EV_DISK, bytes((command,)) + encode_varint(disk.lba_address()))
+        return execute_command
+
+    def stats(self):
+        return dict(self.counts)
+
+    def close(self):
+        if self.file is None:
+            return
+        if self.cpu is not None:
+            self._emit(EV_END)
+        self.detach()
+        self.file.close()
+        self.file = None
+
+
+class EventReplayer(_EventHooks):
+    """
+    기록한 로그를 읽어 같은 instret 에서 같은 사건을 넣는다.
+    - IRQ: 실제 요청(타이머 등)은 무시하고 로그의 벡터만 전달한다
+    - 포트 입력: 장치 핸들러는 부작용 때문에 그대로 부르되 게스트에는 로그 값을 돌려준다
+      (값이 달랐던 횟수는 mismatches 로 센다. 디스크 이미지가 기록 때와 다르면 늘어난다)
+    - 디스크 완료: 시점/명령/LBA 가 다르면 ReplayDivergence
+    로그를 다 쓰고 나면(finished) 더 이상 개입하지 않는다.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version = LOG_HEADER.unpack_from(data, 0)
+        if magic != LOG_MAGIC or version != LOG_VERSION:
+            raise Exception(f"Not an event log: {path}")
+        self.events = self._parse(data, LOG_HEADER.size)
+        self.pos = 0
+        self.end_instret = None
+        if self.events and self.events[-1][0] == EV_END:
+            self.end_instret = self.events.pop()[1]
+        self.mismatches = 0
+        self.counts = dict.fromkeys(EVENT_NAMES.values(), 0)
+        self.next_irq_instret = -1
+        self._update_next_irq()
+
+    @staticmethod
+    def _parse(data, pos):
+        """[(종류, instret, 값...)] - 잘린 마지막 사건(기록 중 비정상 종료)은 버린다."""
+        events = []
+        instret = 0
+        n = len(data)
+        try:
+            while pos < n:
+                kind = data[pos]
+                delta, pos = decode_varint(data, pos + 1)
+                instret += delta
+                if kind == EV_END:
+                    events.append((kind, instret))
+                elif kind == EV_IRQ:
+                    events.append((kind, instret, data[pos], data[pos + 1]))
+                    pos += 2
+                elif kind == EV_PORT_IN:
+                    port, pos = decode_varint(data, pos)
+                    width = data[pos]
+                    value = int.from_bytes(data[pos + 1:pos + 1 + width], "little")
+                    pos += 1 + width
+                    events.append((kind, instret, port, width, value))
+                elif kind == EV_PORT_BLOCK:
+                    port, pos = decode_varint(data, pos)
+                    width = data[pos]
+                    count, pos = decode_varint(data, pos + 1)
+                    block = bytes(data[pos:pos + width * count])
+                    pos += width * count
+                    events.append((kind, instret, port, width, count, block))
+                elif kind == EV_DISK:
+                    lba, end = decode_varint(data, pos + 1)
+                    events.append((kind, instret, data[pos], lba))
+                    pos = end
+                else:
+                    raise Exception(f"Unknown event type {kind} at offset {pos}")
+                if pos > n:
+                    events.pop()
+                    break
+        except IndexError:
+            pass
+        return events
+
+    @property
+    def finished(self):
+        return self.pos >= len(self.events)
+
+    def attach(self, machine):
+        super().attach(machine)
+        self._update_next_irq()
+
+    def detach(self):
+        if self.cpu is not None:
+            self.cpu.sync_instret = NO_SYNC_INSTRET
+        super().detach()
+
+    def _update_next_irq(self):
+        if self.pos < len(self.events) and self.events[self.pos][0] == EV_IRQ:
+            self.next_irq_instret = self.events[self.pos][1]
+        else:
+            self.next_irq_instret = -1
+        if self.cpu is not None:
+            # 블록 컴파일러가 다음 IRQ 위치를 건너뛰지 않도록
+            self.cpu.sync_instret = (NO_SYNC_INSTRET if self.next_irq_instret < 0
+                                     else self.next_irq_instret)
+
+    def irq_pending(self):
+        """다음 사건이 지금 위치의 IRQ 인가 (HLT 로 멈춘 CPU 를 깨울 사건이 있는지)"""
+        return self.next_irq_instret == self.cpu.instret
+
+    def _take(self, kind, description):
+        """다음 사건이 kind 이고 지금 instret 에서 일어난 것이어야 한다."""
+        if self.pos >= len(self.events):
+            return None
+        event = self.events[self.pos]
+        instret = self.cpu.instret
+        if event[0] != kind or event[1] != instret:
+            raise ReplayDivergence(
+                f"replay diverged at instruction {instret}: guest did {description}, "
+                f"log has {EVENT_NAMES[event[0]]} at instruction {event[1]}")
+        self.pos += 1
+        self.counts[EVENT_NAMES[kind]] += 1
+        self._update_next_irq()
+        return event
+
+    def _make_pending(self, original):
+        cpu = self.cpu
+        ic = self.ic
+
+        def get_pending_interrupt():
+            if cpu.instret != self.next_irq_instret:
+                return None
+            _, _, line, vector = self._take(EV_IRQ, "irq")
+            ic.delivered += 1
+            ic.delivered_by_irq[line] += 1
+            return vector
+        return get_pending_interrupt
+
+    def _make_port_in(self, original, width):
+        def read(port):
+            value = original(port)
+            event = self._take(EV_PORT_IN, f"IN {width * 8}-bit from port {port:04X}h")
+            if event is None:
+                return value
+            if event[2] != port or event[3] != width:
+                raise ReplayDivergence(
+                    f"replay diverged at instruction {event[1]}: IN from port {port:04X}h/{width}, "
+                    f"log has port {event[2]:04X}h/{event[3]}")
+            if event[4] != value & ((1 << (8 * width)) - 1):
+                self.mismatches += 1
+            return event[4]
+        return read
+
+    def _make_port_block(self, original):
+        def read_block(port, width, count):
+            data = original(port, width, count)
+            event = self._take(EV_PORT_BLOCK, f"INS x{count} from port {port:04X}h")
+            if event is None:
+                return data
+            if event[2:5] != (port, width, count):
+                raise ReplayDivergence(
+                    f"replay diverged at instruction {event[1]}: INS from port {port:04X}h "
+                    f"x{count}, log has port {event[2]:04X}h x{event[4]}")
+            if event[5] != data:
+                self.mismatches += 1
+            return event[5]
+        return read_block
+
+    def _make_disk_command(self, original):
+        disk = self.disk
+
+        def execute_command():
+            command = disk.command_reg
+            original()
+            event = self._take(EV_DISK, f"disk command {command:02X}h")
+            if event is not None and (event[2], event[3]) != (command, disk.lba_address()):
+                raise ReplayDivergence(
+                    f"replay diverged at instruction {event[1]}: disk command {command:02X}h "
+                    f"LBA {disk.lba_address()}, log has {event[2]:02X}h LBA {event[3]}")
+        return execute_command
+
+    def stats(self):
+        stats = dict(self.counts)
+        stats["remaining"] = len(self.events) - self.pos
+        stats["mismatches"] = self.mismatches
+        return stats
+
+    def close(self):
+        self.detach()
@@ -0,0 +1,148 @@
+# event_loop.py
+
+import collections
+import heapq
+import itertools
+import selectors
+import socket
+import time
+
+class Timer:
+    """call_later / call_every 가 돌려주는 핸들. interval 은 실행 중에도 바꿀 수 있다."""
+
+    def __init__(self, deadline, callback, interval=None):
+        self.deadline = deadline
+        self.callback = callback
+        self.interval = interval
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class EventLoop:
+    """
+    selectors 기반 단일 이벤트 루프.
+    - 읽기 가능한 파일/소켓(stdin, 디버그 소켓 등)
+    - 타이머 (time.monotonic 기준 데드라인 힙)
+    - 작업(work) 콜백: CPU 를 큰 단위로 실행. work(deadline) 가 True 를 반환하면
+      아직 할 일이 있다는 뜻이라 select 는 타임아웃 0으로 폴링만 한다.
+      할 일이 없으면 다음 타이머 데드라인(없으면 무한정)까지 블록한다.
+    다른 스레드에서는 call_soon_threadsafe 로 콜백을 넘기고 루프를 깨운다.
+    """
+
+    # 작업이 있을 때도 타이머/입력을 확인하는 최대 간격(초)
+    MAX_SLICE = 0.02
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.timers = []
+        self._seq = itertools.count()
+        self.work = None
+        self.running = False
+        self._pending = collections.deque()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, self._drain_wakeup)
+
+    # ------------------------------------------------------------
+    # 등록
+    # ------------------------------------------------------------
+    def add_reader(self, fileobj, callback):
+        """fileobj 가 읽기 가능해지면 callback(fileobj) 호출."""
+        self.selector.register(fileobj, selectors.EVENT_READ, callback)
+
+    def remove_reader(self, fileobj):
+        try:
+            self.selector.unregister(fileobj)
+        except (KeyError, ValueError):
+            pass
+
+    def call_later(self, delay, callback):
+        return self._push(Timer(time.monotonic() + delay, callback))
+
+    def call_every(self, interval, callback):
+        return self._push(Timer(time.monotonic() + interval, callback, interval))
+
+    def call_soon_threadsafe(self, callback):
+        self._pending.append(callback)
+        try:
+            self._wake_w.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass
+
+    def set_work(self, work):
+        self.work = work
+
+    def _push(self, timer):
+        heapq.heappush(self.timers, (timer.deadline, next(self._seq), timer))
+        return timer
+
+    def _drain_wakeup(self, sock):
+        try:
+            while sock.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    # ------------------------------------------------------------
+    # 실행
+    # ------------------------------------------------------------
+    def next_deadline(self):
+        timers = self.timers
+        while timers and timers[0][2].cancelled:
+            heapq.heappop(timers)
+        return timers[0][0] if timers else None
+
+    def _run_timers(self, now):
+        timers = self.timers
+        while timers and timers[0][0] <= now:
+            _, _, timer = heapq.heappop(timers)
+            if timer.cancelled:
+                continue
+            if timer.interval is not None:
+                # 밀린 틱을 몰아서 실행하지 않고 지금부터 다시 잡는다
+                timer.deadline = now + timer.interval
+                self._push(timer)
+            timer.callback()
+
+    def _run_pending(self):
+        while self._pending:
+            self._pending.popleft()()
+
+    def run_once(self):
+        now = time.monotonic()
+        self._run_timers(now)
+        self._run_pending()
+
+        deadline = self.next_deadline()
+        busy = False
+        if self.work is not None and self.running:
+            slice_end = now + self.MAX_SLICE
+            if deadline is not None and deadline < slice_end:
+                slice_end = deadline
+            busy = self.work(slice_end)
+
+        if busy or self._pending:
+            timeout = 0
+        else:
+            deadline = self.next_deadline()
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+
+        for key, _ in self.selector.select(timeout):
+            key.data(key.fileobj)
+
+    def run(self):
+        self.running = True
+        while self.running:
+            self.run_once()
+
+    def stop(self):
+        self.running = False
+        self.call_soon_threadsafe(lambda: None)
+
+    def close(self):
+        self.selector.close()
+        self._wake_r.close()
+        self._wake_w.close()
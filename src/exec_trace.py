@@ -0,0 +1,108 @@
+# exec_trace.py
+
+import struct
+import sys
+from array import array
+
+from decoder import format_instr
+
+# op 필드에 인터럽트 진입을 표시할 때 쓰는 비트 (opcode 는 0x1FF 이하)
+TRACE_OP_IRQ = 0x8000
+
+TRACE_MAGIC = b"TRC2"
+
+class TraceRing:
+    """
+    사후 분석용 고정 크기 실행 트레이스 링 버퍼.
+    명령어 하나당 CS(와 그 베이스), IP, opcode 와 주요 레지스터를 미리 할당한 array 에 기록한다.
+    보호 모드에서는 CS 가 셀렉터라 cs << 4 가 코드 주소가 아니므로 디스어셈블은 cs_base 로 한다.
+    기록 중에는 새 객체를 만들지 않고, 꺼져 있을 때(cpu.trace=None)는 아무것도 쓰지 않는다.
+    """
+
+    FIELDS_32 = ("ip", "eax", "ebx", "ecx", "edx", "esp", "eflags", "cs_base")
+
+    def __init__(self, size=4096):
+        self.size = size
+        self.cs = array("H", bytes(2 * size))
+        self.op = array("H", bytes(2 * size))
+        self.ip = array("I", bytes(4 * size))
+        self.eax = array("I", bytes(4 * size))
+        self.ebx = array("I", bytes(4 * size))
+        self.ecx = array("I", bytes(4 * size))
+        self.edx = array("I", bytes(4 * size))
+        self.esp = array("I", bytes(4 * size))
+        self.eflags = array("I", bytes(4 * size))
+        self.cs_base = array("I", bytes(4 * size))
+        self.pos = 0      # 다음에 쓸 위치
+        self.count = 0    # 지금까지 기록한 총 개수
+
+    def record(self, cpu, op):
+        i = self.pos
+        self.cs[i] = cpu.CS
+        self.ip[i] = cpu.EIP
+        self.op[i] = op
+        self.eax[i] = cpu.EAX
+        self.ebx[i] = cpu.EBX
+        self.ecx[i] = cpu.ECX
+        self.edx[i] = cpu.EDX
+        self.esp[i] = cpu.ESP
+        self.eflags[i] = cpu.EFLAGS
+        self.cs_base[i] = cpu.seg_base[1]      # SEG_CS (cpu 가 이 모듈을 가져오므로 숫자로)
+        i += 1
+        self.pos = 0 if i == self.size else i
+        self.count += 1
+
+    def clear(self):
+        self.pos = 0
+        self.count = 0
+
+    def _order(self):
+        """오래된 것부터 최신 순서의 인덱스 목록"""
+        if self.count < self.size:
+            return range(self.count)
+        return list(range(self.pos, self.size)) + list(range(self.pos))
+
+    def dump_text(self, out=None, last=None, decoder=None):
+        """
+        텍스트로 출력. last 가 주어지면 최근 last 개만.
+        decoder 를 넘기면 디스어셈블도 같이 찍는다. 지금 메모리를 decode_uncached 로 읽으므로
+        CPU 디코드 캐시를 채우거나 쓰기 훅을 걸지 않는다.
+        """
+        out = out or sys.stdout
+        order = list(self._order())
+        if last is not None:
+            order = order[-last:]
+        print(f"----- trace: last {len(order)} of {self.count} instructions -----", file=out)
+        for i in order:
+            cs, ip, op = self.cs[i], self.ip[i], self.op[i]
+            regs = (f"EAX={self.eax[i]:08X} EBX={self.ebx[i]:08X} ECX={self.ecx[i]:08X} "
+                    f"EDX={self.edx[i]:08X} ESP={self.esp[i]:08X} FL={self.eflags[i]:08X}")
+            if op & TRACE_OP_IRQ:
+                text = f"<interrupt {op & 0xFF:02X}h>"
+            elif decoder is not None:
+                try:
+                    text = format_instr(decoder.decode_uncached(self.cs_base[i], ip), ip)
+                except Exception:
+                    text = f"op {op:03X}"
+            else:
+                text = f"op {op:03X}"
+            print(f"{cs:04X}:{ip:04X}  {text:<28} {regs}", file=out)
+
+    def dump_binary(self, path):
+        """
+        바이너리 덤프: 헤더(magic, 항목 수) 뒤에 필드별 array 를 오래된 순서로 기록.
+        필드 순서: cs(H), op(H), ip, eax, ebx, ecx, edx, esp, eflags, cs_base (I)
+        """
+        order = self._order()
+        n = len(order)
+        with open(path, "wb") as f:
+            f.write(TRACE_MAGIC + struct.pack("<II", n, self.count))
+            for name in ("cs", "op") + self.FIELDS_32:
+                src = getattr(self, name)
+                if n == self.size and self.pos:
+                    data = src[self.pos:] + src[:self.pos]
+                else:
+                    data = src[:n]
+                if sys.byteorder != "little":
+                    data.byteswap()
+                f.write(data.tobytes())
@@ -0,0 +1,219 @@
+# frame_recorder.py
+#
+# 게스트 화면 녹화. 프레임 주기마다 메인 스레드에서 VGA 메모리(텍스트 B8000h 또는
+# 모드 13h A0000h)와 팔레트를 통째로 복사만 해서 크기가 정해진 큐에 넣고,
+# 변환/인코딩/파일 쓰기는 백그라운드 스레드가 한다.
+# - 직전에 넣은 프레임과 해시가 같으면 넣지 않는다 (duplicates)
+# - 큐가 가득 차 있으면 CPU 를 기다리게 하지 않고 버린다 (dropped)
+# 모든 프레임은 640x400 으로 맞춘다 (텍스트는 8x16 글꼴, 모드 13h 는 가로세로 2배).
+#
+# 출력 형식 (경로로 고른다):
+#   *.y4m        YUV4MPEG2 C444 스트림
+#   *.raw, *.rgb rgb24 raw 스트림 (ffmpeg -f rawvideo -pix_fmt rgb24 -s 640x400)
+#   그 외        디렉터리에 frame_000000.png ... (팔레트 PNG)
+# 중복 프레임을 건너뛰므로 프레임 간격이 일정하지 않다. 프레임마다 녹화 시작 기준
+# 시각(초)을 스트림은 "<경로>.ts", PNG 는 디렉터리의 timestamps.txt 에 "번호 시각" 줄로 남긴다.
+
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+from bios import BDA_VIDEO_MODE, TEXT_BASE, TEXT_COLUMNS, TEXT_ROWS, GRAPHICS_BASE
+from vga_dac import TEXT_COLORS
+from vga_font import GLYPH_WIDTH, GLYPH_HEIGHT, load_font
+
+FRAME_WIDTH = TEXT_COLUMNS * GLYPH_WIDTH    # 640
+FRAME_HEIGHT = TEXT_ROWS * GLYPH_HEIGHT     # 400
+TEXT_BYTES = TEXT_COLUMNS * TEXT_ROWS * 2
+GRAPHICS_WIDTH = 320
+GRAPHICS_HEIGHT = 200
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+def recording_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".y4m":
+        return "y4m"
+    if ext in (".raw", ".rgb"):
+        return "raw"
+    return "png"
+
+def _png_chunk(kind, data):
+    return (struct.pack(">I", len(data)) + kind + data
+            + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+def _unpack_palette(packed):
+    """ARGB8888 uint32 표(bytes, little endian) -> 256 x (r, g, b)"""
+    return [(packed[i + 2], packed[i + 1], packed[i]) for i in range(0, 1024, 4)]
+
+
+class FrameRecorder:
+    """
+    capture() 는 메인 스레드(프레임 주기)에서 부르고, 나머지는 녹화 스레드에서 돈다.
+    카운터: captured(큐에 넣음), written(파일에 씀), duplicates(같은 프레임이라 건너뜀),
+    dropped(큐가 가득 차 버림).
+    """
+
+    def __init__(self, path, fps=60, queue_size=8, font_path=None):
+        self.path = path
+        self.format = recording_format(path)
+        self.fps = fps
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.font = load_font(font_path)
+        self.start_time = time.monotonic()
+        self.last_hash = None
+        self.captured = 0
+        self.written = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.error = None
+        self._attr_rows = {}       # 텍스트 속성 -> 글리프 줄 비트 패턴(0~255)별 8픽셀
+
+        if self.format == "png":
+            os.makedirs(path, exist_ok=True)
+            self.out = None
+            self.timestamps = open(os.path.join(path, "timestamps.txt"), "w")
+        else:
+            self.out = open(path, "wb")
+            self.timestamps = open(path + ".ts", "w")
+            if self.format == "y4m":
+                self.out.write(f"YUV4MPEG2 W{FRAME_WIDTH} H{FRAME_HEIGHT} F{fps}:1 Ip A1:1 C444\n"
+                               .encode())
+
+        self.thread = threading.Thread(target=self._run, name="frame-recorder", daemon=True)
+        self.thread.start()
+
+    # ------------------------------------------------------------
+    # 메인 스레드 쪽
+    # ------------------------------------------------------------
+    def capture(self, memory, palette):
+        """
+        현재 화면을 큐에 넣는다. 넣었으면 True.
+        palette 는 VGADAC 처럼 packed(ARGB8888 array) 가 있는 객체 (모드 13h 에서만 쓴다).
+        """
+        timestamp = time.monotonic() - self.start_time
+        mode = memory.read8(BDA_VIDEO_MODE)
+        if mode == 0x13:
+            frame = memory.read_block(GRAPHICS_BASE, GRAPHICS_WIDTH * GRAPHICS_HEIGHT)
+            colors = palette.packed.tobytes()
+        else:
+            frame = memory.read_block(TEXT_BASE, TEXT_BYTES)
+            colors = None
+        key = hash((mode, frame, colors))
+        if key == self.last_hash:
+            self.duplicates += 1
+            return False
+        try:
+            self.queue.put_nowait((timestamp, mode, frame, colors))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.last_hash = key
+        self.captured += 1
+        return True
+
+    def stats(self):
+        return {
+            "captured": self.captured,
+            "written": self.written,
+            "duplicates": self.duplicates,
+            "dropped": self.dropped,
+        }
+
+    def close(self):
+        """큐에 남은 프레임을 모두 쓰고 파일을 닫는다."""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        if self.out is not None:
+            self.out.close()
+        self.timestamps.close()
+        if self.error is not None:
+            print(f"[Recorder] stopped on error: {self.error}")
+
+    # ------------------------------------------------------------
+    # 녹화 스레드
+    # ------------------------------------------------------------
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            timestamp, mode, frame, colors = item
+            try:
+                if mode == 0x13:
+                    image, palette = self._render_graphics(frame), _unpack_palette(colors)
+                else:
+                    image, palette = self._render_text(frame), TEXT_COLORS
+                self._write(image, palette)
+                self.timestamps.write(f"{self.written} {timestamp:.6f}\n")
+            except Exception as e:
+                # 이후 프레임은 큐가 차면서 dropped 로 센다
+                self.error = e
+                return
+            self.written += 1
+
+    def _render_graphics(self, frame):
+        """320x200 색 번호 -> 640x400 (픽셀과 줄을 두 번씩)"""
+        wide = bytearray(len(frame) * 2)
+        wide[0::2] = frame
+        wide[1::2] = frame
+        line = GRAPHICS_WIDTH * 2
+        rows = [wide[y:y + line] for y in range(0, len(wide), line)]
+        return b"".join(row for row in rows for _ in (0, 1))
+
+    def _patterns(self, attr):
+        rows = self._attr_rows.get(attr)
+        if rows is None:
+            fg = attr & 0x0F
+            bg = (attr >> 4) & 0x07     # 7비트 깜박임은 무시
+            rows = [bytes(fg if bits & (0x80 >> x) else bg for x in range(GLYPH_WIDTH))
+                    for bits in range(256)]
+            self._attr_rows[attr] = rows
+        return rows
+
+    def _render_text(self, text):
+        """80x25 글자/속성 -> 640x400 색 번호 (0~15). 커서는 그리지 않는다."""
+        font = self.font
+        lines = []
+        for row in range(TEXT_ROWS):
+            start = row * TEXT_COLUMNS * 2
+            cells = [(text[i] * GLYPH_HEIGHT, self._patterns(text[i + 1]))
+                     for i in range(start, start + TEXT_COLUMNS * 2, 2)]
+            for y in range(GLYPH_HEIGHT):
+                lines.append(b"".join(rows[font[glyph + y]] for glyph, rows in cells))
+        return b"".join(lines)
+
+    def _write(self, image, palette):
+        if self.format == "png":
+            self._write_png(image, palette)
+            return
+        if self.format == "y4m":
+            planes = []
+            # BT.601 (제한 범위) Y, U(Cb), V(Cr)
+            for offset, kr, kg, kb in ((16, 66, 129, 25), (128, -38, -74, 112), (128, 112, -94, -18)):
+                table = bytes(min(255, max(0, offset + ((kr * r + kg * g + kb * b + 128) >> 8)))
+                              for r, g, b in palette)
+                planes.append(image.translate(table.ljust(256, b"\0")))
+            self.out.write(b"FRAME\n")
+            self.out.write(b"".join(planes))
+            return
+        rgb = bytearray(len(image) * 3)
+        for c in range(3):
+            table = bytes(color[c] for color in palette).ljust(256, b"\0")
+            rgb[c::3] = image.translate(table)
+        self.out.write(rgb)
+
+    def _write_png(self, image, palette):
+        rows = b"".join(b"\0" + image[y:y + FRAME_WIDTH]
+                        for y in range(0, len(image), FRAME_WIDTH))
+        data = (PNG_SIGNATURE
+                + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", FRAME_WIDTH, FRAME_HEIGHT, 8, 3, 0, 0, 0))
+                + _png_chunk(b"PLTE", b"".join(bytes(color) for color in palette))
+                + _png_chunk(b"IDAT", zlib.compress(rows, 6))
+                + _png_chunk(b"IEND", b""))
+        with open(os.path.join(self.path, f"frame_{self.written:06d}.png"), "wb") as f:
+            f.write(data)
@@ -0,0 +1,316 @@
+# gdb_stub.py
+
+import os
+import socket
+
+from cpu import SEG_CS
+
+# GDB i386 레지스터 순서 (gdb/features/i386/32bit-core.xml)
+GDB_REGS = ("EAX", "ECX", "EDX", "EBX", "ESP", "EBP", "ESI", "EDI",
+            "EIP", "EFLAGS", "CS", "SS", "DS", "ES", "FS", "GS")
+
+SIGINT = 2
+SIGILL = 4
+SIGTRAP = 5
+
+def checksum(data: bytes) -> int:
+    return sum(data) & 0xFF
+
+def rle_encode(data: bytes) -> bytes:
+    """
+    GDB RSP 런렝스 인코딩: 'c*N' 은 c 를 (N - 29)번 더 반복한다는 뜻.
+    반복 횟수 문자가 '#', '$' 가 되는 길이(6, 7)는 피한다.
+    """
+    out = bytearray()
+    i = 0
+    n = len(data)
+    while i < n:
+        ch = data[i]
+        run = 1
+        while i + run < n and data[i + run] == ch and run < 98:
+            run += 1
+        if run >= 4:
+            extra = run - 1
+            if extra + 29 in (ord("#"), ord("$")):
+                extra = 5   # '"' - 반복 6회로 줄이고 나머지는 다음 루프에서
+            out.append(ch)
+            out += b"*" + bytes((extra + 29,))
+            i += extra + 1
+        else:
+            out.append(ch)
+            i += 1
+    return bytes(out)
+
+
+class GDBStub:
+    """
+    로컬 TCP 또는 Unix 소켓 위의 GDB Remote Serial Protocol 서버.
+    이벤트 루프에 소켓을 등록해 동작하므로, 게스트는 멈춘 사이가 아니면 전속력으로 돈다.
+
+    주소는 모두 선형 주소로 다룬다(리얼 모드에서는 CS*16+IP).
+    단 'g'/'p' 로 보내는 EIP 는 CPU 레지스터 그대로(CS 기준 오프셋)라서, GDB 에서 $pc 와
+    브레이크포인트/메모리 주소가 CS 베이스만큼 어긋나 보인다 (코드 위치는 $cs*16+$pc 로 볼 것).
+    'c ADDR'/'s ADDR' 의 ADDR 도 선형 주소로 받아 EIP = ADDR - CS 베이스로 바꾼다.
+    resume()/halt() 는 메인 루프의 실행/정지 상태를 바꾸는 콜백이고,
+    실행이 멈추면 메인 루프가 target_stopped(signal) 로 알려 준다.
+    """
+
+    def __init__(self, cpu, debugger, loop, address, resume, halt):
+        self.cpu = cpu
+        self.dbg = debugger
+        self.loop = loop
+        self.resume = resume
+        self.halt = halt
+        self.client = None
+        self.buffer = b""
+        self.waiting_stop = False   # c 명령 뒤 정지 응답을 기다리는 중
+        self.unix_path = None
+
+        if isinstance(address, str):
+            self.unix_path = address
+            if os.path.exists(address):
+                os.unlink(address)
+            self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(address)
+        self.server.listen(1)
+        self.server.setblocking(False)
+        loop.add_reader(self.server, self._on_accept)
+
+    def close(self):
+        self._drop_client()
+        self.loop.remove_reader(self.server)
+        self.server.close()
+        if self.unix_path and os.path.exists(self.unix_path):
+            os.unlink(self.unix_path)
+
+    @property
+    def attached(self):
+        return self.client is not None
+
+    # ------------------------------------------------------------
+    # 소켓
+    # ------------------------------------------------------------
+    def _on_accept(self, server):
+        try:
+            conn, _ = server.accept()
+        except BlockingIOError:
+            return
+        if self.client is not None:
+            conn.close()
+            return
+        conn.setblocking(False)
+        self.client = conn
+        self.buffer = b""
+        self.loop.add_reader(conn, self._on_data)
+        print("[GDB] client attached")
+        # 연결되면 게스트를 멈추고 GDB 의 지시를 기다린다
+        self.halt()
+
+    def _drop_client(self):
+        if self.client is not None:
+            self.loop.remove_reader(self.client)
+            self.client.close()
+            self.client = None
+            self.waiting_stop = False
+            print("[GDB] client detached")
+
+    def _on_data(self, conn):
+        try:
+            data = conn.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._drop_client()
+            return
+        self.buffer += data
+        self._process_buffer()
+
+    def _process_buffer(self):
+        while self.buffer:
+            first = self.buffer[:1]
+            if first in (b"+", b"-"):
+                self.buffer = self.buffer[1:]
+            elif first == b"\x03":
+                # Ctrl-C: 실행 중단
+                self.buffer = self.buffer[1:]
+                self.halt()
+                self.target_stopped(SIGINT)
+            elif first == b"$":
+                end = self.buffer.find(b"#")
+                if end < 0 or len(self.buffer) < end + 3:
+                    return
+                payload = self.buffer[1:end]
+                self.buffer = self.buffer[end + 3:]
+                self._send_raw(b"+")
+                self._handle(payload.decode("latin-1"))
+                if self.client is None:
+                    return
+            else:
+                self.buffer = self.buffer[1:]
+
+    def _send_raw(self, data):
+        if self.client is None:
+            return
+        self.client.setblocking(True)
+        try:
+            self.client.sendall(data)
+        except OSError:
+            self._drop_client()
+            return
+        self.client.setblocking(False)
+
+    def send(self, payload: str):
+        body = rle_encode(payload.encode("latin-1"))
+        self._send_raw(b"$" + body + b"#" + f"{checksum(body):02x}".encode())
+
+    def target_stopped(self, signal=SIGTRAP):
+        """메인 루프에서 게스트가 멈췄을 때 호출."""
+        if not self.waiting_stop:
+            return
+        self.waiting_stop = False
+        last = self.dbg.last_stop
+        if signal == SIGTRAP and last is not None and last[0] == "watchpoint":
+            self.send(f"T{signal:02x}watch:{last[1]:x};")
+        else:
+            self.send(f"S{signal:02x}")
+
+    # ------------------------------------------------------------
+    # 패킷 처리
+    # ------------------------------------------------------------
+    def _handle(self, packet):
+        cmd = packet[:1]
+        args = packet[1:]
+        try:
+            if cmd == "?":
+                self.send(f"S{SIGTRAP:02x}")
+            elif cmd == "g":
+                self.send("".join(self._reg_hex(name) for name in GDB_REGS))
+            elif cmd == "G":
+                for i, name in enumerate(GDB_REGS):
+                    chunk = args[i * 8:(i + 1) * 8]
+                    if len(chunk) == 8:
+                        self._set_reg(name, int.from_bytes(bytes.fromhex(chunk), "little"))
+                self.send("OK")
+            elif cmd == "p":
+                idx = int(args, 16)
+                self.send(self._reg_hex(GDB_REGS[idx]) if idx < len(GDB_REGS) else "E01")
+            elif cmd == "P":
+                idx_str, val_str = args.split("=")
+                idx = int(idx_str, 16)
+                if idx >= len(GDB_REGS):
+                    self.send("E01")
+                    return
+                self._set_reg(GDB_REGS[idx], int.from_bytes(bytes.fromhex(val_str), "little"))
+                self.send("OK")
+            elif cmd == "m":
+                addr_str, len_str = args.split(",")
+                self.send(self._read_memory(int(addr_str, 16), int(len_str, 16)).hex())
+            elif cmd == "M":
+                head, hexdata = args.split(":")
+                addr_str, _ = head.split(",")
+                self._write_memory(int(addr_str, 16), bytes.fromhex(hexdata))
+                self.send("OK")
+            elif cmd == "c":
+                if args:
+                    self._set_linear_ip(int(args, 16))
+                self.waiting_stop = True
+                self.dbg.go()
+                self.resume()
+            elif cmd == "s":
+                if args:
+                    self._set_linear_ip(int(args, 16))
+                self._single_step()
+            elif cmd in ("Z", "z"):
+                self._breakpoint(cmd == "Z", args)
+            elif cmd == "H":
+                self.send("OK")
+            elif cmd == "k":
+                self._drop_client()
+            elif cmd == "D":
+                self.send("OK")
+                self.dbg.go()
+                self.resume()
+                self._drop_client()
+            elif packet.startswith("qSupported"):
+                self.send("PacketSize=4000")
+            elif packet == "qAttached":
+                self.send("1")
+            elif packet == "qC":
+                self.send("QC1")
+            elif packet in ("qfThreadInfo",):
+                self.send("m1")
+            elif packet in ("qsThreadInfo",):
+                self.send("l")
+            else:
+                self.send("")
+        except (ValueError, IndexError):
+            self.send("E01")
+        except Exception:
+            # 메모리 범위 밖 등
+            self.send("E14")
+
+    def _single_step(self):
+        try:
+            self.cpu.step()
+        except Exception as e:
+            print(f"[GDB] step exception: {e}")
+            self.send(f"S{SIGILL:02x}")
+            return
+        self.dbg.watch_hit = None
+        self.send(f"S{SIGTRAP:02x}")
+
+    def _breakpoint(self, insert, args):
+        kind, addr_str, length_str = args.split(",")[:3]
+        addr = int(addr_str, 16)
+        length = int(length_str, 16)
+        if kind in ("0", "1"):
+            # 소프트웨어/하드웨어 실행 브레이크포인트 모두 디버거의 주소 set 으로
+            if insert:
+                self.dbg.add_breakpoint(addr)
+            else:
+                self.dbg.delete(addr)
+            self.send("OK")
+        elif kind == "2":
+            # 쓰기 워치포인트 - 바이트마다 하나씩
+            for a in range(addr, addr + max(1, length)):
+                if insert:
+                    self.dbg.add_watchpoint(a)
+                else:
+                    self.dbg.delete(a)
+            self.send("OK")
+        else:
+            self.send("")
+
+    # ------------------------------------------------------------
+    # 레지스터 / 메모리
+    # ------------------------------------------------------------
+    def _reg_hex(self, name):
+        return (getattr(self.cpu, name) & 0xFFFFFFFF).to_bytes(4, "little").hex()
+
+    def _set_reg(self, name, value):
+        if name in ("CS", "SS", "DS", "ES", "FS", "GS"):
+            value &= 0xFFFF
+        setattr(self.cpu, name, value & 0xFFFFFFFF)
+
+    def _set_linear_ip(self, addr):
+        """선형 주소 addr 에서 다시 시작: 지금 CS 세그먼트 안의 오프셋이어야 한다"""
+        cpu = self.cpu
+        offset = addr - cpu.seg_base[SEG_CS]
+        if not 0 <= offset <= cpu.seg_limit[SEG_CS]:
+            raise ValueError(f"address {addr:X} is outside the current code segment")
+        cpu.EIP = offset
+
+    def _read_memory(self, addr, length):
+        """끝을 넘는 부분은 잘라서 읽는다. 시작 주소부터 메모리 밖이면 예외 (-> E14)"""
+        mem = self.cpu.mem
+        if not 0 <= addr < mem.size:
+            raise Exception(f"address {addr:X} is outside guest memory")
+        return mem.read_block(addr, min(length, mem.size - addr))
+
+    def _write_memory(self, addr, data):
+        self.cpu.mem.write_block(addr, data)
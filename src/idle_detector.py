@@ -0,0 +1,144 @@
+# idle_detector.py
+#
+# 게스트가 할 일 없이 도는 상태를 찾아 호스트 CPU 를 쉬게 한다.
+#  - HLT 로 멈춰 있음 (IRQ 가 올 때까지)
+#  - 부수 효과 없는 짧은 루프: JMP $ (EB FE), 메모리/레지스터를 읽고 제자리로 분기하는 폴링 루프.
+#    루프를 한 바퀴 실제로 실행해 보고 레지스터/플래그/IP 가 처음과 완전히 같으면(고정점)
+#    IRQ 가 메모리를 바꾸기 전까지 영원히 같은 바퀴를 돈다고 본다.
+# 메모리 쓰기, 포트 I/O, INT 등이 있는 루프는 유휴로 보지 않는다 (폴링하는 포트 값은
+# 호스트 시간에 따라 바뀔 수 있다).
+#
+# 실시간 실행(main.py)은 유휴면 CPU 실행을 멈추고 다음 타이머/입력까지 이벤트 루프에서 잔다.
+# 일괄 실행(batch_run.py)은 루프를 통째로 몇 바퀴 건너뛰어(instret 만 증가) 다음 가상 시간
+# 사건까지 앞당긴다. 바퀴 단위로만 건너뛰므로 실제로 실행한 것과 결과가 같다.
+
+from cpu import DISPATCH, FLAG_IF, SEG_CS
+
+# 유휴 루프 한 바퀴의 최대 명령어 수
+MAX_LOOP_INSTRUCTIONS = 16
+# 깨어난 뒤(ISR 실행 후) 같은 유휴 상태로 돌아오는지 지켜볼 최대 스텝 수
+RESUME_STEPS = 256
+
+# 레지스터/플래그만 바꾸는 명령어 (메모리 쓰기, 포트 I/O, 인터럽트, 세그먼트 로드 없음)
+IDLE_SAFE_OPS = frozenset((0x90, 0x05, 0x8B, 0xAC, 0xE2, 0xEB, 0xE9)
+                          + tuple(range(0x38, 0x3E)) + tuple(range(0xB0, 0xC0))
+                          + tuple(range(0x70, 0x80)))
+
+
+class IdleDetector:
+    """
+    check() 는 실행 단위(chunk)가 끝날 때마다 부른다. 두 번 연속 같은 주소에서 끝났을 때만
+    한 바퀴를 시험 실행(probe)하므로 바쁜 코드에는 거의 비용이 없다.
+    유휴로 판정하면 그 상태(idle_state)를 기억해 두고, resume() 은 IRQ 로 깨어난 게스트가
+    같은 상태로 돌아오면 바로 다시 유휴로 판정한다.
+    통계: idle_entries(유휴 판정 횟수), probes, skipped_instructions(일괄 실행에서 건너뛴 명령어 수).
+    """
+
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.period = 0            # 유휴 루프 한 바퀴의 명령어 수 (HLT 는 0)
+        self.idle_state = None
+        self._last_end = None
+        self.idle_entries = 0
+        self.probes = 0
+        self.skipped_instructions = 0
+
+    def reset(self):
+        self.period = 0
+        self.idle_state = None
+        self._last_end = None
+
+    def _snapshot(self):
+        cpu = self.cpu
+        return (cpu.EAX, cpu.ECX, cpu.EDX, cpu.EBX, cpu.ESP, cpu.EBP, cpu.ESI, cpu.EDI,
+                cpu.EIP, cpu.EFLAGS, tuple(cpu.seg_base), cpu.halted)
+
+    def wake_pending(self):
+        """다음 스텝에서 인터럽트가 들어오는가 (IRQ 요청 또는 재생할 IRQ 위치)"""
+        cpu = self.cpu
+        return bool(cpu.EFLAGS & FLAG_IF) and (cpu.ic.has_pending()
+                                               or cpu.sync_instret <= cpu.instret)
+
+    def check(self, limit=MAX_LOOP_INSTRUCTIONS):
+        """지금 게스트가 유휴면 True. 시험 실행은 limit 명령어를 넘지 않는다."""
+        cpu = self.cpu
+        if cpu.halted:
+            # HLT 동안은 명령어 수(가상 시간)가 흐르지 않으므로 예약된 사건(DMA 완료 등)을 당겨 온다
+            if cpu.ic.run_next() or self.wake_pending():
+                return False
+            self.period = 0
+            return self._enter()
+        end = cpu.seg_base[SEG_CS] + cpu.EIP
+        if end != self._last_end:
+            self._last_end = end
+            return False
+        return self.probe(limit)
+
+    def probe(self, limit=MAX_LOOP_INSTRUCTIONS):
+        """
+        지금 위치에서 루프 한 바퀴를 실제로 실행해 본다 (명령어는 정상적으로 실행/계수된다).
+        처음 상태로 돌아오면 유휴 루프로 보고 True.
+        """
+        if limit <= 0:
+            return False
+        cpu = self.cpu
+        decoder = cpu.decoder
+        self.probes += 1
+        if self.wake_pending():
+            return False
+        start = self._snapshot()
+        for n in range(1, min(limit, MAX_LOOP_INSTRUCTIONS) + 1):
+            ins = decoder.decode(cpu.seg_base[SEG_CS], cpu.EIP)
+            if ins.op not in IDLE_SAFE_OPS or DISPATCH[ins.op] is None:
+                return False
+            cpu.step()
+            if self._snapshot() == start:
+                self.period = n
+                return self._enter()
+        return False
+
+    def _enter(self):
+        self.idle_state = self._snapshot()
+        self.idle_entries += 1
+        return True
+
+    def resume(self):
+        """
+        유휴였던 게스트를 조금씩 실행해(IRQ 진입, ISR, IRET) 같은 유휴 상태로 돌아오면 True.
+        RESUME_STEPS 안에 돌아오지 않으면 유휴 상태를 잊고 False (평소처럼 실행).
+        """
+        if self.idle_state is None:
+            return False
+        cpu = self.cpu
+        if cpu.halted and not self.wake_pending():
+            return True
+        state = self.idle_state
+        self.idle_state = None
+        step = cpu.step
+        for _ in range(RESUME_STEPS):
+            step()
+            if self._snapshot() == state:
+                # ISR 가 메모리를 바꿨을 수 있으므로 루프를 한 바퀴 다시 확인한다
+                return self.check() if cpu.halted else self.probe()
+        return False
+
+    def fast_forward(self, target_instret):
+        """
+        유휴 루프를 target_instret(과 cpu.sync_instret, 다음 예약 사건)을 넘지 않는 만큼 통째로 건너뛴다.
+        건너뛴 명령어 수를 반환한다.
+        """
+        cpu = self.cpu
+        if self.idle_state is None or self.period == 0:
+            return 0
+        target = min(target_instret, cpu.sync_instret, cpu.ic.next_due)
+        skipped = max(0, target - cpu.instret) // self.period * self.period
+        cpu.instret += skipped
+        self.skipped_instructions += skipped
+        return skipped
+
+    def stats(self):
+        return {
+            "idle_entries": self.idle_entries,
+            "probes": self.probes,
+            "skipped_instructions": self.skipped_instructions,
+        }
@@ -1,9 +1,17 @@
 # interrupt_controller.py
 
+import heapq
+import itertools
+
+# 예약된 사건이 없을 때의 next_due
+NEVER = 1 << 62
+
 class InterruptController:
     """
     간단한 PIC(PIT, 마스터/슬레이브)를 합쳐서 추상화한 클래스.
     IRQ0 ~ IRQ15 신호를 관리하고, CPU에 인터럽트가 필요함을 알려준다.
+    장치가 가상 시간(명령어 수) 뒤에 일어날 일을 schedule() 로 예약해 두면
+    때가 된 뒤 처음 인터럽트를 확인할 때 실행한다 (clock 은 Machine 이 CPU instret 으로 연결).
     """
 
     def __init__(self):
@@ -13,24 +21,83 @@ class InterruptController:
         # DOS 시절에는 마스터 0x08, 슬레이브 0x70. 실제로는 OS별 재설정 가능.
         self.master_offset = 0x08
         self.slave_offset = 0x70
+        # 통계: CPU 로 전달된 IRQ 수 (전체 / 라인별)
+        self.delivered = 0
+        self.delivered_by_irq = [0]*16
+        # 지표 (enable_metrics): 요청부터 전달까지 걸린 명령어 수 히스토그램
+        self.irq_latency = None
+        self.requested_at = [0]*16
+        # 가상 시간 예약: (due, seq, callback) 힙
+        self.clock = None
+        self.scheduled = []
+        self.next_due = NEVER
+        self._seq = itertools.count()
 
     def request_irq(self, irq_num: int):
         if 0 <= irq_num < 16:
+            if self.irq_latency is not None and not self.irq_requests[irq_num]:
+                self.requested_at[irq_num] = self.clock()
             self.irq_requests[irq_num] = True
 
+    def enable_metrics(self, histogram):
+        """IRQ 요청부터 CPU 전달까지의 지연(명령어 수)을 histogram 에 기록한다 (clock 필요)."""
+        self.irq_latency = histogram
+
     def clear_irq(self, irq_num: int):
         if 0 <= irq_num < 16:
             self.irq_requests[irq_num] = False
 
+    def has_pending(self):
+        """요청 상태를 바꾸지 않고 대기 중인 IRQ 가 있는지만 본다."""
+        if self.scheduled and self.next_due <= self.clock():
+            self.run_due()
+        return any(self.irq_requests)
+
+    # ------------------------------------------------------------
+    # 가상 시간 예약
+    # ------------------------------------------------------------
+    def schedule(self, delay, callback):
+        """delay 명령어 뒤에 callback() 을 부른다. 시계가 연결되지 않았으면 바로 부른다."""
+        if self.clock is None:
+            callback()
+            return
+        heapq.heappush(self.scheduled, (self.clock() + delay, next(self._seq), callback))
+        self.next_due = self.scheduled[0][0]
+
+    def run_due(self):
+        """때가 된 예약을 모두 실행한다."""
+        scheduled = self.scheduled
+        now = self.clock()
+        while scheduled and scheduled[0][0] <= now:
+            heapq.heappop(scheduled)[2]()
+        self.next_due = scheduled[0][0] if scheduled else NEVER
+
+    def run_next(self):
+        """
+        가장 이른 예약을 지금 실행한다. HLT 로 멈춘 동안에는 명령어 수(가상 시간)가
+        흐르지 않으므로 그 사이의 시간을 건너뛸 때 쓴다. 실행했으면 True.
+        """
+        if not self.scheduled:
+            return False
+        heapq.heappop(self.scheduled)[2]()
+        self.next_due = self.scheduled[0][0] if self.scheduled else NEVER
+        return True
+
     def get_pending_interrupt(self):
         """
         우선순위가 가장 높은(숫자가 낮은) IRQ를 찾아서
         해당 IRQ를 반환하고, 요청 상태를 클리어한다.
         없으면 None 반환.
         """
+        if self.scheduled and self.next_due <= self.clock():
+            self.run_due()
         for irq_num in range(16):
             if self.irq_requests[irq_num]:
                 self.irq_requests[irq_num] = False
+                self.delivered += 1
+                self.delivered_by_irq[irq_num] += 1
+                if self.irq_latency is not None:
+                    self.irq_latency.observe(self.clock() - self.requested_at[irq_num])
                 # 0~7이면 마스터, 8~15이면 슬레이브
                 if irq_num < 8:
                     return self.master_offset + irq_num
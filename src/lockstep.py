@@ -0,0 +1,540 @@
+# lockstep.py
+#
+# 차등 검증: 최적화한 실행 엔진(디코드 캐시, DISPATCH 표, 블록 컴파일러)과 기준 인터프리터
+# (reference_cpu.ReferenceInterpreter)를 같은 디스크 이미지로 따로 만든 Machine 위에서 나란히
+# 실행한다. 블록 경계마다 레지스터/플래그, 명령어 수, 그 사이에 쓴 메모리(주소와 내용)를 비교하고
+# 처음 갈라진 곳을 디스어셈블리와 기준 쪽 실행 트레이스와 함께 보고한다.
+# --fuzz 를 주면 무작위 명령어 열로 같은 비교를 되풀이한다.
+#
+# 기준 인터프리터는 디코더와 연산 표를 따로 구현하므로 디코더/핸들러/블록 컴파일러의 버그를 잡는다.
+# 다만 시스템 명령(INT/IRET/RETF/JMP far, 포트 I/O, 0F xx 등)과 인터럽트 진입은 기준 쪽도
+# cpu.step 에 맡기므로 이 경로는 블록 컴파일러와 인터프리터의 차이만 검증한다
+# (결과 줄의 "delegated" 가 그렇게 실행한 명령어 수). 보고서의 디스어셈블리는 공유 디코더로 찍는다.
+#
+#   python lockstep.py disk.img --max-instructions 1000000 --timer-interval 20000
+#   python lockstep.py --fuzz 200 --length 24
+#
+# 종료 코드: 0 = 일치, 1 = 갈라짐, 2 = 잘못된 인자
+
+import argparse
+import io
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+
+from machine import Machine
+from memory import Memory, PAGE_SHIFT, PAGE_SIZE
+from decoder import Decoder, format_instr
+from exec_trace import TraceRing
+from reference_cpu import ReferenceInterpreter
+from cpu import DISPATCH, FLAG_IF, SEG_CS
+
+EXIT_MATCH = 0
+EXIT_DIVERGENCE = 1
+
+# 보고서에 넣을 기준 쪽 트레이스 길이 / 메모리 차이 개수
+TRACE_CONTEXT = 32
+MAX_REPORTED_BYTES = 16
+
+# 퍼징용 컴파일 임계값 (두 번째 실행부터 컴파일해 블록 경로를 바로 탄다)
+FUZZ_THRESHOLD = 2
+
+
+class LockstepDivergence(Exception):
+    """최적화 엔진과 기준 인터프리터가 갈라졌다. report 는 여러 줄짜리 자세한 보고서."""
+
+    def __init__(self, summary, report):
+        super().__init__(summary)
+        self.report = report
+
+
+class WriteLog:
+    """
+    Memory 의 모든 페이지에 쓰기 훅을 걸어 쓰인 범위 (addr, size) 를 모은다.
+    페이지마다 훅이 걸리므로 검증 중에는 메모리 쓰기가 느려진다.
+    """
+
+    def __init__(self, mem):
+        self.mem = mem
+        self.entries = []
+        self.pages = range((mem.size + PAGE_SIZE - 1) >> PAGE_SHIFT)
+        for page in self.pages:
+            mem.add_write_hook(page, self._on_write)
+
+    def _on_write(self, addr, size, value):
+        self.entries.append((addr, size))
+
+    def take(self):
+        entries = self.entries
+        self.entries = []
+        return entries
+
+    def close(self):
+        for page in self.pages:
+            self.mem.remove_write_hook(page, self._on_write)
+
+
+def _touched(entries):
+    """쓰기 기록 -> 쓰인 바이트 주소 집합 (쓰기 크기/순서와 무관하게 비교하기 위해)"""
+    out = set()
+    for addr, size in entries:
+        out.update(range(addr, addr + size))
+    return out
+
+def _ranges(addrs):
+    """정렬된 주소 집합을 (시작, 길이) 구간으로 묶는다."""
+    out = []
+    for addr in sorted(addrs):
+        if out and out[-1][0] + out[-1][1] == addr:
+            out[-1][1] += 1
+        else:
+            out.append([addr, 1])
+    return out
+
+def _format_ranges(addrs, limit=8):
+    ranges = _ranges(addrs)
+    text = ", ".join(f"{a:05X}+{n}" for a, n in ranges[:limit])
+    return text + (f", ... ({len(ranges)} ranges)" if len(ranges) > limit else "")
+
+
+class LockstepRunner:
+    """
+    fast 와 reference 는 같은 이미지로 만든 별개의 Machine 이다. reference 는 블록 컴파일러를
+    끄고 트레이스를 켠 채 ReferenceInterpreter 로 한 명령어씩 실행한다. fast 는 지금 주소에
+    컴파일된 블록이 있으면 그 블록 길이만큼, 없으면 한 스텝씩 자기 run 으로 실행하므로
+    블록 경계마다 비교하게 된다.
+    외부 인터럽트는 request_irq() 로 양쪽에 같은 명령어 위치에서 넣는다.
+    """
+
+    def __init__(self, fast, reference, trace_depth=TRACE_CONTEXT):
+        self.fast = fast
+        self.ref = reference
+        reference.cpu.disable_block_compiler()
+        self.trace = TraceRing(trace_depth)
+        reference.cpu.enable_trace(self.trace)
+        self.interpreter = ReferenceInterpreter(reference.cpu)
+        self.fast_log = WriteLog(fast.mem)
+        self.ref_log = WriteLog(reference.mem)
+        self.blocks_checked = 0
+
+    def close(self):
+        self.fast_log.close()
+        self.ref_log.close()
+        self.ref.cpu.disable_trace()
+
+    def request_irq(self, irq):
+        self.fast.ic.request_irq(irq)
+        self.ref.ic.request_irq(irq)
+
+    def _block_steps(self):
+        """fast 가 이번에 실행할 스텝 수: 컴파일된 블록의 길이 또는 1"""
+        compiler = self.fast.compiler
+        if compiler is None:
+            return 1
+        cpu = self.fast.cpu
+        base = cpu.seg_base[SEG_CS]
+        blk = compiler.blocks.get(base + cpu.EIP)
+        if blk is None or blk.fn is None or blk.base != base:
+            return 1
+        return blk.count
+
+    def step_block(self):
+        """블록 하나(또는 한 스텝)를 양쪽에서 실행하고 비교한다. 양쪽이 같은 예외를 내면 그 메시지."""
+        fast_cpu = self.fast.cpu
+        ref_step = self.interpreter.step
+        start = (fast_cpu.CS, fast_cpu.EIP, fast_cpu.seg_base[SEG_CS], fast_cpu.instret)
+        n = self._block_steps()
+        fast_error = ref_error = None
+        try:
+            fast_cpu.run(n)
+        except Exception as e:
+            fast_error = str(e)
+        try:
+            for _ in range(n):
+                ref_step()
+        except Exception as e:
+            ref_error = str(e)
+        self.blocks_checked += 1
+        self._compare(start, n, fast_error, ref_error)
+        return fast_error
+
+    def _compare(self, start, n, fast_error, ref_error):
+        diffs = []
+        fast_regs = self.fast.registers()
+        ref_regs = self.ref.registers()
+        fast_regs["instret"] = self.fast.cpu.instret
+        ref_regs["instret"] = self.ref.cpu.instret
+        for name, ref_value in ref_regs.items():
+            if fast_regs[name] != ref_value:
+                diffs.append(f"{name}: fast={fast_regs[name]:X} reference={ref_value:X}")
+        if fast_error != ref_error:
+            diffs.append(f"exception: fast={fast_error!r} reference={ref_error!r}")
+
+        fast_written = _touched(self.fast_log.take())
+        ref_written = _touched(self.ref_log.take())
+        if fast_written != ref_written:
+            diffs.append(f"written bytes: fast only [{_format_ranges(fast_written - ref_written)}] "
+                         f"reference only [{_format_ranges(ref_written - fast_written)}]")
+        reported = 0
+        for addr, length in _ranges(fast_written | ref_written):
+            a = self.fast.mem.read_block(addr, length)
+            b = self.ref.mem.read_block(addr, length)
+            if a == b:
+                continue
+            for i in range(length):
+                if a[i] != b[i] and reported < MAX_REPORTED_BYTES:
+                    diffs.append(f"mem[{addr + i:05X}]: fast={a[i]:02X} reference={b[i]:02X}")
+                    reported += 1
+
+        if diffs:
+            cs, ip, base, instret = start
+            raise LockstepDivergence(
+                f"divergence in block at {cs:04X}:{ip:04X} (instret {instret}): {diffs[0]}",
+                self._report(start, n, diffs))
+
+    def _report(self, start, n, diffs):
+        cs, ip, base, instret = start
+        out = io.StringIO()
+        print(f"===== lockstep divergence =====", file=out)
+        print(f"block {cs:04X}:{ip:04X} (linear {base + ip:05X}), {n} steps from instret {instret}, "
+              f"{self.blocks_checked} blocks checked", file=out)
+        for d in diffs:
+            print(f"  {d}", file=out)
+        print("----- block (decoded from reference memory) -----", file=out)
+        decoder = self.ref.cpu.decoder
+        offset = ip
+        for _ in range(n):
+            try:
+                ins = decoder.decode_uncached(base, offset)
+            except Exception as e:
+                print(f"{cs:04X}:{offset:04X}  <decode error: {e}>", file=out)
+                break
+            print(f"{cs:04X}:{offset:04X}  {format_instr(ins, offset)}", file=out)
+            offset = (offset + ins.length) & 0xFFFF
+        compiler = self.fast.compiler
+        blk = compiler.blocks.get(base + ip) if compiler is not None else None
+        if blk is not None and blk.source:
+            print("----- compiled block source -----", file=out)
+            print(blk.source.rstrip(), file=out)
+        self.trace.dump_text(out=out, decoder=decoder)
+        return out.getvalue()
+
+    def run(self, max_instructions, timer_interval=0):
+        """
+        max_instructions 까지 비교하며 실행한다. (reason, detail) 반환, 갈라지면 LockstepDivergence.
+        timer_interval 이 있으면 그 명령어 수마다 양쪽에 IRQ0 을 넣는다.
+        """
+        cpu = self.fast.cpu
+        ic = self.fast.ic
+        next_tick = timer_interval or None
+        while cpu.instret < max_instructions:
+            if next_tick is not None and cpu.instret >= next_tick:
+                self.request_irq(0)
+                next_tick = cpu.instret + timer_interval
+            interruptible = cpu.EFLAGS & FLAG_IF
+            if cpu.halted and not (interruptible and ic.has_pending()):
+                if ic.run_next():
+                    # 기준 쪽도 같은 예약 사건을 같은 명령어 위치에서 실행한다
+                    self.ref.ic.run_next()
+                    continue
+                if next_tick is not None and interruptible:
+                    next_tick = cpu.instret
+                    continue
+                return ("hlt", f"HLT with no wake-up source at {cpu.CS:04X}:{cpu.EIP:04X}")
+            error = self.step_block()
+            if error is not None:
+                return ("cpu_exception", error)
+        return ("instruction_budget", f"{cpu.instret} instructions")
+
+
+# ------------------------------------------------------------
+# 퍼징: 무작위 명령어 열
+# ------------------------------------------------------------
+# 무작위 열에 넣지 않는 명령어: 분기/호출/복귀/인터럽트, HLT, 포트 I/O, 세그먼트 레지스터 로드.
+# 나머지 구현된 1바이트 명령어는 모두 후보다 (새 명령어를 구현하면 자동으로 포함된다).
+FUZZ_EXCLUDE = frozenset((0x07, 0x17, 0x1F, 0x6C, 0x6D, 0x6E, 0x6F, 0x8E,
+                          0xC3, 0xCA, 0xCB, 0xCD, 0xCF, 0xE2, 0xE4, 0xE5, 0xE6, 0xE7,
+                          0xE8, 0xE9, 0xEA, 0xEB, 0xEC, 0xED, 0xEE, 0xEF, 0xF4))
+# 문자열 명령어에 REP 를 붙이는 확률. MOVSB/MOVSW 는 REP 없이는 구현되지 않았고
+# LODSB 는 REP 와 함께 쓰면 예외라, 어느 쪽이든 프로그램이 거기서 끝나 버린다.
+FUZZ_REP = {0xA4: 1.0, 0xA5: 1.0, 0xAA: 0.3, 0xAB: 0.3}
+# 0x66 을 붙이면 예외인 명령어 (PUSH Sreg, MOVSW)
+FUZZ_NO_OPSIZE32 = frozenset((0x06, 0x0E, 0x16, 0x1E, 0xA5))
+# ModR/M reg 필드로 쓸 수 있는 값의 수 (FE/FF 는 INC/DEC 만, 8C 는 ES~GS 만)
+FUZZ_GROUP_REGS = {0x8C: 6, 0xFE: 2, 0xFF: 2}
+
+# 데이터/스택 세그먼트 (코드가 있는 0000:7C00 과 IVT/BDA 를 건드리지 않게)
+FUZZ_SEGMENT = 0x2000
+
+# 자기 코드 덮어쓰기 (FUZZ_PATCH_PROGRAMS 비율의 프로그램에만):
+#  - 값을 바꾸지 않는 CS: ALU 메모리 쓰기 (ADD/OR/SUB/XOR 0, AND FFh, 명령어마다 FUZZ_PATCH_RATE):
+#    쓰기만으로 그 페이지의 블록이 무효화되고, 실행 중인 컴파일된 블록은 stale 검사로 중간에 빠져나온다.
+#  - 뒤집기 묶음 하나: ALU r16, r16 ; (반복마다 표에서 {주소, 값} 을 골라 MOV/ADD/SUB CS:[주소], 값) ;
+#    t: ALU r16, r16. 표는 FUZZ_THRESHOLD 번 빈 곳(FUZZ_TOGGLE_QUIET)에 쓰고, t 를 ADC r16, r16 으로
+#    바꾸고, 다시 원래대로 되돌리기를 되풀이한다. 빈 반복 동안 묶음이 컴파일되므로 t 를 ADC 로 바꾸는
+#    쓰기는 컴파일된 블록 안에서 일어나고, 빠져나온 뒤 인터프리터가 ADC 로 첫 ALU 의 CF 를 읽는다.
+#    ADD/SUB 로 쓰면 ADC 는 그 메모리 ALU 의 CF 를 읽는다. 블록이 덮어쓰일 t 를 믿고
+#    그 앞의 CF 계산을 건너뛰었다면 여기서 드러난다.
+#    반복 번호는 DS:FUZZ_TOGGLE_INDEX 에 두고 LODSB 로 늘린다 (플래그를 건드리지 않는다.
+#    퍼징 명령어에는 DF 를 켜는 것이 없다).
+# 덮어쓰기가 있는 프로그램은 블록을 계속 다시 컴파일하므로 느려서 일부에만 넣는다.
+FUZZ_PATCH_PROGRAMS = 0.25
+FUZZ_PATCH_RATE = 0.08
+FUZZ_TOGGLE_INDEX = 0xFFF2
+FUZZ_TOGGLE_QUIET = 0x9000
+# (opcode, reg, 즉치값)
+_PATCH_ALU = tuple((op, reg, 0xFF if reg == 4 else 0)
+                   for op in (0x80, 0x83) for reg in (0, 1, 4, 5, 6))
+# 위 ALU 형식 다음 번호가 뒤집기 묶음
+_PATCH_TOGGLE = len(_PATCH_ALU)
+
+def fuzz_ops():
+    return tuple(op for op in range(0x100) if DISPATCH[op] is not None and op not in FUZZ_EXCLUDE)
+
+class FuzzProgram:
+    """
+    seed 로 정해지는 부트 섹터 프로그램: 세그먼트/스택을 FUZZ_SEGMENT 로 옮긴 뒤
+    무작위 명령어 length 개를 LOOP 로 여러 번 돌고 HLT.
+    명령어 길이는 실제 디코더로 재므로 디코더가 아는 형식이면 무엇이든 넣을 수 있다.
+    """
+
+    def __init__(self, ops=None):
+        self.ops = ops or fuzz_ops()
+        self.scratch = Memory(PAGE_SIZE)
+        self.decoder = Decoder(self.scratch)
+
+    def instruction(self, r):
+        op = r.choice(self.ops)
+        code = b""
+        if r.random() < 0.1:
+            code += bytes((r.choice((0x26, 0x2E, 0x36, 0x3E)),))
+        if op not in FUZZ_NO_OPSIZE32 and r.random() < 0.1:
+            code += b"\x66"
+        if op in FUZZ_REP and r.random() < FUZZ_REP[op]:
+            # 반복 횟수를 작게 잡아 둔다 (CX 는 루프 끝에서 POP CX 로 되돌린다)
+            code = bytes((0xB9, r.randrange(64), 0x00)) + code + b"\xF3"
+        code += bytes((op,))
+        if 0x70 <= op <= 0x7F:
+            # 조건 분기는 다음 명령어로 (분기 판정과 플래그 읽기만 시험한다)
+            return code + b"\x00"
+        tail = bytearray(r.randrange(256) for _ in range(6))
+        if op in FUZZ_GROUP_REGS:
+            tail[0] = (tail[0] & 0xC7) | (r.randrange(FUZZ_GROUP_REGS[op]) << 3)
+        code += tail
+        self.scratch.write_block(0, code)
+        ins = self.decoder.decode(0, 0)
+        return code[:ins.length]
+
+    @staticmethod
+    def _patch_length(kind):
+        return 31 if kind == _PATCH_TOGGLE else 6
+
+    @staticmethod
+    def _alu_rr(r, ops):
+        """SP 를 건드리지 않는 ALU r16, r16 (2바이트)"""
+        regs = (0, 1, 2, 3, 5, 6, 7)
+        return bytes((r.choice(ops), 0xC0 | (r.choice(regs) << 3) | r.choice(regs)))
+
+    def _toggle(self, r, addr, data, count):
+        """addr 에 놓일 뒤집기 묶음과 data 에 놓일 {주소, 값} 세 개 + 반복 count 번의 표"""
+        t = addr + 29
+        table = data + 12
+        x = FUZZ_TOGGLE_INDEX
+        target = self._alu_rr(r, (0x01, 0x09, 0x21, 0x29, 0x31))
+        adc = self._alu_rr(r, (0x13,))
+        write = r.choice((0x89, 0x01, 0x29))
+        code = self._alu_rr(r, (0x01, 0x29))                  # ADD/SUB: CF 를 만든다
+        code += bytes((0x8B, 0x36, x & 0xFF, x >> 8,          # MOV SI, [x]
+                       0x2E, 0x8B, 0x9C, table & 0xFF, table >> 8,   # MOV BX, CS:[SI+table]
+                       0x2E, 0xAC, 0x2E, 0xAC,                # CS: LODSB 두 번 (SI += 2)
+                       0x89, 0x36, x & 0xFF, x >> 8,          # MOV [x], SI
+                       0x2E, 0x8B, 0x57, 0x02,                # MOV DX, CS:[BX+2]
+                       0x2E, 0x8B, 0x1F,                      # MOV BX, CS:[BX]
+                       0x2E, write, 0x17))                    # MOV/ADD/SUB CS:[BX], DX
+        code += target
+        orig, new = target[0] | (target[1] << 8), adc[0] | (adc[1] << 8)
+        to_adc, to_orig = new, orig                            # MOV 은 그대로, ADD/SUB 는 차이
+        if write == 0x01:
+            to_adc, to_orig = (new - orig) & 0xFFFF, (orig - new) & 0xFFFF
+        elif write == 0x29:
+            to_adc, to_orig = (orig - new) & 0xFFFF, (new - orig) & 0xFFFF
+        records = struct.pack("<6H", FUZZ_TOGGLE_QUIET, 0, t, to_adc, t, to_orig)
+        cycle = (data,) * FUZZ_THRESHOLD + (data + 4, data + 8)
+        return code, records + struct.pack(f"<{count}H", *(cycle[i % len(cycle)]
+                                                          for i in range(count)))
+
+    @staticmethod
+    def _patch(kind, addr):
+        op, reg, imm = _PATCH_ALU[kind]
+        return bytes((0x2E, op, (reg << 3) | 6, addr & 0xFF, addr >> 8, imm))
+
+    def program(self, seed, length):
+        r = random.Random(seed)
+        seg = FUZZ_SEGMENT
+        count = r.randrange(4, 64)
+        code = bytearray((0xB8, seg & 0xFF, seg >> 8,      # MOV AX, seg
+                          0x8E, 0xD8, 0x8E, 0xC0, 0x8E, 0xD0,  # MOV DS/ES/SS, AX
+                          0xBC, 0xF0, 0xFF,                  # MOV SP, FFF0h
+                          0xB9, count, 0x00))                # MOV CX, 반복 횟수
+        loop_start = len(code)
+        code += b"\x51"                                      # PUSH CX
+        # 몸체: 명령어 바이트 또는 덮어쓰기 종류(int). 덮어쓰기는 대상 주소를 배치가 끝난 뒤에
+        # 정하므로 길이만 먼저 잡아 둔다.
+        patched = r.random() < FUZZ_PATCH_PROGRAMS
+        toggle_at = r.randrange(length) if patched else -1
+        body = []
+        size = len(code)
+        for n in range(length):
+            if n == toggle_at:
+                item = _PATCH_TOGGLE
+            elif patched and r.random() < FUZZ_PATCH_RATE:
+                item = r.randrange(len(_PATCH_ALU))
+            else:
+                item = self.instruction(r)
+            item_len = self._patch_length(item) if isinstance(item, int) else len(item)
+            # LOOP(rel8) 가 몸체 처음까지 닿아야 한다
+            if size + item_len > loop_start + 125:
+                break
+            body.append(item)
+            size += item_len
+        offsets = []
+        offset = loop_start + 1
+        for item in body:
+            offsets.append(offset)
+            offset += self._patch_length(item) if isinstance(item, int) else len(item)
+        # ALU 덮어쓰기의 대상은 아무 몸체 명령어, 뒤집기 묶음의 표는 HLT 뒤에 둔다
+        starts = [n for n, item in enumerate(body) if not isinstance(item, int)]
+        data = b""
+        patches = []
+        for n, item in enumerate(body):
+            if item == _PATCH_TOGGLE:
+                patch, data = self._toggle(r, 0x7C00 + offsets[n], 0x7C00 + offset + 4, count)
+                patches.append((n, patch))
+            elif isinstance(item, int) and starts:
+                patches.append((n, self._patch(item, 0x7C00 + offsets[r.choice(starts)])))
+            if isinstance(item, int):
+                body[n] = b"\x90" * self._patch_length(item)   # 대상이 없으면 NOP 로 남는다
+        for item in body:
+            code += item
+        for n, patch in patches:
+            code[offsets[n]:offsets[n] + len(patch)] = patch
+        code += b"\x59"                                      # POP CX
+        code += bytes((0xE2, (loop_start - (len(code) + 2)) & 0xFF))   # LOOP
+        code += b"\xF4"                                      # HLT
+        return bytes(code + data)
+
+    def write_image(self, path, seed, length, size):
+        sector = bytearray(512)
+        code = self.program(seed, length)
+        sector[:len(code)] = code
+        sector[510:512] = b"\x55\xAA"
+        with open(path, "wb") as f:
+            f.write(sector)
+            f.seek(size - 1)
+            f.write(b"\x00")
+
+
+# ------------------------------------------------------------
+# 명령줄
+# ------------------------------------------------------------
+def make_pair(image, cylinders=16, heads=16, sectors=63, memory_size=0x1000000, threshold=None):
+    """
+    같은 이미지로 (fast, reference) Machine 을 만든다. reference 는 이미지 복사본을 써서
+    디스크 쓰기가 서로 섞이지 않게 한다. 복사본 경로도 함께 반환한다 (호출한 쪽이 지운다).
+    """
+    fd, copy = tempfile.mkstemp(suffix=".img")
+    os.close(fd)
+    shutil.copyfile(image, copy)
+    fast = Machine(image, cylinders=cylinders, heads=heads, sectors=sectors,
+                   memory_size=memory_size, compile_blocks=True)
+    if threshold is not None:
+        fast.compiler.threshold = threshold
+    reference = Machine(copy, cylinders=cylinders, heads=heads, sectors=sectors,
+                        memory_size=memory_size, compile_blocks=False)
+    return fast, reference, copy
+
+def check_image(image, max_instructions, timer_interval=0, threshold=None, **machine_args):
+    """(reason, detail, runner) 반환. 갈라지면 LockstepDivergence."""
+    fast, reference, copy = make_pair(image, threshold=threshold, **machine_args)
+    try:
+        runner = LockstepRunner(fast, reference)
+        reason, detail = runner.run(max_instructions, timer_interval)
+        runner.close()
+        return reason, detail, runner
+    finally:
+        fast.mem.close()
+        reference.mem.close()
+        os.unlink(copy)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="DOS x86 Emulator - lockstep differential check")
+    parser.add_argument("image", nargs="?", help="디스크 이미지 경로 (--fuzz 면 생략)")
+    parser.add_argument("--cylinders", type=int, default=16)
+    parser.add_argument("--heads", type=int, default=16)
+    parser.add_argument("--sectors", type=int, default=63)
+    parser.add_argument("--memory", type=lambda x: int(x, 0), default=0x1000000,
+                        help="게스트 메모리 크기 (바이트)")
+    parser.add_argument("--max-instructions", type=int, default=None,
+                        help="비교할 명령어 수 (기본: 이미지 1000000, 퍼징 20000)")
+    parser.add_argument("--timer-interval", type=int, default=0, metavar="N",
+                        help="N 명령어마다 양쪽에 IRQ0 (0=타이머 없음)")
+    parser.add_argument("--threshold", type=int, default=None,
+                        help="블록 컴파일 임계값 (기본: 이미지는 컴파일러 기본값, 퍼징은 2)")
+    parser.add_argument("--fuzz", type=int, default=0, metavar="N",
+                        help="무작위 명령어 열 N 개로 비교")
+    parser.add_argument("--seed", type=int, default=0, help="첫 퍼징 시드")
+    parser.add_argument("--length", type=int, default=24, help="퍼징 프로그램의 명령어 수")
+    args = parser.parse_args(argv)
+    if not args.fuzz and not args.image:
+        parser.error("a disk image or --fuzz N is required")
+    if args.image and not os.path.exists(args.image):
+        parser.error(f"disk image not found: {args.image}")
+    return args
+
+def _print_result(label, reason, detail, runner):
+    stats = runner.fast.compiler.stats()
+    ref = runner.interpreter.stats()
+    print(f"{label}: {reason} ({detail}), {runner.fast.cpu.instret} instructions, "
+          f"{runner.blocks_checked} blocks checked, {stats['block_runs']} compiled block runs, "
+          f"reference {ref['executed']} executed / {ref['delegated']} delegated")
+
+def main(argv=None):
+    args = parse_args(argv)
+    machine_args = dict(cylinders=args.cylinders, heads=args.heads, sectors=args.sectors,
+                        memory_size=args.memory)
+    if not args.fuzz:
+        try:
+            reason, detail, runner = check_image(args.image, args.max_instructions or 1000000,
+                                                 args.timer_interval, args.threshold, **machine_args)
+        except LockstepDivergence as e:
+            print(e.report)
+            return EXIT_DIVERGENCE
+        _print_result(args.image, reason, detail, runner)
+        return EXIT_MATCH
+
+    generator = FuzzProgram()
+    fd, image = tempfile.mkstemp(suffix=".img")
+    os.close(fd)
+    size = args.cylinders * args.heads * args.sectors * 512
+    threshold = args.threshold if args.threshold is not None else FUZZ_THRESHOLD
+    try:
+        for seed in range(args.seed, args.seed + args.fuzz):
+            generator.write_image(image, seed, args.length, size)
+            try:
+                reason, detail, runner = check_image(image, args.max_instructions or 20000,
+                                                     args.timer_interval, threshold, **machine_args)
+            except LockstepDivergence as e:
+                print(f"seed {seed}: program {generator.program(seed, args.length).hex()}")
+                print(e.report)
+                return EXIT_DIVERGENCE
+            _print_result(f"seed {seed}", reason, detail, runner)
+    finally:
+        os.unlink(image)
+    print(f"{args.fuzz} programs matched")
+    return EXIT_MATCH
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+# machine.py
+
+from memory import Memory
+from interrupt_controller import InterruptController
+from eisa_bus import EISABus
+from dma_controller import DMAController, DMA_PORTS
+from storage_device import IDEHardDisk
+from bios import BIOS
+from vga_dac import VGADAC, DAC_PEL_MASK, DAC_DATA
+from cpu import CPU
+from block_compiler import BlockCompiler
+from idle_detector import IdleDetector
+from metrics import INSTRUCTION_BUCKETS
+from translation_cache import TranslationCache
+from cpu import CR0_PE
+
+class Machine:
+    """
+    화면/타이머/콘솔 없이 동작하는 에뮬레이터 핵심 장치 묶음.
+    대화형 main.py 와 헤드리스 batch_run.py 가 같은 구성으로 기계를 만든다.
+    """
+
+    def __init__(self, disk_image="disk.img", cylinders=16, heads=16, sectors=63,
+                 memory_size=0x1000000, shared_name=None, compile_blocks=True, code_cache=None):
+        # 1) 메모리 (shared_name 이 있으면 다른 프로세스가 붙을 수 있는 공유 메모리)
+        self.mem = Memory(memory_size, shared_name=shared_name)
+
+        # 2) 인터럽트 컨트롤러
+        self.ic = InterruptController()
+
+        # 3) EISA 버스
+        self.eisa = EISABus()
+
+        # 4) DMA (8237 두 개 + 페이지 레지스터)
+        self.dma = DMAController(self.mem, self.ic)
+        for ports in DMA_PORTS:
+            self.eisa.register_io_device(ports, self.dma)
+
+        # 5) IDE 디스크
+        self.disk = IDEHardDisk(disk_image, cylinders=cylinders, heads=heads, sectors=sectors)
+        self.eisa.register_io_device(range(0x1F0, 0x1F8), self.disk)
+
+        # 6) VGA DAC (팔레트)
+        self.dac = VGADAC()
+        self.eisa.register_io_device(range(DAC_PEL_MASK, DAC_DATA + 1), self.dac)
+
+        # 7) BIOS
+        self.bios = BIOS(self.mem, self.disk, dac=self.dac)
+        self.bios.load_bios()
+
+        # 8) CPU
+        self.cpu = CPU(self.mem, self.ic, self.eisa)
+        self.bios.attach(self.cpu)
+        # 장치가 예약하는 사건(DMA 완료 등)의 가상 시간 = 실행한 명령어 수
+        self.ic.clock = lambda: self.cpu.instret
+
+        # 9) 자주 실행되는 블록을 파이썬 함수로 컴파일하는 2단계 엔진 (끄면 인터프리터만)
+        self.compiler = None
+        if compile_blocks:
+            self.compiler = BlockCompiler(self.cpu)
+            self.cpu.enable_block_compiler(self.compiler)
+
+        # 10) HLT/유휴 루프 감지 (실행 루프가 check()/resume() 으로 쓴다)
+        self.idle = IdleDetector(self.cpu)
+
+        # 11) 디코드/블록 디스크 캐시 (선택, 웜 스타트). 끝날 때 save_code_cache() 로 저장
+        self.code_cache = None
+        if code_cache is not None:
+            self.code_cache = TranslationCache(code_cache, self.mem,
+                                               mode=lambda: self.cpu.CR0 & CR0_PE)
+            self.cpu.decoder.enable_persistent_cache(self.code_cache)
+            if self.compiler is not None:
+                self.compiler.enable_persistent_cache(self.code_cache)
+
+    def save_code_cache(self):
+        if self.code_cache is not None:
+            self.code_cache.save()
+
+    def register_metrics(self, registry):
+        """
+        장치 통계를 registry 에 지표로 등록한다. 이미 있는 카운터는 읽을 때만 가져오고,
+        IRQ 지연/디스크 지연 히스토그램은 장치에 붙여 실행 중에 기록한다.
+        """
+        cpu = self.cpu
+        ic = self.ic
+        disk = self.disk
+        mmu = cpu.mmu
+        decoder = cpu.decoder
+        registry.counter("emulator_instructions_total", "Instructions retired",
+                         lambda: cpu.instret)
+        # 유휴 루프를 건너뛴 만큼은 실행하지 않았으므로 속도에서 뺀다
+        registry.rate("emulator_instructions_per_second", "Instructions executed per host second",
+                      lambda: cpu.instret - self.idle.skipped_instructions)
+        registry.counter("emulator_irqs_delivered_total", "IRQs delivered to the CPU",
+                         lambda: [({"irq": str(n)}, count)
+                                  for n, count in enumerate(ic.delivered_by_irq)])
+        ic.enable_metrics(registry.histogram(
+            "emulator_irq_latency_instructions",
+            "Instructions between an IRQ request and its delivery", INSTRUCTION_BUCKETS))
+        registry.counter("emulator_disk_sectors_read_total", "Disk sectors read",
+                         lambda: disk.sectors_read)
+        registry.counter("emulator_disk_sectors_written_total", "Disk sectors written",
+                         lambda: disk.sectors_written)
+        disk.enable_metrics(registry.histogram(
+            "emulator_disk_op_seconds", "Host time per disk sector read/write"))
+        registry.counter("emulator_dma_bytes_total", "Bytes moved by DMA",
+                         lambda: self.dma.bytes_transferred)
+        registry.counter("emulator_tlb_hits_total", "TLB hits", lambda: mmu.tlb_hits)
+        registry.counter("emulator_tlb_misses_total", "TLB misses", lambda: mmu.tlb_misses)
+        registry.gauge("emulator_tlb_hit_ratio", "TLB hits / lookups",
+                       lambda: mmu.tlb_hits / max(1, mmu.tlb_hits + mmu.tlb_misses))
+        registry.counter("emulator_decoded_instructions_total",
+                         "Instructions decoded on a decode cache miss", lambda: decoder.decoded)
+        registry.gauge("emulator_decode_cache_hit_ratio",
+                       "Retired instructions that did not need a fresh decode",
+                       lambda: 1 - min(decoder.decoded, cpu.instret) / max(1, cpu.instret))
+        compiler = self.compiler
+        if compiler is not None:
+            registry.counter("emulator_compiled_instructions_total",
+                             "Instructions retired inside compiled blocks",
+                             lambda: compiler.compiled_instructions)
+            registry.gauge("emulator_compiled_ratio",
+                           "Share of retired instructions run by compiled blocks",
+                           lambda: compiler.compiled_instructions / max(1, cpu.instret))
+        registry.counter("emulator_idle_skipped_instructions_total",
+                         "Instructions skipped by idle-loop fast-forward",
+                         lambda: self.idle.skipped_instructions)
+
+    def registers(self):
+        cpu = self.cpu
+        regs = {name: getattr(cpu, name) for name in
+                ("EAX", "EBX", "ECX", "EDX", "ESI", "EDI", "EBP", "ESP", "EIP", "EFLAGS",
+                 "CS", "DS", "ES", "FS", "GS", "SS")}
+        regs["halted"] = cpu.halted
+        return regs
+
+    def stats(self):
+        return {
+            "instructions": self.cpu.instret,
+            "irqs_delivered": self.ic.delivered,
+            "irqs_by_line": list(self.ic.delivered_by_irq),
+            "disk_sectors_read": self.disk.sectors_read,
+            "disk_sectors_written": self.disk.sectors_written,
+            "tlb_hits": self.cpu.mmu.tlb_hits,
+            "tlb_misses": self.cpu.mmu.tlb_misses,
+            "resident_pages": self.mem.resident_pages(),
+            "block_compiler": self.compiler.stats() if self.compiler is not None else None,
+            "idle": self.idle.stats(),
+            "dma": self.dma.stats(),
+            "code_cache": self.code_cache.stats() if self.code_cache is not None else None,
+        }
@@ -1,108 +1,296 @@
 # main.py
 
+import argparse
+import os
+import subprocess
+import sys
 import time
 import sdl2.ext
 
-from memory import Memory
-from interrupt_controller import InterruptController
+from machine import Machine
 from timer import TimerDevice
-from eisa_bus import EISABus
-from dma_controller import DMAController
-from storage_device import IDEHardDisk
-from bios import BIOS
-from cpu import CPU
 from debugger import Debugger
+from exec_trace import TraceRing
 from video_device import VideoDevice
 
-from console_thread import ConsoleThread
+from console_thread import ConsoleInput, ConsoleThread
+from event_loop import EventLoop
+from gdb_stub import GDBStub, SIGILL, SIGTRAP
+from shared_state import ControlBlock
+from bios import BDA_VIDEO_MODE
+from frame_recorder import FrameRecorder
+from event_log import EventRecorder, EventReplayer
+from metrics import MetricsRegistry, MetricsExporter, DEFAULT_INTERVAL
 
-def main():
-    # 1) 메모리
-    mem = Memory(0x1000000)
-
-    # 2) 인터럽트 컨트롤러
-    ic = InterruptController()
+# 프레임(및 SDL 이벤트 펌프) 주기: 실행 중 60Hz, 정지 중에는 창 이벤트만 10Hz 로 확인
+FRAME_INTERVAL = 1.0 / 60
+FRAME_INTERVAL_IDLE = 0.1
 
-    # 3) EISA 버스
-    eisa = EISABus()
+def parse_args():
+    parser = argparse.ArgumentParser(description="DOS x86 Emulator")
+    parser.add_argument("--trace", type=int, default=0, metavar="N",
+                        help="최근 N개 명령어 실행 트레이스를 링 버퍼에 기록 (0=끔)")
+    parser.add_argument("--trace-file", default=None,
+                        help="CPU 예외 시 트레이스를 바이너리로 저장할 경로")
+    parser.add_argument("--gdb", default=None, metavar="PORT|unix:PATH",
+                        help="GDB 원격 스텁을 127.0.0.1:PORT 또는 Unix 소켓 PATH 에 연다")
+    parser.add_argument("--memory", type=lambda x: int(x, 0), default=0x1000000,
+                        help="게스트 메모리 크기 (바이트, 최대 4GB)")
+    parser.add_argument("--shared", default=None, metavar="NAME",
+                        help="게스트 메모리를 공유 메모리 NAME 으로 잡아 다른 프로세스가 붙을 수 있게 한다")
+    parser.add_argument("--render-process", action="store_true",
+                        help="화면을 별도 프로세스(vga_renderer.py)에서 그린다 (--shared 필요)")
+    parser.add_argument("--interpreter", action="store_true",
+                        help="블록 컴파일러를 끄고 인터프리터로만 실행")
+    parser.add_argument("--code-cache", default=None, metavar="DIR",
+                        help="디코드/컴파일 결과를 DIR 에 저장해 두고 다음 실행에서 다시 쓴다")
+    parser.add_argument("--record", default=None, metavar="PATH",
+                        help="화면을 녹화 (*.y4m, *.raw/*.rgb 스트림 또는 PNG 디렉터리)")
+    parser.add_argument("--record-queue", type=int, default=8, metavar="N",
+                        help="녹화 큐 크기 (가득 차면 프레임을 버린다)")
+    events = parser.add_mutually_exclusive_group()
+    events.add_argument("--record-events", default=None, metavar="PATH",
+                        help="IRQ/포트 입력/디스크 완료를 명령어 수와 함께 PATH 에 기록")
+    events.add_argument("--replay-events", default=None, metavar="PATH",
+                        help="--record-events 로 남긴 로그를 같은 명령어 위치에 다시 넣는다")
+    parser.add_argument("--metrics", default=None, metavar="PATH|unix:PATH",
+                        help="지표를 Prometheus 텍스트 형식으로 PATH 에 주기적으로 쓰거나 Unix 소켓으로 내보낸다")
+    parser.add_argument("--metrics-interval", type=float, default=DEFAULT_INTERVAL, metavar="SEC",
+                        help="지표 갱신(파일 기록) 주기")
+    args = parser.parse_args()
+    if args.render_process and not args.shared:
+        parser.error("--render-process requires --shared NAME")
+    return args
 
-    # 4) DMA
-    dma = DMAController(mem, ic)
+def main():
+    args = parse_args()
 
-    # 5) IDE 디스크
-    disk = IDEHardDisk("disk.img", cylinders=16, heads=16, sectors=63)
-    for p in range(0x1F0, 0x1F8):
-        eisa.register_io_device(p, disk)
+    # 1) ~ 7) 메모리, 인터럽트 컨트롤러, EISA 버스, DMA, IDE 디스크, BIOS, CPU
+    machine = Machine("disk.img", cylinders=16, heads=16, sectors=63, memory_size=args.memory,
+                      shared_name=args.shared, compile_blocks=not args.interpreter,
+                      code_cache=args.code_cache)
+    mem = machine.mem
+    ic = machine.ic
+    cpu = machine.cpu
+    idle = machine.idle
+    trace = None
+    if args.trace > 0:
+        trace = TraceRing(args.trace)
+        cpu.enable_trace(trace)
 
-    # 6) BIOS
-    bios = BIOS(mem, disk)
-    bios.load_bios()
+    # 결정적 기록/재생 (선택)
+    event_log = None
+    if args.record_events:
+        event_log = EventRecorder(args.record_events)
+    elif args.replay_events:
+        event_log = EventReplayer(args.replay_events)
+    if event_log is not None:
+        event_log.attach(machine)
 
-    # 7) CPU
-    cpu = CPU(mem, ic)
+    # 이벤트 루프: stdin, 타이머, 프레임 데드라인을 기다리며 그 사이에 CPU 를 실행
+    loop = EventLoop()
 
-    # 8) 타이머 (IRQ0)
+    # 8) 타이머 (IRQ0) - 루프 타이머로 동작
     timer = TimerDevice(ic, frequency_hz=1000)
-    timer.start()
+    timer.attach(loop)
 
     # 9) 비디오 (메인 스레드에서만 update_frame())
-    video = VideoDevice(mem)
+    #    공유 메모리면 제어 블록에 프레임 번호/dirty 페이지를 알리고,
+    #    --render-process 면 화면은 별도 프로세스가 그린다.
+    control = None
+    renderer = None
+    video = None
+    if args.shared:
+        control = ControlBlock.create(args.shared, mem.size)
+        control.watch(mem)
+    if args.render_process:
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vga_renderer.py")
+        renderer = subprocess.Popen([sys.executable, script, args.shared])
+    else:
+        video = VideoDevice(mem, palette=machine.dac)
+
+    # 녹화 (선택): 프레임마다 화면을 복사해 백그라운드 스레드로 넘긴다
+    recorder = None
+    if args.record:
+        recorder = FrameRecorder(args.record, fps=round(1 / FRAME_INTERVAL),
+                                 queue_size=args.record_queue)
+
+    # 지표 내보내기 (선택)
+    metrics = None
+    if args.metrics:
+        registry = MetricsRegistry()
+        machine.register_metrics(registry)
+        if video is not None:
+            registry.counter("emulator_frames_presented_total", "Frames presented to the window",
+                             lambda: video.frames_presented)
+            video.enable_metrics(registry.histogram(
+                "emulator_frame_convert_seconds", "Host time to convert VGA memory to a texture"))
+        metrics = MetricsExporter(registry, loop, args.metrics, args.metrics_interval)
+        print(f"[Metrics] exporting to {args.metrics}")
 
     # 10) 디버거
     dbg = Debugger(cpu)
 
-    # 11) 콘솔 입력 스레드
-    cthread = ConsoleThread()
-    cthread.start()
-
     print("===== My DOS x86 Emulator (macOS-safe) Started =====")
     print("Commands (in console): g=go, n=next, s=stop, r=regs, d=disassemble, q=quit")
+    print("                       b <addr>=break, w <addr>=watch write, bl=list, bd [addr]=delete")
+    print("                       t=trace dump, t <file>=binary trace dump")
 
-    running = True
     stopped = False  # s=stop -> CPU 실행 중단
 
-    while running:
-        # 1) 콘솔에서 명령 큐 확인
-        cmd = cthread.get_command_nowait()
-        while cmd is not None:
-            if cmd == "g":
-                stopped = False
-                dbg.go()
-            elif cmd == "n":
-                stopped = False
-                dbg.next()
-            elif cmd == "s":
-                stopped = True
-            elif cmd == "r":
-                dbg.print_cpu_state()
-            elif cmd == "d":
-                # 새로 추가: 디스어셈블 10줄
-                dbg.disassemble_next_10()
-            elif cmd == "q":
-                running = False
+    def set_stopped(value):
+        nonlocal stopped
+        stopped = value
+        # 멈춰 있는 동안에는 타이머 틱 없이 입력/창 이벤트만 기다린다
+        if stopped:
+            timer.pause()
+            frame_timer.interval = FRAME_INTERVAL_IDLE
+        else:
+            idle.reset()
+            timer.resume()
+            frame_timer.interval = FRAME_INTERVAL
+
+    def on_command(cmd):
+        parts = cmd.split()
+        if parts and parts[0] in ("b", "w", "bl", "bd"):
+            dbg.point_command(parts)
+        elif parts and parts[0] == "t":
+            if trace is None:
+                print("Trace is disabled (run with --trace N)")
+            elif len(parts) > 1:
+                trace.dump_binary(parts[1])
+                print(f"Trace written to {parts[1]}")
             else:
-                print(f"Unknown command: {cmd}")
-            cmd = cthread.get_command_nowait()
-
-        # 2) CPU 실행
-        if not stopped:
-            try:
-                dbg.step_cpu_once()  # single_step_mode? => 단일 or 연속 스텝
-            except Exception as e:
-                print(f"[CPU Exception] {e}")
-                stopped = True
-
-        # 3) 비디오 갱신 (메인 스레드에서 SDL 사용)
+                trace.dump_text(last=32, decoder=cpu.decoder)
+        elif cmd == "g":
+            dbg.go()
+            set_stopped(False)
+        elif cmd == "n":
+            dbg.next()
+            set_stopped(False)
+        elif cmd == "s":
+            set_stopped(True)
+        elif cmd == "r":
+            dbg.print_cpu_state()
+        elif cmd == "d":
+            # 새로 추가: 디스어셈블 10줄
+            dbg.disassemble_next_10()
+        elif cmd == "q":
+            loop.stop()
+        elif cmd:
+            print(f"Unknown command: {cmd}")
+
+    def run_cpu(deadline):
+        """deadline(monotonic)까지 CPU 를 연속 실행. 더 실행할 게 있으면 True."""
+        if stopped:
+            return False
+        # 유휴 감지는 명령어를 직접 실행하므로 브레이크/워치포인트, 단일 스텝 중에는 쓰지 않는다
+        detect_idle = not (dbg.single_step_mode or dbg.breakpoints or dbg.watchpoints)
+        try:
+            # HLT/유휴 루프에서 깨어난 게스트가 ISR 만 돌고 같은 자리로 돌아왔으면 다시 잔다
+            if detect_idle and idle.resume():
+                return False
+            while True:
+                reason = dbg.step_cpu_once()  # single_step_mode? => 단일 or 연속 스텝
+                if reason is not None:
+                    print(f"[Debugger] {reason}")
+                    set_stopped(True)
+                    if gdb is not None:
+                        gdb.target_stopped(SIGTRAP)
+                    return False
+                if dbg.single_step_mode:
+                    # n = 명령어 하나만 실행하고 멈춤
+                    dbg.print_cpu_state()
+                    set_stopped(True)
+                    return False
+                if detect_idle and idle.check():
+                    # 다음 타이머 틱(IRQ0)이나 입력이 올 때까지 이벤트 루프에서 잔다
+                    return False
+                if time.monotonic() >= deadline:
+                    return True
+        except Exception as e:
+            print(f"[CPU Exception] {e}")
+            if trace is not None:
+                trace.dump_text(last=32, decoder=cpu.decoder)
+                if args.trace_file:
+                    trace.dump_binary(args.trace_file)
+                    print(f"Trace written to {args.trace_file}")
+            set_stopped(True)
+            if gdb is not None:
+                gdb.target_stopped(SIGILL)
+            return False
+
+    def on_frame():
+        if control is not None:
+            mode = mem.read8(BDA_VIDEO_MODE)
+            if control.mode != mode:
+                control.mode = mode
+            control.publish_palette(machine.dac)
+            control.publish_frame()
+        if recorder is not None:
+            recorder.capture(mem, machine.dac)
+        if renderer is not None:
+            # 렌더러 창이 닫히면 에뮬레이터도 끝낸다
+            if renderer.poll() is not None:
+                loop.stop()
+            return
+        # 비디오 갱신 (메인 스레드에서 SDL 사용)
         video.update_frame()
+        if video.quit_requested:
+            loop.stop()
+
+    frame_timer = loop.call_every(FRAME_INTERVAL, on_frame)
+    loop.set_work(run_cpu)
+
+    # GDB 원격 스텁 (선택)
+    gdb = None
+    if args.gdb:
+        address = args.gdb[5:] if args.gdb.startswith("unix:") else ("127.0.0.1", int(args.gdb))
+        gdb = GDBStub(cpu, dbg, loop, address,
+                      resume=lambda: set_stopped(False),
+                      halt=lambda: set_stopped(True))
+        print(f"[GDB] listening on {args.gdb}")
+        # 디버거가 붙을 때까지 게스트는 리셋 상태로 대기
+        set_stopped(True)
+
+    # 11) 콘솔 입력 (가능하면 루프에 stdin 을 직접 등록, 아니면 스레드)
+    if ConsoleInput.supported():
+        console = ConsoleInput(on_command)
+        console.start(loop)
+    else:
+        console = ConsoleThread(loop, on_command)
+        console.start()
 
-        # 4) 루프 간 약간 쉼
-        time.sleep(0.01)
+    try:
+        loop.run()
+    except KeyboardInterrupt:
+        pass
 
     print("Stopping...")
 
     # 종료 처리
-    cthread.stop()
+    console.stop()
+    if gdb is not None:
+        gdb.close()
     timer.stop()
+    loop.close()
+    if renderer is not None and renderer.poll() is None:
+        renderer.terminate()
+        renderer.wait()
+    if event_log is not None:
+        event_log.close()
+        print(f"[Events] {event_log.stats()}")
+    if metrics is not None:
+        metrics.close()
+    if recorder is not None:
+        recorder.close()
+        stats = recorder.stats()
+        print(f"[Recorder] written={stats['written']} dropped={stats['dropped']} "
+              f"duplicates={stats['duplicates']}")
+    if control is not None:
+        control.close()
+    machine.save_code_cache()
+    mem.close()
     sdl2.ext.quit()
     print("Emulator terminated.")
 
@@ -0,0 +1,42 @@
+# mem_inspect.py
+#
+# 실행 중인 에뮬레이터(main.py --shared NAME)의 게스트 메모리를 CPU 를 멈추지 않고 읽는 도구.
+#
+#   python mem_inspect.py NAME                   # 제어 블록 상태
+#   python mem_inspect.py NAME b800:0000 100     # 주소(선형 또는 SEG:OFF) 부터 길이(16진수) 덤프
+
+import sys
+
+from debugger import parse_address
+from shared_state import ControlBlock, GuestMemoryReader
+
+def hexdump(addr, data, out=sys.stdout):
+    for i in range(0, len(data), 16):
+        chunk = data[i:i + 16]
+        text = "".join(chr(b) if 0x20 <= b < 0x7F else "." for b in chunk)
+        out.write(f"{addr + i:08X}  {chunk.hex(' '):<47}  {text}\n")
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) not in (1, 3):
+        print("Usage: mem_inspect.py NAME [ADDR LEN]")
+        return 2
+    name = argv[0]
+    control = ControlBlock.attach(name)
+    try:
+        print(f"pid={control.pid} memory=0x{control.memory_size:X} "
+              f"frame_seq={control.frame_seq} mode={control.mode:02X}h")
+        if len(argv) == 3:
+            addr = parse_address(argv[1])
+            length = int(argv[2], 16)
+            reader = GuestMemoryReader(name, addr, length)
+            try:
+                hexdump(addr, reader.read_block(addr, length))
+            finally:
+                reader.close()
+    finally:
+        control.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
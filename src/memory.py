@@ -1,15 +1,50 @@
 # memory.py
 
+import mmap
+
+PAGE_SHIFT = 12
+PAGE_SIZE = 1 << PAGE_SHIFT
+
+# i80386 의 32비트 물리 주소 공간
+MAX_MEMORY_SIZE = 1 << 32
+
+def _anonymous_map(size):
+    """
+    0으로 채워진 익명 private 매핑. 커널이 페이지를 처음 쓸 때 할당하므로
+    건드리지 않은 페이지는 RSS 를 차지하지 않고, 읽기만 한 페이지는 공유 제로 페이지를 가리킨다.
+    """
+    flags = getattr(mmap, "MAP_PRIVATE", None)
+    if flags is None:
+        # Windows: 페이지 파일 기반 매핑도 처음 접근할 때 커밋된다
+        return mmap.mmap(-1, size)
+    return mmap.mmap(-1, size, flags=flags | mmap.MAP_ANONYMOUS)
+
 class Memory:
     """
     간단한 물리 메모리(Physical Memory) 구현.
-    i80386은 32비트 주소로 최대 4GB까지 접근 가능하지만,
-    여기서는 예시로 16MB(0x1000000)만 할당.
+    i80386은 32비트 주소로 최대 4GB까지 접근 가능하다. 크기는 생성 시 정하며(기본 16MB),
+    익명 mmap 위에 잡으므로 게스트가 실제로 쓴 페이지만 호스트 메모리를 차지한다.
+    shared_name 을 주면 multiprocessing.shared_memory 위에 잡아, 렌더러/검사 도구 같은
+    다른 프로세스가 같은 이름으로 붙어 게스트 메모리를 읽을 수 있다 (shared_state.py).
+
+    페이지(4KB) 단위 쓰기 훅을 지원한다.
+    훅이 하나도 없을 때는 write8/16/32 가 원래 메서드 그대로라 비용이 없고,
+    훅이 등록되면 인스턴스 속성으로 훅 버전 메서드를 끼워 넣는다.
     """
 
-    def __init__(self, size_in_bytes=0x1000000):
+    def __init__(self, size_in_bytes=0x1000000, shared_name=None):
+        if size_in_bytes <= 0 or size_in_bytes > MAX_MEMORY_SIZE:
+            raise Exception(f"Invalid memory size: 0x{size_in_bytes:X} (max 0x{MAX_MEMORY_SIZE:X})")
         self.size = size_in_bytes
-        self.mem = bytearray(self.size)
+        self.shm = None
+        if shared_name is None:
+            self.mem = _anonymous_map(self.size)
+        else:
+            from multiprocessing import shared_memory
+            self.shm = shared_memory.SharedMemory(name=shared_name, create=True, size=self.size)
+            self.mem = self.shm.buf
+        # page 번호 -> [callback(addr, size, value), ...]
+        self.write_hooks = {}
 
     def read8(self, addr: int) -> int:
         if addr < 0 or addr >= self.size:
@@ -34,11 +69,157 @@ class Memory:
         self.mem[addr] = value & 0xFF
 
     def write16(self, addr: int, value: int):
-        self.write8(addr, value & 0xFF)
-        self.write8(addr+1, (value >> 8) & 0xFF)
+        if addr < 0 or addr + 1 >= self.size:
+            raise Exception(f"Memory write16 out of range: 0x{addr:08X}")
+        mem = self.mem
+        mem[addr] = value & 0xFF
+        mem[addr+1] = (value >> 8) & 0xFF
 
     def write32(self, addr: int, value: int):
-        self.write8(addr, value & 0xFF)
-        self.write8(addr+1, (value >> 8) & 0xFF)
-        self.write8(addr+2, (value >> 16) & 0xFF)
-        self.write8(addr+3, (value >> 24) & 0xFF)
\ No newline at end of file
+        if addr < 0 or addr + 3 >= self.size:
+            raise Exception(f"Memory write32 out of range: 0x{addr:08X}")
+        mem = self.mem
+        mem[addr] = value & 0xFF
+        mem[addr+1] = (value >> 8) & 0xFF
+        mem[addr+2] = (value >> 16) & 0xFF
+        mem[addr+3] = (value >> 24) & 0xFF
+
+    def read_block(self, addr: int, length: int) -> bytes:
+        if addr < 0 or addr + length > self.size:
+            raise Exception(f"Memory read_block out of range: 0x{addr:08X}+{length}")
+        return bytes(self.mem[addr:addr + length])
+
+    def write_block(self, addr: int, data):
+        length = len(data)
+        if addr < 0 or addr + length > self.size:
+            raise Exception(f"Memory write_block out of range: 0x{addr:08X}+{length}")
+        self.mem[addr:addr + length] = data
+
+    def close(self):
+        """공유 메모리로 만들었으면 해제하고 이름을 지운다."""
+        if self.shm is not None:
+            self.mem = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def resident_pages(self):
+        """
+        실제로 호스트 메모리를 차지하는(게스트가 쓴) 페이지 수.
+        Linux 의 /proc/self/pagemap 에서 present 이면서 이 프로세스 전용인 페이지만 센다
+        (공유 제로 페이지는 제외). 공유 메모리는 다른 프로세스도 매핑하므로 present 만 본다.
+        알 수 없는 플랫폼에서는 None.
+        """
+        try:
+            import ctypes
+            addr = ctypes.addressof(ctypes.c_char.from_buffer(self.mem))
+            with open("/proc/self/pagemap", "rb") as f:
+                f.seek((addr >> PAGE_SHIFT) * 8)
+                data = f.read(((self.size + PAGE_SIZE - 1) >> PAGE_SHIFT) * 8)
+        except (OSError, ImportError, TypeError, ValueError):
+            return None
+        count = 0
+        # bit 63 = present, bit 56 = 이 프로세스에만 매핑됨
+        mask = (1 << 63) if self.shm is not None else (1 << 63) | (1 << 56)
+        for entry in memoryview(data).cast("Q"):
+            if entry & mask == mask:
+                count += 1
+        return count
+
+    # ------------------------------------------------------------
+    # 페이지 단위 쓰기 훅
+    # ------------------------------------------------------------
+    def add_write_hook(self, page: int, callback):
+        """
+        page(= addr >> PAGE_SHIFT)에 쓰기가 일어나면 callback(addr, size, value) 호출.
+        write_block 은 size=블록 길이, value=첫 바이트로 호출된다.
+        """
+        self.write_hooks.setdefault(page, []).append(callback)
+        self._rebind_writers()
+
+    def remove_write_hook(self, page: int, callback):
+        hooks = self.write_hooks.get(page)
+        if hooks and callback in hooks:
+            hooks.remove(callback)
+            if not hooks:
+                del self.write_hooks[page]
+        self._rebind_writers()
+
+    def _rebind_writers(self):
+        if self.write_hooks:
+            self.write8 = self._hooked_write8
+            self.write16 = self._hooked_write16
+            self.write32 = self._hooked_write32
+            self.write_block = self._hooked_write_block
+        else:
+            # 인스턴스 속성을 지우면 클래스 메서드(훅 없는 경로)로 돌아간다.
+            for name in ("write8", "write16", "write32", "write_block"):
+                self.__dict__.pop(name, None)
+
+    def _notify(self, addr, size, value):
+        hooks = self.write_hooks
+        first = addr >> PAGE_SHIFT
+        last = (addr + size - 1) >> PAGE_SHIFT
+        for page in (first,) if first == last else range(first, last + 1):
+            callbacks = hooks.get(page)
+            if callbacks:
+                for cb in tuple(callbacks):
+                    cb(addr, size, value)
+
+    def _hooked_write8(self, addr: int, value: int):
+        Memory.write8(self, addr, value)
+        self._notify(addr, 1, value & 0xFF)
+
+    def _hooked_write16(self, addr: int, value: int):
+        Memory.write16(self, addr, value)
+        self._notify(addr, 2, value & 0xFFFF)
+
+    def _hooked_write32(self, addr: int, value: int):
+        Memory.write32(self, addr, value)
+        self._notify(addr, 4, value & 0xFFFFFFFF)
+
+    def _hooked_write_block(self, addr: int, data):
+        Memory.write_block(self, addr, data)
+        if data:
+            # 블록 쓰기는 value 자리에 첫 바이트를 넘긴다
+            self._notify(addr, len(data), data[0])
+
+
+class PageRanges:
+    """
+    쓰기 훅을 건 페이지 하나에 올려 둔 (item, lo, hi) 목록 (디코드 캐시, 컴파일된 블록).
+    쓰기 훅은 페이지 단위라 같은 페이지의 데이터에 쓰기만 해도 불리므로, 쓴 바이트 범위와
+    실제로 겹치는 item 만 골라낸다. 전체 범위 [lo, hi) 를 함께 들고 있어 코드와 떨어진
+    데이터 쓰기는 목록을 훑지 않고 거른다.
+    """
+
+    __slots__ = ("items", "lo", "hi")
+
+    def __init__(self):
+        self.items = []
+        self.lo = MAX_MEMORY_SIZE
+        self.hi = 0
+
+    def add(self, item, lo, hi):
+        self.items.append((item, lo, hi))
+        if lo < self.lo:
+            self.lo = lo
+        if hi > self.hi:
+            self.hi = hi
+
+    def take(self, lo, hi):
+        """[lo, hi) 와 겹치는 item 들을 목록에서 빼서 돌려준다"""
+        if hi <= self.lo or self.hi <= lo:
+            return ()
+        hit = [item for item, a, b in self.items if a < hi and lo < b]
+        if hit:
+            self._keep([e for e in self.items if not (e[1] < hi and lo < e[2])])
+        return hit
+
+    def remove(self, item):
+        self._keep([e for e in self.items if e[0] is not item])
+
+    def _keep(self, items):
+        self.items = items
+        self.lo = min((a for _, a, _ in items), default=MAX_MEMORY_SIZE)
+        self.hi = max((b for _, _, b in items), default=0)
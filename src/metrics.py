@@ -0,0 +1,232 @@
+# metrics.py
+#
+# 디버거를 붙이지 않고 에뮬레이터 처리량/지연을 지켜보기 위한 가벼운 지표 모음.
+#  - Counter   : 단조 증가 값. 장치가 inc() 하거나, 이미 있는 통계 값을 collect 함수로 읽는다
+#                (읽는 쪽에서만 비용이 든다).
+#  - Gauge     : 읽을 때마다 collect 함수로 계산하는 값 (캐시 적중률 등)
+#  - Rate      : collect 값의 초당 증가율 (IPS). sample() 사이의 변화로 계산한다.
+#  - Histogram : 고정 버킷 분포. observe() 는 bisect 한 번과 덧셈 몇 번뿐이다.
+# 출력은 Prometheus 텍스트 형식이다. MetricsExporter 가 이벤트 루프 타이머로 주기적으로
+# 파일에 쓰거나(임시 파일 + rename), 로컬 Unix 소켓에 붙은 클라이언트에게 한 번 써 주고 닫는다.
+#
+#   python main.py --metrics /tmp/emu.prom
+#   python main.py --metrics unix:/tmp/emu.sock   (nc -U /tmp/emu.sock)
+
+import bisect
+import os
+import socket
+import time
+
+# 기본 버킷: 호스트 시간(초) 지연, 명령어 수 지연
+SECONDS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+INSTRUCTION_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+# MetricsExporter 가 값을 갱신(및 파일에 기록)하는 기본 주기(초)
+DEFAULT_INTERVAL = 5.0
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(value)
+    return str(int(value))
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+class Counter:
+    """
+    collect 가 없으면 inc() 로 올리는 값. collect 는 숫자 또는 [(labels dict, 값), ...] 를 돌려준다.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, collect=None):
+        self.name = name
+        self.help = help_text
+        self.collect = collect
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def samples(self):
+        value = self.value if self.collect is None else self.collect()
+        if isinstance(value, list):
+            return [(self.name, labels, v) for labels, v in value]
+        return [(self.name, None, value)]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+
+class Rate(Gauge):
+    """collect() 값의 초당 증가율. 값은 sample() 때만 바뀐다 (처음에는 0)."""
+
+    def __init__(self, name, help_text, collect):
+        super().__init__(name, help_text)
+        self.source = collect
+        self.last = (collect(), time.monotonic())
+        self.value = 0.0
+
+    def sample(self, now):
+        value = self.source()
+        last_value, last_time = self.last
+        if now > last_time:
+            self.value = (value - last_value) / (now - last_time)
+            self.last = (value, now)
+
+
+class Histogram:
+    """
+    고정 버킷 히스토그램. buckets 는 각 버킷의 상한(le)이고 +Inf 는 자동으로 붙는다.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self, fn):
+        """fn 을 감싸 호출마다 걸린 호스트 시간(초)을 기록하는 함수를 돌려준다."""
+        observe = self.observe
+        perf_counter = time.perf_counter
+
+        def timed(*args):
+            start = perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                observe(perf_counter() - start)
+        return timed
+
+    def samples(self):
+        out = []
+        total = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            total += n
+            out.append((self.name + "_bucket", {"le": _format_value(bound)}, total))
+        out.append((self.name + "_sum", None, self.sum))
+        out.append((self.name + "_count", None, self.count))
+        return out
+
+
+class MetricsRegistry:
+    """이름 -> 지표. 같은 이름을 두 번 등록하면 예외."""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def _add(self, metric):
+        if metric.name in self.metrics:
+            raise Exception(f"metric {metric.name} already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, collect=None):
+        return self._add(Counter(name, help_text, collect))
+
+    def gauge(self, name, help_text, collect):
+        return self._add(Gauge(name, help_text, collect))
+
+    def rate(self, name, help_text, collect):
+        return self._add(Rate(name, help_text, collect))
+
+    def histogram(self, name, help_text, buckets=SECONDS_BUCKETS):
+        return self._add(Histogram(name, help_text, buckets))
+
+    def sample(self):
+        """Rate 지표를 지금 값으로 갱신한다 (내보내기 주기마다)."""
+        now = time.monotonic()
+        for metric in self.metrics.values():
+            if isinstance(metric, Rate):
+                metric.sample(now)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def write_metrics_file(registry, path):
+    """읽는 쪽이 반쯤 쓴 파일을 보지 않도록 임시 파일에 쓰고 rename 한다."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(registry.render())
+    os.replace(tmp, path)
+
+
+class MetricsExporter:
+    """
+    target 이 'unix:PATH' 면 Unix 소켓을 열어 접속할 때마다 현재 지표를 써 주고 닫는다.
+    아니면 파일 경로로 보고 interval 초마다 다시 쓴다. 어느 쪽이든 interval 마다 sample() 한다.
+    """
+
+    def __init__(self, registry, loop, target, interval=DEFAULT_INTERVAL):
+        self.registry = registry
+        self.loop = loop
+        self.path = None
+        self.unix_path = None
+        self.server = None
+        self.scrapes = 0
+        if target.startswith("unix:"):
+            self.unix_path = target[5:]
+            if os.path.exists(self.unix_path):
+                os.unlink(self.unix_path)
+            self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.server.bind(self.unix_path)
+            self.server.listen(4)
+            self.server.setblocking(False)
+            loop.add_reader(self.server, self._on_accept)
+        else:
+            self.path = target
+        self.timer = loop.call_every(interval, self.tick)
+
+    def tick(self):
+        self.registry.sample()
+        if self.path is not None:
+            write_metrics_file(self.registry, self.path)
+
+    def _on_accept(self, server):
+        try:
+            conn, _ = server.accept()
+        except BlockingIOError:
+            return
+        self.scrapes += 1
+        try:
+            # 지표 텍스트는 작으므로 짧은 타임아웃으로 한 번에 보낸다
+            conn.settimeout(1.0)
+            conn.sendall(self.registry.render().encode())
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    def close(self):
+        self.timer.cancel()
+        if self.path is not None:
+            self.tick()
+        if self.server is not None:
+            self.loop.remove_reader(self.server)
+            self.server.close()
+            if os.path.exists(self.unix_path):
+                os.unlink(self.unix_path)
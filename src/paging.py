@@ -0,0 +1,195 @@
+# paging.py
+
+from memory import PAGE_SHIFT, PAGE_SIZE
+
+PAGE_MASK = PAGE_SIZE - 1
+FRAME_MASK = 0xFFFFF000
+
+# 페이지 디렉터리/테이블 엔트리 비트
+PTE_P = 0x01    # present
+PTE_RW = 0x02   # 쓰기 가능
+PTE_US = 0x04   # 사용자 접근 가능
+PTE_A = 0x20    # accessed
+PTE_D = 0x40    # dirty
+
+# TLB 엔트리 = 물리 프레임 주소 | 권한 비트 (PDE & PTE 의 RW/US, 그리고 PTE_D)
+# PTE_D 가 없는 엔트리로 쓰기를 하면 미스로 처리해 페이지 테이블의 D 비트를 세운다.
+
+# #PF 에러 코드
+PF_PROTECTION = 0x01
+PF_WRITE = 0x02
+PF_USER = 0x04
+
+
+class PageFault(Exception):
+    """#PF. CR2 에는 폴트 선형 주소가 이미 기록되어 있다."""
+
+    def __init__(self, linear, error_code):
+        super().__init__(f"#PF at linear 0x{linear:08X} (error code {error_code:X})")
+        self.linear = linear
+        self.error_code = error_code
+
+
+class PagedMemory:
+    """
+    386 2단계 페이징을 거치는 선형 주소 메모리 뷰.
+    Memory 와 같은 read/write 인터페이스라, CR0.PG 가 켜지면 CPU 가 self.mem 을
+    이 객체로 바꿔 끼우기만 하면 된다.
+
+    변환 결과는 소프트웨어 TLB(dict: 가상 페이지 -> 프레임|권한)에 캐시되어
+    보통은 dict 조회 한 번으로 끝나고, 미스일 때만 Memory.read32 로 테이블을 걷는다.
+    CR3 쓰기는 flush(), INVLPG 는 invalidate(linear) 로 처리한다.
+    """
+
+    def __init__(self, memory, cpu):
+        self.phys = memory
+        self.cpu = cpu
+        self.size = 1 << 32
+        self.tlb = {}
+        self.tlb_hits = 0
+        self.tlb_misses = 0
+        self.user = False
+        self.read_need = 0
+        self.write_need = PTE_D
+
+    # ------------------------------------------------------------
+    # TLB 관리
+    # ------------------------------------------------------------
+    def flush(self):
+        self.tlb.clear()
+
+    def invalidate(self, linear):
+        self.tlb.pop((linear & 0xFFFFFFFF) >> PAGE_SHIFT, None)
+
+    def set_cpl(self, cpl):
+        """CPL 3 이면 사용자 권한으로 검사한다 (쓰기 보호는 386 과 같이 사용자 모드만)."""
+        self.user = cpl == 3
+        self.read_need = PTE_US if self.user else 0
+        self.write_need = PTE_D | (PTE_RW | PTE_US if self.user else 0)
+
+    def stats(self):
+        return {"tlb_hits": self.tlb_hits, "tlb_misses": self.tlb_misses,
+                "tlb_entries": len(self.tlb)}
+
+    def translate(self, linear, write=False):
+        """선형 주소 -> 물리 주소"""
+        linear &= 0xFFFFFFFF
+        need = self.write_need if write else self.read_need
+        entry = self.tlb.get(linear >> PAGE_SHIFT)
+        if entry is None or entry & need != need:
+            entry = self._walk(linear, write)
+        else:
+            self.tlb_hits += 1
+        return (entry & FRAME_MASK) | (linear & PAGE_MASK)
+
+    def _walk(self, linear, write):
+        self.tlb_misses += 1
+        phys = self.phys
+        user = self.user
+        pde_addr = (self.cpu.CR3 & FRAME_MASK) | ((linear >> 20) & 0xFFC)
+        pde = phys.read32(pde_addr)
+        if not pde & PTE_P:
+            self._fault(linear, 0, write)
+        pte_addr = (pde & FRAME_MASK) | ((linear >> 10) & 0xFFC)
+        pte = phys.read32(pte_addr)
+        if not pte & PTE_P:
+            self._fault(linear, 0, write)
+
+        perm = pde & pte & (PTE_RW | PTE_US)
+        if user and (not perm & PTE_US or (write and not perm & PTE_RW)):
+            self._fault(linear, PF_PROTECTION, write)
+
+        if not pde & PTE_A:
+            phys.write32(pde_addr, pde | PTE_A)
+        new_pte = pte | PTE_A | (PTE_D if write else 0)
+        if new_pte != pte:
+            phys.write32(pte_addr, new_pte)
+
+        entry = (pte & FRAME_MASK) | perm | (new_pte & PTE_D)
+        self.tlb[linear >> PAGE_SHIFT] = entry
+        return entry
+
+    def _fault(self, linear, error_code, write):
+        if write:
+            error_code |= PF_WRITE
+        if self.user:
+            error_code |= PF_USER
+        self.cpu.CR2 = linear
+        raise PageFault(linear, error_code)
+
+    # ------------------------------------------------------------
+    # Memory 호환 인터페이스
+    # ------------------------------------------------------------
+    def read8(self, addr: int) -> int:
+        entry = self.tlb.get((addr & 0xFFFFFFFF) >> PAGE_SHIFT)
+        need = self.read_need
+        if entry is None or entry & need != need:
+            entry = self._walk(addr & 0xFFFFFFFF, False)
+        else:
+            self.tlb_hits += 1
+        return self.phys.read8((entry & FRAME_MASK) | (addr & PAGE_MASK))
+
+    def read16(self, addr: int) -> int:
+        if addr & PAGE_MASK == PAGE_MASK:
+            return self.read8(addr) | (self.read8(addr + 1) << 8)
+        return self.phys.read16(self.translate(addr))
+
+    def read32(self, addr: int) -> int:
+        if addr & PAGE_MASK > PAGE_SIZE - 4:
+            return self.read16(addr) | (self.read16(addr + 2) << 16)
+        return self.phys.read32(self.translate(addr))
+
+    def write8(self, addr: int, value: int):
+        entry = self.tlb.get((addr & 0xFFFFFFFF) >> PAGE_SHIFT)
+        need = self.write_need
+        if entry is None or entry & need != need:
+            entry = self._walk(addr & 0xFFFFFFFF, True)
+        else:
+            self.tlb_hits += 1
+        self.phys.write8((entry & FRAME_MASK) | (addr & PAGE_MASK), value)
+
+    def write16(self, addr: int, value: int):
+        if addr & PAGE_MASK == PAGE_MASK:
+            # 두 페이지 모두 쓰기 가능한지 먼저 확인 (반쪽만 쓰고 폴트 나지 않도록)
+            self.translate(addr + 1, True)
+            self.write8(addr, value)
+            self.write8(addr + 1, value >> 8)
+            return
+        self.phys.write16(self.translate(addr, True), value)
+
+    def write32(self, addr: int, value: int):
+        if addr & PAGE_MASK > PAGE_SIZE - 4:
+            self.translate(addr + 3, True)
+            self.write16(addr, value)
+            self.write16(addr + 2, value >> 16)
+            return
+        self.phys.write32(self.translate(addr, True), value)
+
+    def read_block(self, addr: int, length: int) -> bytes:
+        out = bytearray()
+        while length > 0:
+            chunk = min(length, PAGE_SIZE - (addr & PAGE_MASK))
+            out += self.phys.read_block(self.translate(addr), chunk)
+            addr += chunk
+            length -= chunk
+        return bytes(out)
+
+    def write_block(self, addr: int, data):
+        view = memoryview(data)
+        # 쓰기 전에 모든 페이지를 변환해 두어 중간에 폴트가 나도 일부만 쓰이지 않게 한다
+        targets = []
+        pos = 0
+        while pos < len(view):
+            chunk = min(len(view) - pos, PAGE_SIZE - ((addr + pos) & PAGE_MASK))
+            targets.append((self.translate(addr + pos, True), pos, chunk))
+            pos += chunk
+        for phys_addr, pos, chunk in targets:
+            self.phys.write_block(phys_addr, view[pos:pos + chunk])
+
+    # 쓰기 훅은 물리 전용: page 는 물리 페이지 번호이고 콜백도 물리 주소를 받는다.
+    # 선형 주소를 감시하려면 호출한 쪽이 프레임으로 바꿔야 한다 (디버거 워치포인트는 페이징 중에 끈다).
+    def add_write_hook(self, page: int, callback):
+        self.phys.add_write_hook(page, callback)
+
+    def remove_write_hook(self, page: int, callback):
+        self.phys.remove_write_hook(page, callback)
@@ -0,0 +1,537 @@
+# reference_cpu.py
+#
+# lockstep 검증용 기준 인터프리터.
+# 최적화 엔진과 같은 디코더(decoder.Decoder)와 같은 DISPATCH/ALU_OPS/SHIFT_OPS/CONDITIONS 표를
+# 쓰면 그 안의 버그가 양쪽에 똑같이 나타나 비교로는 잡을 수 없다. 그래서 여기서는 명령어 바이트를
+# 직접 읽어 접두어/ModR/M/변위/즉치값을 따로 해석하고, 연산과 플래그도 따로 계산한다.
+#
+# 직접 실행하는 명령어 (퍼징 대상과 부트 코드의 일반 명령어):
+#   00~3D ALU, 06/0E/16/1E PUSH Sreg, 07/17/1F POP Sreg, 40~5F INC/DEC/PUSH/POP r,
+#   70~7F Jcc, 80~83, 89/8B/8C/8E MOV, 90, A4/A5/AA/AC, B0~BF, C0/C1/D0~D3, C3,
+#   E2, E8/E9/EB, F4, FA/FB, FE/FF /0 /1
+# 그 밖의 명령어(INT/IRET/RETF/JMP far, 포트 I/O, INS/OUTS, 0F xx 시스템 명령, 67h 접두어,
+# 구현되지 않은 opcode)와 외부 인터럽트 진입은 cpu.step 에 맡긴다. 이 경로는 양쪽이 같은 코드를
+# 타므로 lockstep 이 검증하지 못한다 (stats()["delegated"] 가 그 명령어 수다).
+# 세그먼트 로드(load_segment), 메모리, I/O 버스도 CPU 의 것을 그대로 쓴다.
+#
+# 예외 메시지와 예외가 날 때의 EIP/instret 은 cpu.py 와 같게 맞춘다 (lockstep 이 문자열로 비교한다).
+
+from cpu import (FLAG_CF, FLAG_PF, FLAG_AF, FLAG_ZF, FLAG_SF, FLAG_OF, FLAG_IF, FLAG_DF,
+                 SEG_ES, SEG_CS, SEG_SS, SEG_DS)
+
+_ARITH = FLAG_CF | FLAG_PF | FLAG_AF | FLAG_ZF | FLAG_SF | FLAG_OF
+_REGS = ("EAX", "ECX", "EDX", "EBX", "ESP", "EBP", "ESI", "EDI")
+_PREFIX_SEG = {0x26: SEG_ES, 0x2E: SEG_CS, 0x36: SEG_SS, 0x3E: SEG_DS, 0x64: 4, 0x65: 5}
+_PUSH_SREG = {0x06: SEG_ES, 0x0E: SEG_CS, 0x16: SEG_SS, 0x1E: SEG_DS}
+_POP_SREG = {0x07: SEG_ES, 0x17: SEG_SS, 0x1F: SEG_DS}
+
+
+class _Delegate(Exception):
+    """이 명령어는 직접 실행하지 않는다 (cpu.step 으로 넘긴다)"""
+
+
+class ReferenceInterpreter:
+    """
+    cpu 의 레지스터/메모리 위에서 한 명령어씩 실행한다. cpu 의 블록 컴파일러는 꺼져 있어야 한다.
+    cpu.trace 가 켜져 있으면 직접 실행한 명령어도 cpu.step 과 같은 형식으로 기록한다.
+    """
+
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.executed = 0    # 직접 실행한 명령어 수
+        self.delegated = 0   # cpu.step 에 맡긴 명령어 수
+        self.ops = {}
+        for op in range(0x40):
+            if op & 7 < 6:
+                self.ops[op] = self._op_alu
+        for op in _PUSH_SREG:
+            self.ops[op] = self._op_push_sreg
+        for op in _POP_SREG:
+            self.ops[op] = self._op_pop_sreg
+        for op in range(0x40, 0x50):
+            self.ops[op] = self._op_incdec_r
+        for op in range(0x50, 0x58):
+            self.ops[op] = self._op_push_r
+        for op in range(0x58, 0x60):
+            self.ops[op] = self._op_pop_r
+        for op in range(0x70, 0x80):
+            self.ops[op] = self._op_jcc
+        for op in range(0x80, 0x84):
+            self.ops[op] = self._op_alu_imm
+        for op in range(0xB0, 0xC0):
+            self.ops[op] = self._op_mov_imm
+        for op in (0xC0, 0xC1, 0xD0, 0xD1, 0xD2, 0xD3):
+            self.ops[op] = self._op_shift
+        self.ops.update({
+            0x89: self._op_mov_ev_gv, 0x8B: self._op_mov_gv_ev,
+            0x8C: self._op_mov_ew_sreg, 0x8E: self._op_mov_sreg_ew,
+            0x90: self._op_nop, 0xA4: self._op_movs, 0xA5: self._op_movs,
+            0xAA: self._op_stosb, 0xAC: self._op_lodsb, 0xC3: self._op_ret,
+            0xE2: self._op_loop, 0xE8: self._op_call, 0xE9: self._op_jmp, 0xEB: self._op_jmp,
+            0xF4: self._op_hlt, 0xFA: self._op_cli, 0xFB: self._op_sti,
+            0xFE: self._op_incdec_rm, 0xFF: self._op_incdec_rm,
+        })
+
+    def stats(self):
+        return {"executed": self.executed, "delegated": self.delegated}
+
+    # ------------------------------------------------------------
+    # 실행
+    # ------------------------------------------------------------
+    def step(self):
+        cpu = self.cpu
+        if cpu.halted or (cpu.EFLAGS & FLAG_IF and cpu.ic.has_pending()):
+            # 인터럽트 진입/HLT 대기는 CPU 쪽 구현을 그대로 쓴다
+            cpu.step()
+            return
+        self.ip = cpu.EIP
+        self.base = cpu.seg_base[SEG_CS]
+        self.pos = self.ip
+        try:
+            op = self._prefixes()
+            handler = self.ops.get(op)
+            if handler is None:
+                raise _Delegate()
+        except _Delegate:
+            self.delegated += 1
+            cpu.step()
+            return
+        if cpu.trace is not None:
+            cpu.trace.record(cpu, op)
+        self.executed += 1
+        handler(op)
+
+    def _prefixes(self):
+        self.seg = None
+        self.rep = 0
+        self.opsize = 16
+        while True:
+            b = self._byte()
+            if b in _PREFIX_SEG:
+                self.seg = _PREFIX_SEG[b]
+            elif b == 0xF2 or b == 0xF3:
+                self.rep = b
+            elif b == 0x66:
+                self.opsize = 32
+            elif b == 0x67 or b == 0x0F:
+                raise _Delegate()
+            elif b != 0xF0:
+                return b
+            if self.pos - self.ip >= 15:
+                raise _Delegate()
+
+    def _retire(self):
+        """명령어 바이트를 다 읽었다: EIP 를 다음 명령어로, instret 을 하나 올린다 (cpu.step 과 같은 시점)"""
+        self.cpu.EIP = self.pos & 0xFFFF
+        self.cpu.instret += 1
+
+    def _where(self):
+        return f"{self.cpu.CS:04X}:{(self.base + self.ip) & 0xFFFF:04X}"
+
+    def _no_opsize32(self, op):
+        if self.opsize == 32:
+            raise Exception(f"Unimplemented opcode 0x66 0x{op:02X} (32-bit operand) at {self._where()}")
+
+    # ------------------------------------------------------------
+    # 명령어 바이트 읽기
+    # ------------------------------------------------------------
+    def _byte(self):
+        val = self.cpu.mem.read8(self.base + (self.pos & 0xFFFF))
+        self.pos += 1
+        return val
+
+    def _imm(self, size):
+        val = 0
+        for i in range(size):
+            val |= self._byte() << (8 * i)
+        return val
+
+    def _rel(self, size):
+        val = self._imm(size)
+        return val - (1 << (8 * size)) if val >> (8 * size - 1) else val
+
+    def _modrm(self):
+        """ModR/M (16비트 주소) -> (reg, rm, 메모리 선형 주소 또는 레지스터면 None)"""
+        cpu = self.cpu
+        m = self._byte()
+        mod, reg, rm = m >> 6, (m >> 3) & 7, m & 7
+        if mod == 3:
+            return reg, rm, None
+        if mod == 0 and rm == 6:
+            return reg, rm, cpu.seg_base[SEG_DS if self.seg is None else self.seg] + self._imm(2)
+        bx, bp, si, di = cpu.EBX & 0xFFFF, cpu.EBP & 0xFFFF, cpu.ESI & 0xFFFF, cpu.EDI & 0xFFFF
+        off = (bx + si, bx + di, bp + si, bp + di, si, di, bp, bx)[rm]
+        if mod == 1:
+            off += self._rel(1)
+        elif mod == 2:
+            off += self._imm(2)
+        seg = SEG_SS if rm in (2, 3, 6) else SEG_DS
+        if self.seg is not None:
+            seg = self.seg
+        return reg, rm, cpu.seg_base[seg] + (off & 0xFFFF)
+
+    # ------------------------------------------------------------
+    # 레지스터 / 오퍼랜드
+    # ------------------------------------------------------------
+    def _reg(self, n, bits):
+        if bits == 8:
+            val = getattr(self.cpu, _REGS[n & 3])
+            return (val >> 8) & 0xFF if n & 4 else val & 0xFF
+        return getattr(self.cpu, _REGS[n]) & ((1 << bits) - 1)
+
+    def _set_reg(self, n, bits, val):
+        if bits == 8:
+            name, shift = _REGS[n & 3], 8 if n & 4 else 0
+        else:
+            name, shift = _REGS[n], 0
+        keep = 0xFFFFFFFF ^ (((1 << bits) - 1) << shift)
+        setattr(self.cpu, name, (getattr(self.cpu, name) & keep) | ((val & ((1 << bits) - 1)) << shift))
+
+    def _load(self, rm, addr, bits):
+        if addr is None:
+            return self._reg(rm, bits)
+        mem = self.cpu.mem
+        return mem.read8(addr) if bits == 8 else mem.read16(addr) if bits == 16 else mem.read32(addr)
+
+    def _store(self, rm, addr, bits, val):
+        if addr is None:
+            self._set_reg(rm, bits, val)
+            return
+        mem = self.cpu.mem
+        if bits == 8:
+            mem.write8(addr, val)
+        elif bits == 16:
+            mem.write16(addr, val)
+        else:
+            mem.write32(addr, val)
+
+    def _push(self, val, size=2):
+        cpu = self.cpu
+        sp = (cpu.ESP - size) & 0xFFFF
+        cpu.ESP = (cpu.ESP & 0xFFFF0000) | sp
+        if size == 2:
+            cpu.mem.write16(cpu.seg_base[SEG_SS] + sp, val & 0xFFFF)
+        else:
+            cpu.mem.write32(cpu.seg_base[SEG_SS] + sp, val & 0xFFFFFFFF)
+
+    def _pop(self, size=2):
+        cpu = self.cpu
+        sp = cpu.ESP & 0xFFFF
+        addr = cpu.seg_base[SEG_SS] + sp
+        val = cpu.mem.read16(addr) if size == 2 else cpu.mem.read32(addr)
+        cpu.ESP = (cpu.ESP & 0xFFFF0000) | ((sp + size) & 0xFFFF)
+        return val
+
+    def _step_string(self, name, size):
+        """SI/DI 를 DF 방향으로 size 만큼 옮긴다"""
+        cpu = self.cpu
+        delta = -size if cpu.EFLAGS & FLAG_DF else size
+        val = getattr(cpu, name)
+        setattr(cpu, name, (val & 0xFFFF0000) | ((val + delta) & 0xFFFF))
+
+    # ------------------------------------------------------------
+    # 플래그와 산술
+    # ------------------------------------------------------------
+    def _set_flags(self, res, bits, cf, of, af):
+        f = self.cpu.EFLAGS & ~_ARITH
+        if cf:
+            f |= FLAG_CF
+        if bin(res & 0xFF).count("1") % 2 == 0:
+            f |= FLAG_PF
+        if af:
+            f |= FLAG_AF
+        if res == 0:
+            f |= FLAG_ZF
+        if res >> (bits - 1):
+            f |= FLAG_SF
+        if of:
+            f |= FLAG_OF
+        self.cpu.EFLAGS = f
+
+    def _alu(self, n, a, b, bits):
+        """n: 0=ADD 1=OR 2=ADC 3=SBB 4=AND 5=SUB 6=XOR 7=CMP. 결과를 돌려주고 플래그를 쓴다."""
+        mask = (1 << bits) - 1
+        if n in (1, 4, 6):
+            res = a | b if n == 1 else a & b if n == 4 else a ^ b
+            self._set_flags(res, bits, False, False, False)
+            return res
+        c = self.cpu.EFLAGS & FLAG_CF if n in (2, 3) else 0
+        sa, sb = _signed(a, bits), _signed(b, bits)
+        if n in (0, 2):
+            full = a + b + c
+            res = full & mask
+            self._set_flags(res, bits, full > mask, sa + sb + c != _signed(res, bits),
+                            (a & 0xF) + (b & 0xF) + c > 0xF)
+        else:
+            full = a - b - c
+            res = full & mask
+            self._set_flags(res, bits, full < 0, sa - sb - c != _signed(res, bits),
+                            (a & 0xF) - (b & 0xF) - c < 0)
+        return res
+
+    def _incdec(self, dec, a, bits):
+        cf = self.cpu.EFLAGS & FLAG_CF
+        res = self._alu(5 if dec else 0, a, 1, bits)
+        self.cpu.EFLAGS = (self.cpu.EFLAGS & ~FLAG_CF) | cf
+        return res
+
+    def _shift(self, n, a, count, bits):
+        """n: 0=ROL 1=ROR 2=RCL 3=RCR 4/6=SHL 5=SHR 7=SAR. count 는 1~31. 한 비트씩 돌린다."""
+        cpu = self.cpu
+        msb = 1 << (bits - 1)
+        mask = (1 << bits) - 1
+        cf = cpu.EFLAGS & FLAG_CF
+        if n < 4:
+            if n < 2:
+                count %= bits
+            else:
+                count %= bits + 1
+                if count == 0:
+                    return a
+            for _ in range(count):
+                if n == 0:
+                    a = ((a << 1) | (a >> (bits - 1))) & mask
+                elif n == 1:
+                    a = (a >> 1) | ((a & 1) << (bits - 1))
+                elif n == 2:
+                    a, cf = ((a << 1) | cf) & mask, a >> (bits - 1)
+                else:
+                    a, cf = (a >> 1) | (cf << (bits - 1)), a & 1
+            if n == 0:
+                cf = a & 1
+            elif n == 1:
+                cf = a >> (bits - 1)
+            if n in (0, 2):
+                of = cf ^ (a >> (bits - 1))
+            else:
+                of = ((a >> (bits - 1)) ^ (a >> (bits - 2))) & 1
+            cpu.EFLAGS = (cpu.EFLAGS & ~(FLAG_CF | FLAG_OF)) | cf | (FLAG_OF if of else 0)
+            return a
+        orig = a
+        for _ in range(count):
+            if n == 5:
+                a, cf = a >> 1, a & 1
+            elif n == 7:
+                a, cf = (a >> 1) | (a & msb), a & 1
+            else:
+                a, cf = (a << 1) & mask, a >> (bits - 1)
+        if n == 5:
+            of = orig & msb
+        elif n == 7:
+            of = 0
+        else:
+            of = cf ^ (a >> (bits - 1))
+        self._set_flags(a, bits, cf, of, False)
+        return a
+
+    def _condition(self, cc):
+        f = self.cpu.EFLAGS
+        cf, zf = bool(f & FLAG_CF), bool(f & FLAG_ZF)
+        sf, of, pf = bool(f & FLAG_SF), bool(f & FLAG_OF), bool(f & FLAG_PF)
+        taken = (of, cf, zf, cf or zf, sf, pf, sf != of, zf or sf != of)[cc >> 1]
+        return taken != bool(cc & 1)
+
+    # ------------------------------------------------------------
+    # 명령어
+    # ------------------------------------------------------------
+    def _op_alu(self, op):
+        n, form = op >> 3, op & 7
+        bits = 8 if form in (0, 2, 4) else self.opsize
+        if form >= 4:
+            b = self._imm(bits // 8)
+            self._retire()
+            res = self._alu(n, self._reg(0, bits), b, bits)
+            if n != 7:
+                self._set_reg(0, bits, res)
+            return
+        reg, rm, addr = self._modrm()
+        self._retire()
+        if form < 2:
+            res = self._alu(n, self._load(rm, addr, bits), self._reg(reg, bits), bits)
+            if n != 7:
+                self._store(rm, addr, bits, res)
+        else:
+            res = self._alu(n, self._reg(reg, bits), self._load(rm, addr, bits), bits)
+            if n != 7:
+                self._set_reg(reg, bits, res)
+
+    def _op_alu_imm(self, op):
+        bits = 8 if op in (0x80, 0x82) else self.opsize
+        reg, rm, addr = self._modrm()
+        if op == 0x81:
+            b = self._imm(bits // 8)
+        elif op == 0x83:
+            b = self._rel(1) & ((1 << bits) - 1)
+        else:
+            b = self._imm(1)
+        self._retire()
+        res = self._alu(reg, self._load(rm, addr, bits), b, bits)
+        if reg != 7:
+            self._store(rm, addr, bits, res)
+
+    def _op_incdec_r(self, op):
+        self._retire()
+        r = op & 7
+        self._set_reg(r, self.opsize, self._incdec(op >= 0x48, self._reg(r, self.opsize), self.opsize))
+
+    def _op_incdec_rm(self, op):
+        reg, rm, addr = self._modrm()
+        self._retire()
+        if reg > 1:
+            raise Exception(f"Unimplemented opcode 0x{op:02X} /{reg} at {self._where()}")
+        bits = 8 if op == 0xFE else self.opsize
+        self._store(rm, addr, bits, self._incdec(reg == 1, self._load(rm, addr, bits), bits))
+
+    def _op_shift(self, op):
+        reg, rm, addr = self._modrm()
+        if op in (0xC0, 0xC1):
+            count = self._imm(1) & 0x1F
+        elif op in (0xD0, 0xD1):
+            count = 1
+        else:
+            count = self.cpu.ECX & 0x1F
+        self._retire()
+        if count:
+            bits = 8 if not op & 1 else self.opsize
+            self._store(rm, addr, bits, self._shift(reg, self._load(rm, addr, bits), count, bits))
+
+    def _op_mov_ev_gv(self, op):
+        reg, rm, addr = self._modrm()
+        self._retire()
+        self._store(rm, addr, self.opsize, self._reg(reg, self.opsize))
+
+    def _op_mov_gv_ev(self, op):
+        reg, rm, addr = self._modrm()
+        self._retire()
+        self._set_reg(reg, self.opsize, self._load(rm, addr, self.opsize))
+
+    def _op_mov_ew_sreg(self, op):
+        reg, rm, addr = self._modrm()
+        self._retire()
+        if reg > 5:
+            raise Exception(f"#UD: MOV from sreg {reg}")
+        self._store(rm, addr, 16, self.cpu.sreg[reg])
+
+    def _op_mov_sreg_ew(self, op):
+        reg, rm, addr = self._modrm()
+        self._retire()
+        if reg == SEG_CS or reg > 5:
+            raise Exception(f"#UD: MOV to sreg {reg} at {self._where()}")
+        self.cpu.load_segment(reg, self._load(rm, addr, 16))
+
+    def _op_mov_imm(self, op):
+        bits = 8 if op < 0xB8 else self.opsize
+        val = self._imm(bits // 8)
+        self._retire()
+        self._set_reg(op & 7, bits, val)
+
+    def _op_push_r(self, op):
+        self._retire()
+        size = self.opsize // 8
+        self._push(self._reg(op & 7, self.opsize), size)
+
+    def _op_pop_r(self, op):
+        self._retire()
+        size = self.opsize // 8
+        self._set_reg(op & 7, self.opsize, self._pop(size))
+
+    def _op_push_sreg(self, op):
+        self._retire()
+        self._no_opsize32(op)
+        self._push(self.cpu.sreg[_PUSH_SREG[op]])
+
+    def _op_pop_sreg(self, op):
+        self._retire()
+        self._no_opsize32(op)
+        self.cpu.load_segment(_POP_SREG[op], self._pop())
+
+    def _op_jcc(self, op):
+        rel = self._rel(1)
+        self._retire()
+        if self._condition(op & 0xF):
+            self.cpu.EIP = (self.cpu.EIP + rel) & 0xFFFF
+
+    def _op_jmp(self, op):
+        rel = self._rel(1 if op == 0xEB else self.opsize // 8)
+        self._retire()
+        self.cpu.EIP = (self.cpu.EIP + rel) & 0xFFFF
+
+    def _op_loop(self, op):
+        rel = self._rel(1)
+        self._retire()
+        cpu = self.cpu
+        cx = (cpu.ECX - 1) & 0xFFFF
+        cpu.ECX = (cpu.ECX & 0xFFFF0000) | cx
+        if cx:
+            cpu.EIP = (cpu.EIP + rel) & 0xFFFF
+
+    def _op_call(self, op):
+        rel = self._rel(self.opsize // 8)
+        self._retire()
+        self._no_opsize32(op)
+        self._push(self.cpu.EIP)
+        self.cpu.EIP = (self.cpu.EIP + rel) & 0xFFFF
+
+    def _op_ret(self, op):
+        self._retire()
+        self._no_opsize32(op)
+        self.cpu.EIP = self._pop()
+
+    def _op_movs(self, op):
+        self._retire()
+        size = 1 if op == 0xA4 else 2
+        if size == 2:
+            self._no_opsize32(op)
+        if not self.rep:
+            raise Exception(f"Unimplemented opcode 0x{op:02X} without REP")
+        cpu = self.cpu
+        src = cpu.seg_base[SEG_DS if self.seg is None else self.seg]
+        dst = cpu.seg_base[SEG_ES]
+        mem = cpu.mem
+        while cpu.ECX & 0xFFFF:
+            si, di = cpu.ESI & 0xFFFF, cpu.EDI & 0xFFFF
+            if size == 1:
+                mem.write8(dst + di, mem.read8(src + si))
+            else:
+                mem.write16(dst + di, mem.read16(src + si))
+            self._step_string("ESI", size)
+            self._step_string("EDI", size)
+            cpu.ECX = (cpu.ECX & 0xFFFF0000) | ((cpu.ECX - 1) & 0xFFFF)
+
+    def _op_stosb(self, op):
+        self._retire()
+        cpu = self.cpu
+        count = cpu.ECX & 0xFFFF if self.rep else 1
+        for _ in range(count):
+            cpu.mem.write8(cpu.seg_base[SEG_ES] + (cpu.EDI & 0xFFFF), cpu.EAX & 0xFF)
+            self._step_string("EDI", 1)
+        if self.rep:
+            cpu.ECX &= 0xFFFF0000
+
+    def _op_lodsb(self, op):
+        self._retire()
+        if self.rep:
+            raise Exception("REP prefix used with unimplemented instruction 0x%02X" % op)
+        cpu = self.cpu
+        src = cpu.seg_base[SEG_DS if self.seg is None else self.seg]
+        self._set_reg(0, 8, cpu.mem.read8(src + (cpu.ESI & 0xFFFF)))
+        self._step_string("ESI", 1)
+
+    def _op_nop(self, op):
+        self._retire()
+
+    def _op_hlt(self, op):
+        self._retire()
+        self.cpu.halted = True
+
+    def _op_cli(self, op):
+        self._retire()
+        self.cpu.EFLAGS &= ~FLAG_IF
+
+    def _op_sti(self, op):
+        self._retire()
+        self.cpu.EFLAGS |= FLAG_IF
+
+
+def _signed(val, bits):
+    return val - (1 << bits) if val >> (bits - 1) else val
@@ -0,0 +1,275 @@
+# shared_state.py
+#
+# 게스트 메모리를 공유 메모리(Memory(shared_name=...))로 잡았을 때,
+# 다른 프로세스(렌더러, 모니터/검사 도구)와 주고받는 작은 제어 블록과 읽기 전용 접근.
+#
+# 제어 블록 "<name>_ctl" 레이아웃 (little endian):
+#   0   4s  magic "DXCB"
+#   4   u32 version
+#   8   u64 게스트 메모리 크기
+#   16  u64 프레임 시퀀스 번호 (에뮬레이터가 VGA 창이 바뀐 프레임마다 증가)
+#   24  u32 비디오 모드 (INT 10h AH=00 모드 번호)
+#   28  u32 에뮬레이터 pid
+#   32  u8[32] VGA 창(A0000h~BFFFFh) 4KB 페이지별 dirty 플래그
+#   64  u64 팔레트 버전 (DAC 항목이 바뀔 때마다 증가)
+#   72  u32[256] 팔레트 (VGADAC.packed 와 같은 ARGB8888)
+#
+# dirty 는 비트가 아니라 페이지당 1바이트라, 두 프로세스가 동시에 세우고/지워도
+# 다른 페이지의 플래그를 덮어쓰지 않는다.
+
+import mmap
+import os
+import struct
+from array import array
+from multiprocessing import shared_memory
+
+from memory import PAGE_SHIFT
+
+CONTROL_MAGIC = b"DXCB"
+CONTROL_VERSION = 2
+CONTROL_HEADER = struct.Struct("<4sIQQII")
+CONTROL_SEQ_OFFSET = 16
+CONTROL_MODE_OFFSET = 24
+CONTROL_DIRTY_OFFSET = 32
+CONTROL_PALETTE_SEQ_OFFSET = 64
+CONTROL_PALETTE_OFFSET = 72
+
+VGA_WINDOW_BASE = 0xA0000
+VGA_WINDOW_SIZE = 0x20000
+VGA_WINDOW_PAGES = VGA_WINDOW_SIZE >> PAGE_SHIFT
+CONTROL_SIZE = CONTROL_PALETTE_OFFSET + 256 * 4
+
+def control_name(name):
+    return f"{name}_ctl"
+
+def _attach_shared(name):
+    """
+    이미 있는 SharedMemory 에 붙는다. 붙기만 한 프로세스가 종료될 때 resource_tracker 가
+    세그먼트를 지워 버리지 않도록 추적에서 뺀다 (3.13 이상은 track=False).
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+def _map_readonly(name, offset, length):
+    """
+    공유 메모리 name 의 [offset, offset+length) 를 읽기 전용으로 매핑.
+    POSIX 에서는 /dev/shm 을 직접 열어 PROT_READ 로 매핑한다
+    (SharedMemory 로 붙으면 쓰기 가능한 매핑이 된다). 그 외 플랫폼은 SharedMemory 로 붙는다.
+    반환: (buffer, offset 보정값, 정리용 객체)
+    """
+    path = os.path.join("/dev/shm", name.lstrip("/"))
+    if os.path.exists(path):
+        aligned = offset & ~(mmap.ALLOCATIONGRANULARITY - 1)
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            m = mmap.mmap(fd, length + (offset - aligned), access=mmap.ACCESS_READ, offset=aligned)
+        finally:
+            os.close(fd)
+        return memoryview(m), offset - aligned, m
+    shm = _attach_shared(name)
+    return shm.buf, offset, shm
+
+
+class ControlBlock:
+    """
+    에뮬레이터 쪽(create)과 렌더러/도구 쪽(attach)이 같이 쓰는 제어 블록.
+    에뮬레이터는 watch(memory) 로 VGA 창 페이지에 쓰기 훅을 걸어 dirty 플래그를 세우고,
+    프레임 주기마다 publish_frame() 으로 바뀐 게 있을 때만 시퀀스 번호를 올린다.
+    """
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.buf = shm.buf
+        self.owner = owner
+        self.pending = False
+        self.memory = None
+        self.palette_source_version = None
+
+    @classmethod
+    def create(cls, name, memory_size, mode=0x13):
+        shm = shared_memory.SharedMemory(name=control_name(name), create=True, size=CONTROL_SIZE)
+        block = cls(shm, owner=True)
+        CONTROL_HEADER.pack_into(block.buf, 0, CONTROL_MAGIC, CONTROL_VERSION,
+                                 memory_size, 0, mode, os.getpid())
+        block.buf[CONTROL_DIRTY_OFFSET:CONTROL_SIZE] = bytes(CONTROL_SIZE - CONTROL_DIRTY_OFFSET)
+        return block
+
+    @classmethod
+    def attach(cls, name):
+        shm = _attach_shared(control_name(name))
+        block = cls(shm, owner=False)
+        magic, version = CONTROL_HEADER.unpack_from(block.buf, 0)[:2]
+        if magic != CONTROL_MAGIC or version != CONTROL_VERSION:
+            block.close()
+            raise Exception(f"Not an emulator control block: {control_name(name)}")
+        return block
+
+    def close(self):
+        if self.memory is not None:
+            for page in range(VGA_WINDOW_PAGES):
+                self.memory.remove_write_hook((VGA_WINDOW_BASE >> PAGE_SHIFT) + page,
+                                              self._on_vga_write)
+            self.memory = None
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    # ------------------------------------------------------------
+    # 필드
+    # ------------------------------------------------------------
+    @property
+    def memory_size(self):
+        return struct.unpack_from("<Q", self.buf, 8)[0]
+
+    @property
+    def frame_seq(self):
+        return struct.unpack_from("<Q", self.buf, CONTROL_SEQ_OFFSET)[0]
+
+    @property
+    def mode(self):
+        return struct.unpack_from("<I", self.buf, CONTROL_MODE_OFFSET)[0]
+
+    @mode.setter
+    def mode(self, value):
+        struct.pack_into("<I", self.buf, CONTROL_MODE_OFFSET, value)
+        self.pending = True
+
+    @property
+    def palette_seq(self):
+        return struct.unpack_from("<Q", self.buf, CONTROL_PALETTE_SEQ_OFFSET)[0]
+
+    def read_palette(self):
+        palette = array("I")
+        palette.frombytes(bytes(self.buf[CONTROL_PALETTE_OFFSET:CONTROL_SIZE]))
+        return palette
+
+    @property
+    def pid(self):
+        return struct.unpack_from("<I", self.buf, 28)[0]
+
+    # ------------------------------------------------------------
+    # 에뮬레이터 쪽
+    # ------------------------------------------------------------
+    def watch(self, memory):
+        """VGA 창 페이지 쓰기를 dirty 플래그로 기록한다."""
+        self.memory = memory
+        for page in range(VGA_WINDOW_PAGES):
+            memory.add_write_hook((VGA_WINDOW_BASE >> PAGE_SHIFT) + page, self._on_vga_write)
+
+    def _on_vga_write(self, addr, size, value):
+        buf = self.buf
+        first = max(addr, VGA_WINDOW_BASE)
+        last = min(addr + size, VGA_WINDOW_BASE + VGA_WINDOW_SIZE) - 1
+        for page in range((first - VGA_WINDOW_BASE) >> PAGE_SHIFT,
+                          ((last - VGA_WINDOW_BASE) >> PAGE_SHIFT) + 1):
+            buf[CONTROL_DIRTY_OFFSET + page] = 1
+        self.pending = True
+
+    def publish_palette(self, dac):
+        """DAC 팔레트가 바뀌었으면 packed 표를 복사하고 팔레트 버전을 올린다."""
+        if dac.version == self.palette_source_version:
+            return False
+        self.palette_source_version = dac.version
+        self.buf[CONTROL_PALETTE_OFFSET:CONTROL_SIZE] = dac.packed.tobytes()
+        struct.pack_into("<Q", self.buf, CONTROL_PALETTE_SEQ_OFFSET, self.palette_seq + 1)
+        self.pending = True
+        return True
+
+    def publish_frame(self):
+        """마지막 프레임 이후 VGA 창이 바뀌었으면 시퀀스 번호를 올린다. 올렸으면 True."""
+        if not self.pending:
+            return False
+        self.pending = False
+        struct.pack_into("<Q", self.buf, CONTROL_SEQ_OFFSET, self.frame_seq + 1)
+        return True
+
+    # ------------------------------------------------------------
+    # 렌더러 쪽
+    # ------------------------------------------------------------
+    def take_dirty(self):
+        """dirty 페이지 번호(VGA 창 기준) 목록을 가져오면서 플래그를 지운다."""
+        buf = self.buf
+        dirty = []
+        for page in range(VGA_WINDOW_PAGES):
+            if buf[CONTROL_DIRTY_OFFSET + page]:
+                buf[CONTROL_DIRTY_OFFSET + page] = 0
+                dirty.append(page)
+        return dirty
+
+
+class SharedPalette:
+    """
+    렌더러 쪽에서 제어 블록의 팔레트를 VGADAC 처럼 쓰게 해 주는 어댑터
+    (VideoDevice 가 보는 packed / version / take_changed()).
+    """
+
+    def __init__(self, control):
+        self.control = control
+        self.version = None
+        self.packed = array("I", [0xFF000000] * 256)
+        self.changed = set()
+
+    def refresh(self):
+        seq = self.control.palette_seq
+        if seq == self.version:
+            return
+        new = self.control.read_palette()
+        self.changed |= {i for i in range(256) if new[i] != self.packed[i]}
+        self.packed = new
+        self.version = seq
+
+    def take_changed(self):
+        changed = self.changed
+        self.changed = set()
+        return changed
+
+
+class GuestMemoryReader:
+    """
+    다른 프로세스에서 공유 게스트 메모리의 일부 창을 읽기 전용으로 매핑해
+    Memory 와 같은 read8/16/32, read_block 으로 읽는다. CPU 를 멈추지 않는다.
+    주소는 게스트 물리 주소 그대로 쓴다.
+    """
+
+    def __init__(self, name, base=0, length=None):
+        if length is None:
+            control = ControlBlock.attach(name)
+            length = control.memory_size - base
+            control.close()
+        self.base = base
+        self.size = base + length
+        self.buf, self._shift, self._handle = _map_readonly(name, base, length)
+        self._delta = self._shift - base
+
+    def close(self):
+        self.buf.release()
+        self.buf = None
+        self._handle.close()
+
+    def read8(self, addr: int) -> int:
+        if addr < self.base or addr >= self.size:
+            raise Exception(f"Shared memory read8 out of range: 0x{addr:08X}")
+        return self.buf[addr + self._delta]
+
+    def read16(self, addr: int) -> int:
+        return self.read8(addr) | (self.read8(addr + 1) << 8)
+
+    def read32(self, addr: int) -> int:
+        return self.read16(addr) | (self.read16(addr + 2) << 16)
+
+    def read_block(self, addr: int, length: int) -> bytes:
+        if addr < self.base or addr + length > self.size:
+            raise Exception(f"Shared memory read_block out of range: 0x{addr:08X}+{length}")
+        start = addr + self._delta
+        return bytes(self.buf[start:start + length])
+
+
+def attach_vga(name):
+    """렌더러용: VGA 창(A0000h~BFFFFh)만 읽기 전용으로 매핑."""
+    return GuestMemoryReader(name, VGA_WINDOW_BASE, VGA_WINDOW_SIZE)
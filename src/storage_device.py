@@ -55,6 +55,15 @@ class IDEHardDisk:
         self.status_reg = 0x40
         self.command_reg = 0
 
+        # 통계
+        self.sectors_read = 0
+        self.sectors_written = 0
+
+    def enable_metrics(self, latency):
+        """섹터 읽기/쓰기마다 걸린 호스트 시간(초)을 latency 히스토그램에 기록한다."""
+        self.read_sector = latency.time(self.read_sector)
+        self.write_sector = latency.time(self.write_sector)
+
     def lba_address(self):
         head = self.drive_head_reg & 0x0F
         cylinder = (self.cylinder_high_reg << 8) | self.cylinder_low_reg
@@ -63,12 +72,14 @@ class IDEHardDisk:
         return lba
 
     def read_sector(self, lba):
+        self.sectors_read += 1
         with open(self.disk_image_path, "rb") as f:
             f.seek(lba * self.bytes_per_sector)
             return f.read(self.bytes_per_sector)
 
     def write_sector(self, lba, data):
         assert len(data) == self.bytes_per_sector
+        self.sectors_written += 1
         with open(self.disk_image_path, "r+b") as f:
             f.seek(lba * self.bytes_per_sector)
             f.write(data)
@@ -141,3 +152,50 @@ class IDEHardDisk:
         elif port == 0x1F7:
             self.command_reg = value
             self.execute_command()
+
+    # ------------------------------------------------------------
+    # 넓은 포트 접근 (데이터 포트 0x1F0 은 실제로 16비트 PIO)
+    # ------------------------------------------------------------
+    def read_port16(self, port: int) -> int:
+        if port != 0x1F0:
+            return self.read_port(port) | (self.read_port(port + 1) << 8)
+        data = self.read_port_block(port, 2, 1)
+        return data[0] | (data[1] << 8)
+
+    def write_port16(self, port: int, value: int):
+        if port != 0x1F0:
+            self.write_port(port, value & 0xFF)
+            self.write_port(port + 1, (value >> 8) & 0xFF)
+            return
+        self.write_port_block(port, 2, (value & 0xFFFF).to_bytes(2, "little"))
+
+    def read_port_block(self, port: int, width: int, count: int) -> bytes:
+        """REP INSB/INSW: 버퍼에서 한 번에 잘라 준다. 버퍼가 비면 0으로 채움."""
+        if port != 0x1F0:
+            return b"".join(self.read_port(port).to_bytes(width, "little") for _ in range(count))
+        length = width * count
+        start = self.buffer_index
+        end = min(start + length, len(self.data_buffer))
+        data = bytes(self.data_buffer[start:end])
+        if end > start:
+            self.buffer_index = end
+            if self.buffer_index >= len(self.data_buffer):
+                self.status_reg = 0x40
+        return data + bytes(length - len(data))
+
+    def write_port_block(self, port: int, width: int, data):
+        """REP OUTSB/OUTSW: 버퍼에 한 번에 복사하고, 가득 차면 섹터를 기록."""
+        if port != 0x1F0:
+            for i in range(0, len(data), width):
+                self.write_port(port, data[i])
+            return
+        start = self.buffer_index
+        end = min(start + len(data), len(self.data_buffer))
+        if end <= start:
+            return
+        self.data_buffer[start:end] = data[:end - start]
+        self.buffer_index = end
+        if self.buffer_index >= len(self.data_buffer):
+            lba = self.lba_address()
+            self.write_sector(lba, self.data_buffer)
+            self.status_reg = 0x40
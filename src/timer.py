@@ -6,6 +6,7 @@ class TimerDevice:
     """
     간단한 타이머 구현.
     실제 하드웨어 8253 PIT처럼 일정 주기로 IRQ0을 발생시킨다.
+    start() 는 별도 스레드로, attach(loop) 는 이벤트 루프의 주기 타이머로 동작한다.
     """
 
     def __init__(self, interrupt_controller, frequency_hz=1000):
@@ -17,6 +18,8 @@ class TimerDevice:
         self.frequency = frequency_hz
         self.running = False
         self._thread = None
+        self.loop = None
+        self._loop_timer = None
 
     def _run(self):
         interval = 1.0 / self.frequency
@@ -25,6 +28,24 @@ class TimerDevice:
             # IRQ0 발생 요청
             self.ic.request_irq(0)  # IRQ0 = 타이머 인터럽트
 
+    def _tick(self):
+        self.ic.request_irq(0)
+
+    def attach(self, loop):
+        """스레드 대신 이벤트 루프 타이머로 IRQ0 을 발생시킨다."""
+        self.loop = loop
+        self.resume()
+
+    def pause(self):
+        """게스트가 멈춰 있는 동안 루프를 깨우지 않도록 틱을 멈춘다."""
+        if self._loop_timer is not None:
+            self._loop_timer.cancel()
+            self._loop_timer = None
+
+    def resume(self):
+        if self.loop is not None and self._loop_timer is None:
+            self._loop_timer = self.loop.call_every(1.0 / self.frequency, self._tick)
+
     def start(self):
         if not self.running:
             self.running = True
@@ -32,6 +53,7 @@ class TimerDevice:
             self._thread.start()
 
     def stop(self):
+        self.pause()
         self.running = False
         if self._thread:
             self._thread.join()
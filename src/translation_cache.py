@@ -0,0 +1,217 @@
+# translation_cache.py
+#
+# 디코딩한 명령어와 컴파일한 블록을 디스크에 남겨 두었다가 다음 프로세스(웜 스타트)에서 다시 쓴다.
+# 파일은 코드 페이지(4KB) 내용의 해시와 CPU 모드(CR0.PE)로 찾으므로, 같은 이미지를 다시 부팅하면
+# 부트 섹터/로더 경로를 디코딩/컴파일하지 않고 바로 쓴다.
+#  - 페이지 파일은 그 페이지에서 처음 디코드 캐시 미스가 날 때 읽는다.
+#  - 해시를 낸 뒤 그 페이지에 쓰기가 일어나면 페이지 상태를 버리고, 다음 미스 때 새 내용으로 다시 찾는다.
+#  - 블록은 걸쳐 있는 모든 페이지의 해시가 지금 내용과 같을 때만 쓴다.
+#  - 한 실행에서 여러 번 다시 쓰이는 페이지는 그 뒤로 캐시하지 않는다 (VOLATILE_REWRITES).
+#  - 파일은 marshal 형식(블록은 코드 객체째)이다. 파이썬 버전이나 디코더/컴파일러/CPU 소스가 바뀌면
+#    파일 머리의 지문이 달라져 무시한다. 블록 코드를 그대로 실행하므로 캐시 디렉터리는
+#    신뢰할 수 있는 곳이어야 한다.
+# 페이징이 켜져 있으면(선형 != 물리) 쓰지 않는다.
+
+import hashlib
+import marshal
+import os
+import sys
+
+import block_compiler
+import cpu
+import decoder
+from decoder import instr_record, instr_from_record
+from memory import PAGE_SHIFT, PAGE_SIZE
+
+CACHE_MAGIC = b"XTC1"
+PAGE_MASK = PAGE_SIZE - 1
+# 한 실행에서 해시를 낸 뒤 이만큼 다시 쓰인 페이지(코드와 데이터가 섞인 페이지, 자기 수정 코드)는
+# 내용이 바뀔 때마다 새 파일이 생기지 않도록 더는 캐시하지 않는다
+VOLATILE_REWRITES = 4
+
+
+def _fingerprint():
+    """캐시 내용을 만든 코드의 지문: 파이썬 버전 + 디코더/컴파일러/CPU 소스"""
+    h = hashlib.blake2b(sys.version.encode(), digest_size=16)
+    for module in (decoder, block_compiler, cpu):
+        with open(module.__file__, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+class _PageEntry:
+    """한 페이지 내용(해시+모드 = name)에 대한 캐시: 페이지 내 오프셋 -> 명령어, (base, ip) -> 블록"""
+
+    __slots__ = ("name", "instrs", "blocks")
+
+    def __init__(self, name, instrs=None, blocks=None):
+        self.name = name
+        self.instrs = {} if instrs is None else instrs
+        self.blocks = {} if blocks is None else blocks
+
+
+class TranslationCache:
+    """
+    directory 아래에 '<페이지 해시>-<모드>.tc' 파일로 저장한다. mem 은 물리 메모리,
+    mode() 는 지금 CPU 모드 번호. save() 를 불러야 새로 만든 항목이 파일로 남는다.
+    통계: files_loaded, rejected(버전/형식이 맞지 않아 버린 파일), instr_hits, instr_stores,
+    block_hits, block_stores, files_written.
+    """
+
+    def __init__(self, directory, mem, mode=None):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.mem = mem
+        self.mode = mode or (lambda: 0)
+        self.fingerprint = _fingerprint()
+        self.pages = {}      # 물리 page -> _PageEntry (해시를 낸 뒤 쓰기가 없었던 페이지)
+        self.rewrites = {}   # 물리 page -> 해시를 낸 뒤 쓰기로 버린 횟수
+        self.loaded = {}     # name -> _PageEntry (이번 실행에서 읽거나 만든 것)
+        self.dirty = set()   # 저장할 name
+        self.files_loaded = 0
+        self.rejected = 0
+        self.instr_hits = 0
+        self.instr_stores = 0
+        self.block_hits = 0
+        self.block_stores = 0
+        self.files_written = 0
+
+    # ------------------------------------------------------------
+    # 페이지
+    # ------------------------------------------------------------
+    def _page(self, page):
+        """페이지의 _PageEntry. 자주 다시 쓰이는 페이지면 None."""
+        entry = self.pages.get(page)
+        if entry is None:
+            if self.rewrites.get(page, 0) >= VOLATILE_REWRITES:
+                return None
+            data = self.mem.read_block(page << PAGE_SHIFT, PAGE_SIZE)
+            name = f"{hashlib.blake2b(data, digest_size=16).hexdigest()}-{self.mode()}"
+            entry = self.loaded.get(name)
+            if entry is None:
+                entry = self.loaded[name] = self._load(name)
+            self.pages[page] = entry
+            self.mem.add_write_hook(page, self._on_write)
+        return entry
+
+    def _on_write(self, addr, size, value):
+        # 가운데 페이지까지 잊는다 (_forget 은 해시를 낸 페이지만 센다)
+        first = addr >> PAGE_SHIFT
+        last = (addr + size - 1) >> PAGE_SHIFT
+        for page in range(first, last + 1):
+            self._forget(page)
+
+    def _forget(self, page, rewritten=True):
+        if self.pages.pop(page, None) is not None:
+            self.mem.remove_write_hook(page, self._on_write)
+            if rewritten:
+                self.rewrites[page] = self.rewrites.get(page, 0) + 1
+
+    def flush(self):
+        """모드가 바뀌었거나 메모리 뷰가 바뀌었다: 해시를 낸 페이지를 모두 잊는다 (저장할 내용은 남는다)."""
+        for page in list(self.pages):
+            self._forget(page, rewritten=False)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name + ".tc")
+
+    def _load(self, name):
+        try:
+            with open(self._path(name), "rb") as f:
+                data = marshal.load(f)
+        except FileNotFoundError:
+            return _PageEntry(name)
+        except (OSError, EOFError, ValueError, TypeError):
+            self.rejected += 1
+            return _PageEntry(name)
+        if (not isinstance(data, tuple) or len(data) != 4 or data[0] != CACHE_MAGIC
+                or data[1] != self.fingerprint):
+            self.rejected += 1
+            return _PageEntry(name)
+        self.files_loaded += 1
+        return _PageEntry(name, data[2], data[3])
+
+    # ------------------------------------------------------------
+    # 명령어
+    # ------------------------------------------------------------
+    def lookup_instr(self, addr, ip, ip_mask):
+        entry = self._page(addr >> PAGE_SHIFT)
+        if entry is None:
+            return None
+        record = entry.instrs.get(addr & PAGE_MASK)
+        if record is None or ip + record[1] > ip_mask + 1:
+            return None
+        self.instr_hits += 1
+        return instr_from_record(addr, record)
+
+    def store_instr(self, ins, ip, ip_mask):
+        """페이지 안에 다 들어 있고 IP 랩어라운드가 없는 명령어만 남긴다."""
+        addr = ins.addr
+        if (addr & PAGE_MASK) + ins.length > PAGE_SIZE or ip + ins.length > ip_mask + 1:
+            return
+        entry = self._page(addr >> PAGE_SHIFT)
+        if entry is None:
+            return
+        entry.instrs[addr & PAGE_MASK] = instr_record(ins)
+        self.dirty.add(entry.name)
+        self.instr_stores += 1
+
+    # ------------------------------------------------------------
+    # 블록
+    # ------------------------------------------------------------
+    def _names(self, pages):
+        entries = [self._page(page) for page in pages]
+        if None in entries:
+            return None
+        return tuple(entry.name for entry in entries)
+
+    def has_block(self, base, ip):
+        entry = self._page((base + ip) >> PAGE_SHIFT)
+        return entry is not None and (base, ip) in entry.blocks
+
+    def lookup_block(self, base, ip, pages):
+        """(count, source, code) 또는 None. 블록이 걸친 페이지가 하나라도 바뀌었으면 None."""
+        entry = self._page(pages[0])
+        record = None if entry is None else entry.blocks.get((base, ip))
+        if record is None:
+            return None
+        count, names, source, code = record
+        if names != self._names(pages):
+            return None
+        self.block_hits += 1
+        return count, source, marshal.loads(code)
+
+    def store_block(self, base, ip, pages, count, source, code):
+        entry = self._page(pages[0])
+        names = self._names(pages)
+        if names is None:
+            return
+        entry.blocks[(base, ip)] = (count, names, source, marshal.dumps(code))
+        self.dirty.add(entry.name)
+        self.block_stores += 1
+
+    # ------------------------------------------------------------
+    # 저장
+    # ------------------------------------------------------------
+    def save(self):
+        """바뀐 페이지 파일을 쓴다. 여러 프로세스가 함께 써도 반쯤 쓴 파일이 보이지 않게 rename 한다."""
+        for name in sorted(self.dirty):
+            entry = self.loaded[name]
+            path = self._path(name)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                marshal.dump((CACHE_MAGIC, self.fingerprint, entry.instrs, entry.blocks), f)
+            os.replace(tmp, path)
+            self.files_written += 1
+        self.dirty.clear()
+
+    def stats(self):
+        return {
+            "files_loaded": self.files_loaded,
+            "rejected": self.rejected,
+            "instr_hits": self.instr_hits,
+            "instr_stores": self.instr_stores,
+            "block_hits": self.block_hits,
+            "block_stores": self.block_stores,
+            "files_written": self.files_written,
+        }
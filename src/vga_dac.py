@@ -0,0 +1,145 @@
+# vga_dac.py
+
+from array import array
+
+DAC_PEL_MASK = 0x3C6
+DAC_READ_INDEX = 0x3C7     # 쓰기: 읽기 인덱스, 읽기: DAC 상태
+DAC_WRITE_INDEX = 0x3C8
+DAC_DATA = 0x3C9
+
+# EGA 기본 16색 (6비트)
+_EGA_COLORS = (
+    (0, 0, 0), (0, 0, 42), (0, 42, 0), (0, 42, 42), (42, 0, 0), (42, 0, 42), (42, 21, 0), (42, 42, 42),
+    (21, 21, 21), (21, 21, 63), (21, 63, 21), (21, 63, 63), (63, 21, 21), (63, 21, 63), (63, 63, 21), (63, 63, 63),
+)
+
+# 텍스트 모드 16색 (8비트, 속성 바이트의 색 번호)
+TEXT_COLORS = (
+    (0x00, 0x00, 0x00), (0x00, 0x00, 0xAA), (0x00, 0xAA, 0x00), (0x00, 0xAA, 0xAA),
+    (0xAA, 0x00, 0x00), (0xAA, 0x00, 0xAA), (0xAA, 0x55, 0x00), (0xAA, 0xAA, 0xAA),
+    (0x55, 0x55, 0x55), (0x55, 0x55, 0xFF), (0x55, 0xFF, 0x55), (0x55, 0xFF, 0xFF),
+    (0xFF, 0x55, 0x55), (0xFF, 0x55, 0xFF), (0xFF, 0xFF, 0x55), (0xFF, 0xFF, 0xFF),
+)
+
+_GRAY_RAMP = (0, 5, 8, 11, 14, 17, 20, 24, 28, 32, 36, 40, 45, 50, 56, 63)
+
+def _hue_wheel(hi, lo):
+    """파랑 -> 자홍 -> 빨강 -> 노랑 -> 초록 -> 청록 -> 파랑 순서의 24색."""
+    v = [lo + (hi - lo) * k // 4 for k in range(5)]
+    out = [(v[k], lo, hi) for k in range(5)]
+    out += [(hi, lo, v[k]) for k in (3, 2, 1)]
+    out += [(hi, v[k], lo) for k in range(5)]
+    out += [(v[k], hi, lo) for k in (3, 2, 1)]
+    out += [(lo, hi, v[k]) for k in range(5)]
+    out += [(lo, v[k], hi) for k in (3, 2, 1)]
+    return out
+
+def default_palette():
+    """VGA 모드 13h 기본 팔레트 (256 x (r, g, b), 6비트)"""
+    colors = list(_EGA_COLORS)
+    colors += [(g, g, g) for g in _GRAY_RAMP]
+    for hi, lows in ((63, (0, 31, 45)), (28, (0, 14, 20)), (16, (0, 8, 11))):
+        for lo in lows:
+            colors += _hue_wheel(hi, lo)
+    colors += [(0, 0, 0)] * (256 - len(colors))
+    return colors
+
+def pack_argb(r6, g6, b6):
+    """6비트 DAC 값 -> SDL_PIXELFORMAT_ARGB8888 의 uint32 (0xAARRGGBB)"""
+    r = (r6 << 2) | (r6 >> 4)
+    g = (g6 << 2) | (g6 >> 4)
+    b = (b6 << 2) | (b6 >> 4)
+    return 0xFF000000 | (r << 16) | (g << 8) | b
+
+
+class VGADAC:
+    """
+    VGA DAC (팔레트) 레지스터: 포트 3C6h~3C9h.
+    dac 는 256 x (r, g, b) 6비트 값, packed 는 텍스처 픽셀 형식(ARGB8888)으로 미리 변환한
+    256개 uint32 표라 화면 변환은 packed[색 번호] 조회 한 번으로 끝난다.
+    항목 값이 실제로 바뀔 때만 packed 를 고치고 version 을 올리며, 바뀐 번호를 모아 둔다.
+    """
+
+    def __init__(self):
+        self.dac = bytearray(768)
+        self.packed = array("I", [0xFF000000] * 256)
+        self.version = 0
+        self.changed = set()       # 마지막 take_changed() 이후 바뀐 색 번호
+        self.pel_mask = 0xFF
+        self.write_index = 0
+        self.read_index = 0
+        self.write_component = 0
+        self.read_component = 0
+        self.pending = [0, 0, 0]   # 쓰기 중인 r, g, b (세 번째 값이 들어오면 반영)
+        self.reading = False       # 마지막으로 인덱스를 쓴 게 3C7h 이면 True
+        self.load_palette(default_palette())
+
+    def load_palette(self, colors, first=0):
+        """(r, g, b) 6비트 값 목록을 first 번부터 설정"""
+        for i, (r, g, b) in enumerate(colors):
+            self.set_entry((first + i) & 0xFF, r, g, b)
+
+    def set_entry(self, index, r, g, b):
+        r &= 0x3F
+        g &= 0x3F
+        b &= 0x3F
+        base = index * 3
+        dac = self.dac
+        if dac[base] == r and dac[base + 1] == g and dac[base + 2] == b:
+            return
+        dac[base] = r
+        dac[base + 1] = g
+        dac[base + 2] = b
+        self.packed[index] = pack_argb(r, g, b)
+        self.changed.add(index)
+        self.version += 1
+
+    def take_changed(self):
+        changed = self.changed
+        self.changed = set()
+        return changed
+
+    # ------------------------------------------------------------
+    # I/O 포트
+    # ------------------------------------------------------------
+    def read_port(self, port: int) -> int:
+        if port == DAC_PEL_MASK:
+            return self.pel_mask
+        if port == DAC_READ_INDEX:
+            return 0x03 if self.reading else 0x00
+        if port == DAC_WRITE_INDEX:
+            return self.write_index
+        if port == DAC_DATA:
+            value = self.dac[self.read_index * 3 + self.read_component]
+            self.read_component += 1
+            if self.read_component == 3:
+                self.read_component = 0
+                self.read_index = (self.read_index + 1) & 0xFF
+            return value
+        return 0xFF
+
+    def write_port(self, port: int, value: int):
+        value &= 0xFF
+        if port == DAC_PEL_MASK:
+            self.pel_mask = value
+        elif port == DAC_READ_INDEX:
+            self.read_index = value
+            self.read_component = 0
+            self.reading = True
+        elif port == DAC_WRITE_INDEX:
+            self.write_index = value
+            self.write_component = 0
+            self.reading = False
+        elif port == DAC_DATA:
+            self.pending[self.write_component] = value
+            self.write_component += 1
+            if self.write_component == 3:
+                self.write_component = 0
+                self.set_entry(self.write_index, *self.pending)
+                self.write_index = (self.write_index + 1) & 0xFF
+
+    def write_port_block(self, port: int, width: int, data):
+        """REP OUTSB 로 팔레트 전체를 올리는 경우를 한 번에 처리 (넓은 접근은 바이트마다 다음 포트로)."""
+        write = self.write_port
+        for i, b in enumerate(data):
+            write(port + i % width, b)
@@ -0,0 +1,150 @@
+# vga_font.py
+#
+# 텍스트 모드용 8x16 글꼴. 256 글자 x 16줄, 줄마다 1바이트(MSB 가 왼쪽 픽셀).
+# 1) 지정한 파일 (PSF1/PSF2, .gz 가능, 또는 raw 8xN 덤프)
+# 2) 리눅스 콘솔 글꼴 디렉터리의 CP437 8x16 글꼴
+# 3) 내장 글꼴: 인쇄 가능한 ASCII(5x7 을 세로 2배) + 블록/선 그리기 문자
+
+import gzip
+import os
+
+GLYPH_WIDTH = 8
+GLYPH_HEIGHT = 16
+
+PSF1_MAGIC = b"\x36\x04"
+PSF2_MAGIC = b"\x72\xb5\x4a\x86"
+
+SYSTEM_FONT_PATHS = (
+    "/usr/share/kbd/consolefonts/default8x16.psfu.gz",
+    "/usr/share/kbd/consolefonts/default8x16.psf.gz",
+    "/usr/share/consolefonts/default8x16.psf.gz",
+    "/usr/share/consolefonts/Lat15-VGA16.psf.gz",
+    "/usr/lib/kbd/consolefonts/default8x16.psfu.gz",
+)
+
+# 0x20~0x7E, 글자당 7줄 x 5비트 (비트 4 가 왼쪽)
+_ASCII_5X7 = """
+00 00 00 00 00 00 00|04 04 04 04 00 00 04|0A 0A 0A 00 00 00 00|0A 0A 1F 0A 1F 0A 0A
+04 0F 14 0E 05 1E 04|18 19 02 04 08 13 03|0C 12 14 08 15 12 0D|0C 04 08 00 00 00 00
+02 04 08 08 08 04 02|08 04 02 02 02 04 08|00 04 15 0E 15 04 00|00 04 04 1F 04 04 00
+00 00 00 00 0C 04 08|00 00 00 1F 00 00 00|00 00 00 00 00 0C 0C|00 01 02 04 08 10 00
+0E 11 13 15 19 11 0E|04 0C 04 04 04 04 0E|0E 11 01 02 04 08 1F|1F 02 04 02 01 11 0E
+02 06 0A 12 1F 02 02|1F 10 1E 01 01 11 0E|06 08 10 1E 11 11 0E|1F 01 02 04 08 08 08
+0E 11 11 0E 11 11 0E|0E 11 11 0F 01 02 0C|00 0C 0C 00 0C 0C 00|00 0C 0C 00 0C 04 08
+02 04 08 10 08 04 02|00 00 1F 00 1F 00 00|08 04 02 01 02 04 08|0E 11 01 02 04 00 04
+0E 11 01 0D 15 15 0E|0E 11 11 11 1F 11 11|1E 11 11 1E 11 11 1E|0E 11 10 10 10 11 0E
+1C 12 11 11 11 12 1C|1F 10 10 1E 10 10 1F|1F 10 10 1E 10 10 10|0E 11 10 17 11 11 0F
+11 11 11 1F 11 11 11|0E 04 04 04 04 04 0E|07 02 02 02 02 12 0C|11 12 14 18 14 12 11
+10 10 10 10 10 10 1F|11 1B 15 15 11 11 11|11 11 19 15 13 11 11|0E 11 11 11 11 11 0E
+1E 11 11 1E 10 10 10|0E 11 11 11 15 12 0D|1E 11 11 1E 14 12 11|0F 10 10 0E 01 01 1E
+1F 04 04 04 04 04 04|11 11 11 11 11 11 0E|11 11 11 11 11 0A 04|11 11 11 15 15 15 0A
+11 11 0A 04 0A 11 11|11 11 11 0A 04 04 04|1F 01 02 04 08 10 1F|0E 08 08 08 08 08 0E
+00 10 08 04 02 01 00|0E 02 02 02 02 02 0E|04 0A 11 00 00 00 00|00 00 00 00 00 00 1F
+08 04 02 00 00 00 00|00 00 0E 01 0F 11 0F|10 10 16 19 11 11 1E|00 00 0E 10 10 11 0E
+01 01 0D 13 11 11 0F|00 00 0E 11 1F 10 0E|06 09 08 1C 08 08 08|00 0F 11 11 0F 01 0E
+10 10 16 19 11 11 11|04 00 0C 04 04 04 0E|02 00 06 02 02 12 0C|10 10 12 14 18 14 12
+0C 04 04 04 04 04 0E|00 00 1A 15 15 11 11|00 00 16 19 11 11 11|00 00 0E 11 11 11 0E
+00 00 1E 11 1E 10 10|00 00 0D 13 0F 01 01|00 00 16 19 10 10 10|00 00 0E 10 0E 01 1E
+08 08 1C 08 08 09 06|00 00 11 11 11 13 0D|00 00 11 11 11 0A 04|00 00 11 11 15 15 0A
+00 00 11 0A 04 0A 11|00 00 11 11 0F 01 0E|00 00 1F 02 04 08 1F|02 04 04 08 04 04 02
+04 04 04 04 04 04 04|08 04 04 02 04 04 08|00 00 08 15 02 00 00
+"""
+
+# CP437 선 그리기 문자: 코드 -> (위, 아래, 왼쪽, 오른쪽) 선 굵기 (0=없음, 1=단선, 2=이중선)
+_BOX_LINES = {
+    0xB3: (1, 1, 0, 0), 0xB4: (1, 1, 1, 0), 0xBA: (2, 2, 0, 0), 0xBB: (0, 2, 2, 0),
+    0xBC: (2, 0, 2, 0), 0xBF: (0, 1, 1, 0), 0xC0: (1, 0, 0, 1), 0xC1: (1, 0, 1, 1),
+    0xC2: (0, 1, 1, 1), 0xC3: (1, 1, 0, 1), 0xC4: (0, 0, 1, 1), 0xC5: (1, 1, 1, 1),
+    0xC8: (2, 0, 0, 2), 0xC9: (0, 2, 0, 2), 0xCA: (2, 0, 2, 2), 0xCB: (0, 2, 2, 2),
+    0xCC: (2, 2, 0, 2), 0xCD: (0, 0, 2, 2), 0xCE: (2, 2, 2, 2), 0xB9: (2, 2, 2, 0),
+    0xD9: (1, 0, 1, 0), 0xDA: (0, 1, 0, 1),
+}
+
+def _box_glyph(up, down, left, right):
+    rows = [0] * GLYPH_HEIGHT
+    mid = GLYPH_HEIGHT // 2 - 1
+    # 세로선: 단선은 3번 열, 이중선은 2/5번 열
+    vcols = {1: 0x10, 2: 0x24}
+    for weight, first, last in ((up, 0, mid), (down, mid, GLYPH_HEIGHT - 1)):
+        if weight:
+            for y in range(first, last + 1):
+                rows[y] |= vcols[weight]
+    hrows = {1: (mid,), 2: (mid - 1, mid + 1)}
+    for weight, mask in ((left, 0xF0), (right, 0x0F)):
+        if weight:
+            for y in hrows[weight]:
+                rows[y] |= mask
+    return rows
+
+def builtin_font():
+    """내장 8x16 글꼴 (256*16 바이트)"""
+    font = bytearray(256 * GLYPH_HEIGHT)
+    glyphs = _ASCII_5X7.replace("\n", "|").strip("|").split("|")
+    for i, glyph in enumerate(glyphs):
+        rows = [int(v, 16) for v in glyph.split()]
+        base = (0x20 + i) * GLYPH_HEIGHT
+        for y, bits in enumerate(rows):
+            # 5비트를 8픽셀 칸의 1~5열에, 각 줄을 두 번 (1~14줄)
+            font[base + 1 + y * 2] = font[base + 2 + y * 2] = bits << 2
+    for code, lines in _BOX_LINES.items():
+        font[code * GLYPH_HEIGHT:(code + 1) * GLYPH_HEIGHT] = bytes(_box_glyph(*lines))
+    half = GLYPH_HEIGHT // 2
+    blocks = {
+        0xDB: [0xFF] * GLYPH_HEIGHT,                # 전체 블록
+        0xDC: [0x00] * half + [0xFF] * half,        # 아래 절반
+        0xDF: [0xFF] * half + [0x00] * half,        # 위 절반
+        0xDD: [0xF0] * GLYPH_HEIGHT,                # 왼쪽 절반
+        0xDE: [0x0F] * GLYPH_HEIGHT,                # 오른쪽 절반
+        0xB0: [0x88, 0x22] * half,                  # 옅은 음영
+        0xB1: [0xAA, 0x55] * half,                  # 중간 음영
+        0xB2: [0xEE, 0xBB] * half,                  # 짙은 음영
+        0xFE: [0] * 5 + [0x7C] * 6 + [0] * 5,       # 작은 사각형
+    }
+    for code, rows in blocks.items():
+        font[code * GLYPH_HEIGHT:(code + 1) * GLYPH_HEIGHT] = bytes(rows)
+    return bytes(font)
+
+def _scale_rows(data, count, height):
+    """height 줄 글꼴을 16줄로 (8x8 은 두 배, 8x14 는 위아래 한 줄씩 여백)."""
+    out = bytearray(256 * GLYPH_HEIGHT)
+    for ch in range(min(count, 256)):
+        glyph = data[ch * height:(ch + 1) * height]
+        if height * 2 == GLYPH_HEIGHT:
+            rows = bytes(b for b in glyph for _ in (0, 1))
+        else:
+            pad = (GLYPH_HEIGHT - height) // 2
+            rows = bytes(pad) + glyph[:GLYPH_HEIGHT] + bytes(GLYPH_HEIGHT)
+        out[ch * GLYPH_HEIGHT:(ch + 1) * GLYPH_HEIGHT] = rows[:GLYPH_HEIGHT]
+    return bytes(out)
+
+def parse_font(data):
+    """PSF1/PSF2 또는 raw(256 x 8/14/16 줄) 글꼴 -> 256*16 바이트"""
+    if data[:2] == PSF1_MAGIC:
+        height = data[3]
+        count = 512 if data[2] & 1 else 256
+        return _scale_rows(data[4:4 + count * height], count, height)
+    if data[:4] == PSF2_MAGIC:
+        header_size = int.from_bytes(data[8:12], "little")
+        count = int.from_bytes(data[16:20], "little")
+        charsize = int.from_bytes(data[20:24], "little")
+        height = int.from_bytes(data[24:28], "little")
+        width = int.from_bytes(data[28:32], "little")
+        if width != GLYPH_WIDTH or charsize != height:
+            raise Exception(f"Unsupported PSF2 font: {width}x{height}")
+        return _scale_rows(data[header_size:header_size + count * height], count, height)
+    if len(data) % 256 == 0 and len(data) // 256 in (8, 14, 16):
+        return _scale_rows(data, 256, len(data) // 256)
+    raise Exception("Unknown font format")
+
+def load_font(path=None):
+    """path(없으면 시스템 콘솔 글꼴, 그것도 없으면 내장 글꼴)에서 8x16 글꼴을 읽는다."""
+    candidates = (path,) if path else SYSTEM_FONT_PATHS
+    for candidate in candidates:
+        if not candidate or not os.path.exists(candidate):
+            continue
+        opener = gzip.open if candidate.endswith(".gz") else open
+        with opener(candidate, "rb") as f:
+            return parse_font(f.read())
+    if path:
+        raise Exception(f"Font not found: {path}")
+    return builtin_font()
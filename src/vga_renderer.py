@@ -0,0 +1,63 @@
+# vga_renderer.py
+#
+# 별도 프로세스 VGA 렌더러: 에뮬레이터(main.py --shared NAME)의 공유 게스트 메모리에서
+# VGA 창만 읽기 전용으로 매핑하고, 제어 블록의 프레임 시퀀스 번호가 바뀔 때만 다시 그린다.
+# 화면 변환이 CPU 실행과 다른 인터프리터(다른 코어)에서 돌아 GIL 을 다투지 않는다.
+#
+#   python vga_renderer.py NAME [--fps 60]
+
+import argparse
+import os
+import sys
+import time
+
+import sdl2.ext
+
+from shared_state import ControlBlock, GuestMemoryReader, SharedPalette, attach_vga
+from video_device import VideoDevice
+
+def _emulator_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DOS x86 Emulator - VGA renderer process")
+    parser.add_argument("name", help="에뮬레이터의 공유 메모리 이름 (--shared)")
+    parser.add_argument("--fps", type=float, default=60.0)
+    args = parser.parse_args(argv)
+
+    control = ControlBlock.attach(args.name)
+    vga = attach_vga(args.name)
+    # 비디오 모드/커서는 BIOS 데이터 영역(0040:0000)에서 읽는다
+    bda = GuestMemoryReader(args.name, 0x400, 0x100)
+    palette = SharedPalette(control)
+    video = VideoDevice(vga, bios_data=bda, palette=palette)
+    interval = 1.0 / args.fps
+    last_seq = None
+    try:
+        while not video.quit_requested:
+            palette.refresh()
+            seq = control.frame_seq
+            changed = seq != last_seq
+            if changed:
+                last_seq = seq
+                control.take_dirty()
+            # 바뀐 프레임이 없어도 커서 깜박임은 갱신한다
+            video.update_frame(memory_changed=changed)
+            if not _emulator_alive(control.pid):
+                break
+            time.sleep(interval)
+    finally:
+        vga.close()
+        bda.close()
+        control.close()
+        sdl2.ext.quit()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
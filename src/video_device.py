@@ -1,76 +1,255 @@
 # video_device.py
 
+import ctypes
+import time
+from array import array
+
 import sdl2
 import sdl2.ext
-import ctypes
+
+from bios import (BDA_VIDEO_MODE, BDA_CURSOR_POS, BDA_CURSOR_SHAPE,
+                  TEXT_BASE, TEXT_COLUMNS, TEXT_ROWS, GRAPHICS_BASE)
+from vga_dac import TEXT_COLORS, VGADAC
+from vga_font import GLYPH_WIDTH, GLYPH_HEIGHT, load_font
+
+# VGA 커서는 16프레임마다 토글 (약 1.875Hz 주기)
+CURSOR_BLINK_HZ = 1.875
+
+TEXT_WIDTH = TEXT_COLUMNS * GLYPH_WIDTH     # 640
+TEXT_HEIGHT = TEXT_ROWS * GLYPH_HEIGHT      # 400
+TEXT_BYTES = TEXT_COLUMNS * TEXT_ROWS * 2
+
+def build_atlas_pixels(font):
+    """
+    256 글자 x 16 전경색 글리프 아틀라스 (RGBA32, 가로 256*8, 세로 16*16).
+    글자 ch, 전경색 fg 는 (ch*8, fg*16) 에 있고, 켜진 픽셀은 불투명 전경색, 나머지는 투명.
+    """
+    clear = b"\0\0\0\0"
+    out = bytearray()
+    for r, g, b in TEXT_COLORS:
+        on = bytes((r, g, b, 0xFF))
+        # 줄 비트 패턴(0~255) -> 8픽셀
+        patterns = [b"".join(on if bits & (0x80 >> x) else clear for x in range(GLYPH_WIDTH))
+                    for bits in range(256)]
+        for y in range(GLYPH_HEIGHT):
+            out += b"".join(patterns[font[ch * GLYPH_HEIGHT + y]] for ch in range(256))
+    return bytes(out)
+
 
 class VideoDevice:
     """
     VGA 호환 디바이스.
-    320x200x8bpp.
+    - 모드 03h: 80x25 텍스트 (B8000h). 미리 그려 둔 글리프 아틀라스 텍스처에서 글자를 복사해
+      렌더 타깃 텍스처에 그리고, 지난 프레임과 글자/속성 워드가 다른 칸만 다시 그린다.
+      커서는 화면에 올릴 때 덧그리므로 깜박임에는 칸을 다시 그리지 않는다.
+    - 모드 13h: 320x200x8bpp (A0000h). palette(VGADAC 또는 같은 인터페이스)의 packed 표가
+      이미 텍스처 픽셀 형식이라 픽셀마다 표 조회 한 번으로 변환한다. 팔레트가 바뀌면
+      마지막 프레임에 쓰인 색이 바뀐 경우에만 전체를 다시 변환한다.
+    현재 모드와 커서는 BIOS 데이터 영역에서 읽는다 (bios_data 를 주면 그 메모리에서).
     스레드 없이 메인 스레드에서 update_frame()을 호출해 렌더링/이벤트 처리.
     """
 
-    def __init__(self, memory, vga_base_addr=0xA0000, width=320, height=200):
+    def __init__(self, memory, vga_base_addr=GRAPHICS_BASE, width=320, height=200,
+                 bios_data=None, font_path=None, palette=None):
         self.memory = memory
+        self.bda = bios_data if bios_data is not None else memory
         self.vga_base_addr = vga_base_addr
         self.width = width
         self.height = height
 
         sdl2.ext.init()
-        self.window = sdl2.ext.Window("VGA Emulator", size=(self.width, self.height))
+        self.window = sdl2.ext.Window("VGA Emulator", size=(TEXT_WIDTH, TEXT_HEIGHT))
         self.window.show()
 
-        self.renderer = sdl2.ext.Renderer(self.window)
+        self.renderer = sdl2.ext.Renderer(self.window, flags=sdl2.SDL_RENDERER_TARGETTEXTURE)
         self.sdl_renderer = self.renderer.sdlrenderer
 
-        # 8비트 -> RGBA8888 텍스처
+        # 8비트 -> ARGB8888 텍스처 (팔레트 packed 표와 같은 형식)
         self.texture = sdl2.SDL_CreateTexture(
             self.sdl_renderer,
-            sdl2.SDL_PIXELFORMAT_RGBA8888,
+            sdl2.SDL_PIXELFORMAT_ARGB8888,
             sdl2.SDL_TEXTUREACCESS_STREAMING,
             self.width,
             self.height
         )
 
-        self.palette = [(i, i, i, 255) for i in range(256)]
+        self.palette = palette if palette is not None else VGADAC()
+        self.palette_version = None
+        self.colors_in_use = None   # 마지막으로 변환한 프레임에 쓰인 색 번호
+        self.quit_requested = False
+
+        # 텍스트 모드: 글리프 아틀라스 + 화면 내용을 유지하는 렌더 타깃
+        self.atlas = self._create_atlas(load_font(font_path))
+        self.text_target = sdl2.SDL_CreateTexture(
+            self.sdl_renderer,
+            sdl2.SDL_PIXELFORMAT_RGBA32,
+            sdl2.SDL_TEXTUREACCESS_TARGET,
+            TEXT_WIDTH,
+            TEXT_HEIGHT
+        )
+        self.text_shadow = None     # 마지막으로 그린 B8000h 내용
+        self.graphics_shadow = None
+        self.mode = None
+        self.cursor_state = None
+        self.cells_drawn = 0
+        self.frames_presented = 0
+
+    def _create_atlas(self, font):
+        pixels = build_atlas_pixels(font)
+        atlas = sdl2.SDL_CreateTexture(
+            self.sdl_renderer,
+            sdl2.SDL_PIXELFORMAT_RGBA32,
+            sdl2.SDL_TEXTUREACCESS_STATIC,
+            256 * GLYPH_WIDTH,
+            16 * GLYPH_HEIGHT
+        )
+        buf = (ctypes.c_uint8 * len(pixels)).from_buffer_copy(pixels)
+        sdl2.SDL_UpdateTexture(atlas, None, buf, 256 * GLYPH_WIDTH * 4)
+        sdl2.SDL_SetTextureBlendMode(atlas, sdl2.SDL_BLENDMODE_BLEND)
+        return atlas
+
+    def poll_events(self):
+        """SDL 이벤트만 처리 (화면을 다시 그리지 않아도 창이 응답하도록)."""
+        events = sdl2.ext.get_events()
+        for e in events:
+            if e.type == sdl2.SDL_QUIT:
+                # 창이 닫히면 메인 루프에 종료를 알린다
+                self.quit_requested = True
+            elif e.type == sdl2.SDL_RENDER_TARGETS_RESET:
+                # 렌더 타깃 내용을 잃었으니 다음 프레임에 전부 다시 그린다
+                self.text_shadow = None
 
-    def update_frame(self):
+    def update_frame(self, memory_changed=True):
         """
         1) SDL 이벤트 폴링
-        2) VGA 메모리 -> texture 복사
-        3) 화면 렌더링
+        2) VGA 메모리 -> texture (바뀐 부분만)
+        3) 바뀐 게 있거나 커서가 깜박일 때만 화면 렌더링
+        memory_changed=False 면 VGA 메모리는 보지 않고 커서만 갱신한다 (렌더러 프로세스에서 사용).
         메인 스레드에서 주기적으로 호출하면 macOS에서도 문제 없음.
+        memory 는 read_block 만 있으면 되므로 공유 메모리 뷰(shared_state.GuestMemoryReader)도 된다.
         """
-        # 이벤트 처리
-        events = sdl2.ext.get_events()
-        for e in events:
-            if e.type == sdl2.SDL_QUIT:
-                # 창 닫힐 때 동작을 원한다면 처리
-                pass
-
-        # Lock texture
-        pixels_ptr = ctypes.c_void_p()
-        pitch = ctypes.c_int()
-        ret = sdl2.SDL_LockTexture(self.texture, None, ctypes.byref(pixels_ptr), ctypes.byref(pitch))
-        if ret != 0:
+        self.poll_events()
+
+        mode = self.bda.read8(BDA_VIDEO_MODE)
+        if mode != self.mode:
+            self.mode = mode
+            self.text_shadow = None
+            self.graphics_shadow = None
+            memory_changed = True
+
+        changed = False
+        if memory_changed:
+            changed = self._draw_graphics() if mode == 0x13 else self._draw_text()
+
+        cursor = None if mode == 0x13 else self._cursor()
+        if not changed and cursor == self.cursor_state:
             return
+        self.cursor_state = cursor
+
+        r = self.sdl_renderer
+        if mode == 0x13:
+            sdl2.SDL_RenderCopy(r, self.texture, None, None)
+        else:
+            sdl2.SDL_RenderCopy(r, self.text_target, None, None)
+            if cursor is not None:
+                col, row, start, end, fg = cursor
+                rect = sdl2.SDL_Rect(col * GLYPH_WIDTH, row * GLYPH_HEIGHT + start,
+                                     GLYPH_WIDTH, end - start + 1)
+                cr, cg, cb = TEXT_COLORS[fg]
+                sdl2.SDL_SetRenderDrawColor(r, cr, cg, cb, 0xFF)
+                sdl2.SDL_RenderFillRect(r, ctypes.byref(rect))
+        sdl2.SDL_RenderPresent(r)
+        self.frames_presented += 1
+
+    def enable_metrics(self, convert_time):
+        """VGA 메모리 -> 텍스처 변환에 걸린 시간(초)을 convert_time 히스토그램에 기록한다."""
+        self._draw_text = convert_time.time(self._draw_text)
+        self._draw_graphics = convert_time.time(self._draw_graphics)
+
+    # ------------------------------------------------------------
+    # 텍스트 모드
+    # ------------------------------------------------------------
+    def _draw_text(self):
+        """바뀐 칸만 렌더 타깃에 다시 그린다. 하나라도 그렸으면 True."""
+        text = self.memory.read_block(TEXT_BASE, TEXT_BYTES)
+        old = self.text_shadow
+        if text == old:
+            return False
+        r = self.sdl_renderer
+        atlas = self.atlas
+        dst = sdl2.SDL_Rect(0, 0, GLYPH_WIDTH, GLYPH_HEIGHT)
+        src = sdl2.SDL_Rect(0, 0, GLYPH_WIDTH, GLYPH_HEIGHT)
+        dst_ref = ctypes.byref(dst)
+        src_ref = ctypes.byref(src)
+        line = TEXT_COLUMNS * 2
+        drawn = 0
+        sdl2.SDL_SetRenderTarget(r, self.text_target)
+        for row in range(TEXT_ROWS):
+            start = row * line
+            if old is not None and text[start:start + line] == old[start:start + line]:
+                continue
+            dst.y = row * GLYPH_HEIGHT
+            for col in range(TEXT_COLUMNS):
+                i = start + col * 2
+                ch = text[i]
+                attr = text[i + 1]
+                if old is not None and ch == old[i] and attr == old[i + 1]:
+                    continue
+                # 배경은 속성 4~6비트 (7비트 깜박임은 그리지 않는다)
+                dst.x = col * GLYPH_WIDTH
+                br, bg, bb = TEXT_COLORS[(attr >> 4) & 0x07]
+                sdl2.SDL_SetRenderDrawColor(r, br, bg, bb, 0xFF)
+                sdl2.SDL_RenderFillRect(r, dst_ref)
+                src.x = ch * GLYPH_WIDTH
+                src.y = (attr & 0x0F) * GLYPH_HEIGHT
+                sdl2.SDL_RenderCopy(r, atlas, src_ref, dst_ref)
+                drawn += 1
+        sdl2.SDL_SetRenderTarget(r, None)
+        self.text_shadow = text
+        self.cells_drawn += drawn
+        return True
+
+    def _cursor(self):
+        """(열, 행, 시작줄, 끝줄, 전경색) 또는 None(꺼짐/깜박임 꺼진 순간)."""
+        if int(time.monotonic() * CURSOR_BLINK_HZ * 2) & 1:
+            return None
+        col = self.bda.read8(BDA_CURSOR_POS)
+        row = self.bda.read8(BDA_CURSOR_POS + 1)
+        end = self.bda.read8(BDA_CURSOR_SHAPE) & 0x1F
+        start = self.bda.read8(BDA_CURSOR_SHAPE + 1)
+        if start & 0x20 or col >= TEXT_COLUMNS or row >= TEXT_ROWS:
+            return None
+        start &= 0x1F
+        if end < 8:
+            # CGA 호환(8줄 기준) 모양을 16줄 글꼴에 맞춘다
+            start, end = start * 2, end * 2 + 1
+        start = min(start, GLYPH_HEIGHT - 1)
+        end = min(max(end, start), GLYPH_HEIGHT - 1)
+        fg = 7
+        if self.text_shadow is not None:
+            fg = self.text_shadow[(row * TEXT_COLUMNS + col) * 2 + 1] & 0x0F
+        return (col, row, start, end, fg)
+
+    # ------------------------------------------------------------
+    # 모드 13h
+    # ------------------------------------------------------------
+    def _draw_graphics(self):
+        palette = self.palette
+        if palette.version != self.palette_version:
+            self.palette_version = palette.version
+            changed = palette.take_changed()
+            # 화면에 쓰인 색이 바뀐 경우에만 전체 다시 변환
+            if self.colors_in_use is None or not self.colors_in_use.isdisjoint(changed):
+                self.graphics_shadow = None
+
+        frame = self.memory.read_block(self.vga_base_addr, self.width * self.height)
+        if frame == self.graphics_shadow:
+            return False
+        self.graphics_shadow = frame
+        self.colors_in_use = set(frame)
 
-        pitch_val = pitch.value
-        buf_ptr = pixels_ptr.value
-        pix_array = (ctypes.c_uint8 * (pitch_val * self.height)).from_address(buf_ptr)
-
-        # 8bpp VGA -> RGBA
-        for y in range(self.height):
-            for x in range(self.width):
-                color_index = self.memory.read8(self.vga_base_addr + y*self.width + x)
-                r, g, b, a = self.palette[color_index & 0xFF]
-                offset = y*pitch_val + x*4
-                pix_array[offset+0] = r
-                pix_array[offset+1] = g
-                pix_array[offset+2] = b
-                pix_array[offset+3] = a
-
-        sdl2.SDL_UnlockTexture(self.texture)
-        sdl2.SDL_RenderCopy(self.sdl_renderer, self.texture, None, None)
-        sdl2.SDL_RenderPresent(self.sdl_renderer)
\ No newline at end of file
+        # 8bpp VGA -> ARGB8888: 색 번호마다 미리 만든 uint32 조회
+        pixels = array("I", map(palette.packed.__getitem__, frame))
+        sdl2.SDL_UpdateTexture(self.texture, None, ctypes.c_void_p(pixels.buffer_info()[0]),
+                               self.width * 4)
+        return True
@@ -0,0 +1,8 @@
+# conftest.py
+#
+# src 의 모듈은 평평하게 서로를 가져오므로 (from cpu import ...) src 를 경로에 넣는다.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
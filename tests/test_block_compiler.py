@@ -0,0 +1,49 @@
+# test_block_compiler.py
+#
+# 코드 무효화: 쓴 바이트 범위와 겹치는 블록/디코드 캐시 항목만 버린다.
+
+from block_compiler import BlockCompiler
+from cpu import CPU
+from interrupt_controller import InterruptController
+from memory import Memory
+
+# 0000:1000  INC WORD [1100h]   (컴파일하지 않는 명령어: 빈 블록 표시)
+# 0000:1004  ADD AX, 1
+# 0000:1007  LOOP 1000
+# 0000:1009  HLT
+# 카운터 1100h 는 코드와 같은 페이지에 있다
+CODE = bytes((0xFF, 0x06, 0x00, 0x11, 0x05, 0x01, 0x00, 0xE2, 0xF7, 0xF4))
+
+
+def run_loop(iterations=50):
+    mem = Memory(0x20000)
+    ic = InterruptController()
+    cpu = CPU(mem, ic)
+    ic.clock = lambda: cpu.instret
+    compiler = BlockCompiler(cpu, threshold=2)
+    cpu.enable_block_compiler(compiler)
+    mem.write_block(0x1000, CODE)
+    cpu.CS = 0
+    cpu.EIP = 0x1000
+    cpu.ECX = iterations
+    cpu.run(iterations * 3 + 1)
+    return cpu, compiler
+
+
+def test_data_write_on_code_page_keeps_blocks():
+    cpu, compiler = run_loop()
+    assert cpu.halted
+    assert cpu.mem.read16(0x1100) == 50
+    assert cpu.EAX == 50
+    stats = compiler.stats()
+    assert stats["invalidations"] == 0
+    assert stats["block_runs"] >= 45
+
+
+def test_code_write_drops_only_overlapping_entries():
+    cpu, compiler = run_loop()
+    cpu.mem.write8(0x1005, 2)        # ADD AX, 1 의 즉치값
+    assert 0x1004 not in compiler.blocks
+    assert 0x1000 in compiler.blocks
+    assert 0x1004 not in cpu.decoder.cache
+    assert 0x1000 in cpu.decoder.cache and 0x1007 in cpu.decoder.cache
@@ -0,0 +1,145 @@
+# test_lockstep.py
+#
+# 디코더 길이, ALU 플래그, 고정 시드 lockstep 퍼징.
+
+import pytest
+
+import lockstep
+from cpu import (CPU, ALU_FNS, INCDEC_FNS, SHIFT_OPS, W8, W16, W32,
+                 FLAG_CF, FLAG_PF, FLAG_AF, FLAG_ZF, FLAG_SF, FLAG_OF)
+from decoder import Decoder, format_instr
+from interrupt_controller import InterruptController
+from memory import Memory, PAGE_SIZE
+from reference_cpu import ReferenceInterpreter
+
+ARITH = FLAG_CF | FLAG_PF | FLAG_AF | FLAG_ZF | FLAG_SF | FLAG_OF
+
+
+def decode(code):
+    mem = Memory(PAGE_SIZE)
+    mem.write_block(0, bytes(code))
+    return Decoder(mem).decode(0, 0)
+
+
+# ------------------------------------------------------------
+# 디코더: 접두어/ModR/M/변위/즉치값을 포함한 명령어 길이
+# ------------------------------------------------------------
+@pytest.mark.parametrize("code, length", [
+    ((0x00, 0x00), 2),                                   # ADD [BX+SI], AL
+    ((0x00, 0x06, 0x34, 0x12), 4),                       # ADD [1234h], AL
+    ((0x00, 0x40, 0x05), 3),                             # ADD [BX+SI+05h], AL
+    ((0x00, 0x80, 0x34, 0x12), 4),                       # ADD [BX+SI+1234h], AL
+    ((0x05, 0x34, 0x12), 3),                             # ADD AX, 1234h
+    ((0x66, 0x05, 0x78, 0x56, 0x34, 0x12), 6),           # ADD EAX, 12345678h
+    ((0x83, 0xC0, 0xFF), 3),                             # ADD AX, -1
+    ((0x66, 0x81, 0xC0, 0x78, 0x56, 0x34, 0x12), 7),     # ADD EAX, 12345678h
+    ((0x26, 0x8B, 0x07), 3),                             # MOV AX, ES:[BX]
+    ((0xC1, 0x66, 0x02, 0x03), 4),                       # SHL [BP+02h], 3
+    ((0xEA, 0x00, 0x7C, 0x00, 0x00), 5),                 # JMP 0000:7C00
+    ((0x66, 0xE8, 0, 0, 0, 0), 6),                       # CALL rel32
+    ((0x0F, 0x01, 0x16, 0x34, 0x12), 5),                 # LGDT [1234h]
+    ((0xF3, 0xA4), 2),                                   # REP MOVSB
+    ((0x67, 0x8B, 0x04, 0x24), 4),                       # MOV AX, [ESP] (SIB)
+    ((0x67, 0x8B, 0x05, 0, 0, 0, 0), 7),                 # MOV AX, [disp32]
+])
+def test_decoder_length(code, length):
+    assert decode(code + (0x90,) * 8).length == length
+
+
+def test_decoder_mod0_has_no_displacement():
+    ins = decode((0x8B, 0x07, 0xFF, 0xFF))
+    assert ins.disp == 0
+    assert format_instr(ins, 0) == format_instr(decode((0x8B, 0x07, 0x00, 0x00)), 0)
+
+
+@pytest.mark.parametrize("code, text", [
+    ((0x83, 0xC0, 0xFF), "ADD    AX, FFFFh"),
+    ((0x66, 0x83, 0xC0, 0xFF), "ADD    EAX, FFFFFFFFh"),
+    ((0x66, 0x83, 0xC0, 0x01), "ADD    EAX, 00000001h"),
+    ((0x80, 0xC1, 0xFF), "ADD    CL, FFh"),
+    ((0x66, 0xC1, 0xE0, 0x03), "SHL    EAX, 03h"),
+])
+def test_immediate_formatting(code, text):
+    assert " ".join(format_instr(decode(code + (0x90,) * 8), 0).split()) == " ".join(text.split())
+
+
+# ------------------------------------------------------------
+# ALU 플래그
+# ------------------------------------------------------------
+def make_cpu():
+    return CPU(Memory(0x20000), InterruptController())
+
+ADD, OR, ADC, SBB, AND, SUB, XOR, CMP = range(8)
+
+@pytest.mark.parametrize("n, w, a, b, cf, result, flags", [
+    (ADD, W8, 0x7F, 0x01, 0, 0x80, FLAG_SF | FLAG_OF | FLAG_AF),
+    (ADD, W16, 0xFFFF, 0x0001, 0, 0x0000, FLAG_CF | FLAG_ZF | FLAG_PF | FLAG_AF),
+    (ADD, W32, 0x80000000, 0x80000000, 0, 0, FLAG_CF | FLAG_ZF | FLAG_PF | FLAG_OF),
+    (ADC, W8, 0xFF, 0x00, 1, 0x00, FLAG_CF | FLAG_ZF | FLAG_PF | FLAG_AF),
+    (SUB, W8, 0x00, 0x01, 0, 0xFF, FLAG_CF | FLAG_SF | FLAG_PF | FLAG_AF),
+    (SUB, W16, 0x8000, 0x0001, 0, 0x7FFF, FLAG_OF | FLAG_PF | FLAG_AF),
+    (SBB, W8, 0x10, 0x0F, 1, 0x00, FLAG_ZF | FLAG_PF | FLAG_AF),
+    (CMP, W8, 0x05, 0x05, 0, 0x00, FLAG_ZF | FLAG_PF),
+    (XOR, W16, 0x00FF, 0x00FF, 1, 0x0000, FLAG_ZF | FLAG_PF),
+    (AND, W8, 0xF0, 0x81, 1, 0x80, FLAG_SF),
+    (OR, W8, 0x01, 0x02, 1, 0x03, FLAG_PF),
+])
+def test_alu_flags(n, w, a, b, cf, result, flags):
+    cpu = make_cpu()
+    cpu.EFLAGS = 0x2 | cf
+    fn, _ = ALU_FNS[n]
+    assert fn(cpu, a, b, w) == result
+    assert cpu.EFLAGS & ARITH == flags
+
+
+def test_incdec_keeps_carry():
+    cpu = make_cpu()
+    cpu.EFLAGS = 0x2 | FLAG_CF
+    assert INCDEC_FNS[0](cpu, 0xFFFF, 1, W16) == 0
+    assert cpu.EFLAGS & ARITH == FLAG_CF | FLAG_ZF | FLAG_PF | FLAG_AF
+    assert INCDEC_FNS[1](cpu, 0x80, 1, W8) == 0x7F
+    assert cpu.EFLAGS & ARITH == FLAG_CF | FLAG_OF | FLAG_AF
+
+
+# 경계값: 같은 연산을 기준 인터프리터의 따로 쓴 구현과 맞춰 본다
+EDGES = (0, 1, 0x0F, 0x10, 0x7F, 0x80, 0x81, 0xFE, 0xFF)
+
+@pytest.mark.parametrize("w", [W8, W16, W32], ids=["8", "16", "32"])
+def test_alu_matches_reference(w):
+    values = sorted({(v << (w.bits - 8)) | low for v in EDGES for low in (0, 0xFF) if w.bits > 8}
+                    | set(EDGES))
+    fast, ref = make_cpu(), make_cpu()
+    interp = ReferenceInterpreter(ref)
+    for n in range(8):
+        fn, _ = ALU_FNS[n]
+        for a in values:
+            for b in values:
+                for cf in (0, 1):
+                    fast.EFLAGS = ref.EFLAGS = 0x2 | cf
+                    res = fn(fast, a & w.mask, b & w.mask, w)
+                    assert res == interp._alu(n, a & w.mask, b & w.mask, w.bits), (n, a, b, cf)
+                    assert fast.EFLAGS == ref.EFLAGS, (n, a, b, cf)
+
+
+@pytest.mark.parametrize("w", [W8, W16], ids=["8", "16"])
+def test_shift_matches_reference(w):
+    fast, ref = make_cpu(), make_cpu()
+    interp = ReferenceInterpreter(ref)
+    for n in range(8):
+        for a in (0, 1, w.sign, w.sign | 1, w.mask, 0x55 & w.mask):
+            for count in (1, 2, w.bits - 1, w.bits, w.bits + 1, 31):
+                for cf in (0, 1):
+                    fast.EFLAGS = ref.EFLAGS = 0x2 | cf
+                    res = SHIFT_OPS[n](fast, a, count, w)
+                    assert res == interp._shift(n, a, count, w.bits), (n, a, count, cf)
+                    assert fast.EFLAGS == ref.EFLAGS, (n, a, count, cf)
+
+
+# ------------------------------------------------------------
+# lockstep 퍼징 (고정 시드)
+# ------------------------------------------------------------
+def test_lockstep_fuzz(capsys):
+    argv = ["--fuzz", "6", "--seed", "1", "--length", "24", "--max-instructions", "4000",
+            "--memory", "0x100000", "--cylinders", "1", "--heads", "1", "--sectors", "8"]
+    assert lockstep.main(argv) == lockstep.EXIT_MATCH
+    assert "6 programs matched" in capsys.readouterr().out